@@ -29,6 +29,7 @@ LOW_BATTERY_THRESHOLD_PERCENT=${LOW_BATTERY_THRESHOLD_PERCENT:-10}
 
 DEVICE_TYPE=PW3
 num_refresh=0
+screen_dirty=true # whether the screen shows something other than the last dashboard
 
 #===================== End of configuration =====================#
 
@@ -136,6 +137,7 @@ display_sleep_screen() {
 
   # Ensure a full screen refresh is triggered after wake from sleep
   num_refresh=$FULL_DISPLAY_REFRESH_RATE
+  screen_dirty=true
 }
 
 refresh_dashboard() {
@@ -145,9 +147,15 @@ refresh_dashboard() {
   "$FETCH_DASHBOARD_CMD" "$DASH_PNG"
   fetch_status=$?
 
-  if [ "$fetch_status" -ne 0 ]; then
+  if [ "$fetch_status" -eq 3 ] && [ "$screen_dirty" = false ]; then
+    log_info "Dashboard unchanged, not refreshing screen"
+    return 0
+  fi
+
+  if [ "$fetch_status" -ne 0 ] && [ "$fetch_status" -ne 3 ]; then
     log_error "Not updating screen, fetch-dashboard returned $fetch_status"
     /usr/sbin/eips "Error retrieving dashboard!"
+    screen_dirty=true
     return 1
   fi
 
@@ -162,6 +170,7 @@ refresh_dashboard() {
   fi
 
   num_refresh=$((num_refresh + 1))
+  screen_dirty=false
 }
 
 log_battery_stats() {
@@ -1,6 +1,29 @@
 #!/usr/bin/env sh
 # Fetch a new dashboard image, make sure to output it to "$1".
+# Exit with 3 if the server says the image hasn't changed since the last fetch (HTTP 304).
 # For example:
 # "$(dirname "$0")/../xh" -d -q -o "$1" get https://raw.githubusercontent.com/pascalw/kindle-dash/master/example/example.png
 # cat /mnt/us/documents/dashboard.png >"$1"
-curl http://192.168.3.137:8000/dashboard > "$1"
\ No newline at end of file
+DASHBOARD_URL=http://192.168.3.137:8000/dashboard
+ETAG_FILE="$1.etag"
+HEADERS_FILE="$1.headers"
+
+etag=""
+[ -f "$1" ] && [ -f "$ETAG_FILE" ] && etag=$(cat "$ETAG_FILE")
+
+status=$(curl -s -o "$1.tmp" -D "$HEADERS_FILE" -w "%{http_code}" ${etag:+-H "If-None-Match: $etag"} "$DASHBOARD_URL") || exit 1
+
+case "$status" in
+  200)
+    mv "$1.tmp" "$1"
+    grep -i '^etag:' "$HEADERS_FILE" | cut -d' ' -f2 | tr -d '\r' >"$ETAG_FILE"
+    ;;
+  304)
+    rm -f "$1.tmp"
+    exit 3
+    ;;
+  *)
+    rm -f "$1.tmp"
+    exit 1
+    ;;
+esac
@@ -0,0 +1,3 @@
+# SPDX-FileCopyrightText: 2024-present Mike Holmes <michael@mcholmes.com>
+#
+# SPDX-License-Identifier: MIT
@@ -0,0 +1,11 @@
+import pytest
+
+from benchmarks.synthetic import synthetic_activities
+
+# From a quiet day to a very busy shared calendar
+SIZES = [5, 100, 1_000, 10_000]
+
+
+@pytest.fixture(params=SIZES, ids=lambda n: f"{n}-activities")
+def activities(request):
+    return synthetic_activities(request.param)
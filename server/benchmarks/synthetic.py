@@ -0,0 +1,55 @@
+"""
+Seeded synthetic dashboards, so benchmarks measure the same work on every run & every machine.
+"""
+
+import random
+from datetime import date, datetime, time, timedelta, timezone
+
+from server.activity import Activity
+
+START = date(2024, 3, 5)
+NOW = datetime(2024, 3, 5, 10, 42, tzinfo=timezone.utc)
+
+WORDS = [
+    "dentist", "bins", "school", "run", "pickup", "meeting", "birthday", "party", "football", "swimming",
+    "groceries", "plumber", "call", "Grandma", "review", "quarterly", "planning", "offsite", "dinner", "flight",
+]
+UNICODE_WORDS = ["Wäschè", "ünïcödé", "café", "naïve", "façade", "日本語", "Zürich", "São Paulo", "\u2013", "ß"]
+
+
+def seeded_rng(seed: int = 0) -> random.Random:
+    """A generator of its own, so the data only depends on `seed`. Nothing here needs to be unpredictable."""
+    return random.Random(seed)  # noqa: S311
+
+
+def summary(rng: random.Random) -> str:
+    """A mix of short, long (past any column's width) and non-ASCII summaries"""
+    kind = rng.random()
+    if kind < 0.5:  # noqa: PLR2004
+        return " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).capitalize()
+    if kind < 0.8:  # noqa: PLR2004
+        return " ".join(rng.choices(WORDS, k=rng.randint(15, 40))).capitalize()
+    return " ".join(rng.choices(WORDS + UNICODE_WORDS, k=rng.randint(3, 25)))
+
+
+def activity_kwargs(rng: random.Random, start: date = START, days: int = 2) -> dict:
+    day = start + timedelta(days=rng.randrange(-1, days))
+    kwargs = {"activity_type": rng.choice(["event", "task"]), "summary": summary(rng), "date_start": day}
+
+    kind = rng.random()
+    if kind < 0.2:  # all-day  # noqa: PLR2004
+        return kwargs
+    if kind < 0.25:  # multi-day  # noqa: PLR2004
+        return {**kwargs, "date_end": day + timedelta(days=rng.randint(1, 3))}
+
+    hour, minute = rng.randrange(0, 23), rng.choice([0, 15, 30, 45])
+    kwargs["time_start"] = time(hour, minute)
+    if rng.random() < 0.7:  # noqa: PLR2004
+        kwargs["time_end"] = time(hour + 1, minute)
+    return kwargs
+
+
+def synthetic_activities(n: int, seed: int = 0, start: date = START, days: int = 2) -> list[Activity]:
+    """`n` activities around `start`, the same for the same `seed`"""
+    rng = seeded_rng(seed)
+    return [Activity(**activity_kwargs(rng, start, days)) for _ in range(n)]
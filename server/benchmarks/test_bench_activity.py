@@ -0,0 +1,48 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from benchmarks.synthetic import NOW, START, activity_kwargs, seeded_rng
+from server.activity import (
+    Activity,
+    activity_sort_key,
+    group_events_by_relative_day,
+    merge_sorted,
+    select_visible,
+    sort_by_time,
+)
+
+TZ = ZoneInfo("Europe/London")
+
+
+def many_kwargs(n: int) -> list[dict]:
+    rng = seeded_rng()
+    return [activity_kwargs(rng) for _ in range(n)]
+
+
+@pytest.mark.parametrize("n", [100, 10_000])
+def test_construct_validated(benchmark, n):
+    kwargs = many_kwargs(n)
+
+    benchmark(lambda: [Activity(**k) for k in kwargs])
+
+@pytest.mark.parametrize("n", [100, 10_000])
+def test_construct_trusted(benchmark, n):
+    kwargs = many_kwargs(n)
+
+    benchmark(lambda: [Activity.trusted(**k) for k in kwargs])
+
+def test_group_events_by_relative_day(benchmark, activities):
+    benchmark(group_events_by_relative_day, activities, START)
+
+def test_sort_by_time(benchmark, activities):
+    benchmark(sort_by_time, activities)
+
+def test_merge_and_select(benchmark, activities):
+    # As the App does it: two providers' time-ordered activities, merged then filtered & bucketed
+    calendar = sorted(activities[::2], key=activity_sort_key)
+    tasks = sorted(activities[1::2], key=activity_sort_key)
+    now = datetime.combine(NOW.date(), NOW.time(), tzinfo=TZ)
+
+    benchmark(lambda: select_visible(merge_sorted(calendar, tasks), now=now, display_timezone=TZ))
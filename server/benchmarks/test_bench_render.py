@@ -0,0 +1,57 @@
+import pytest
+
+from benchmarks.synthetic import NOW, START, seeded_rng, summary, synthetic_activities
+from server.activity import activity_sort_key
+from server.config import EncodingConfig
+from server.encode import encode_png
+from server.render import FontFactory, Renderer
+
+# As rendered for a Kindle Paperwhite 3, in landscape
+RENDERER = {
+    "image_width": 1072,
+    "image_height": 1448,
+    "rotate_angle": 90,
+    "margin_x": 100,
+    "margin_y": 100,
+    "top_row_y": 250,
+    "space_between_sections": 100,
+}
+
+
+def today_and_tomorrow(activities):
+    ordered = sorted(activities, key=activity_sort_key)
+    return [a for a in ordered if a.date_start <= START], [a for a in ordered if a.date_start > START]
+
+def test_render_all(benchmark, activities):
+    today, tomorrow = today_and_tomorrow(activities)
+
+    def render():
+        Renderer(**RENDERER).render_all(todays_date=NOW, events_today=today, events_tomorrow=tomorrow)
+
+    benchmark(render)
+
+def test_layout(benchmark, activities):
+    today, tomorrow = today_and_tomorrow(activities)
+    r = Renderer(**RENDERER)
+
+    benchmark(r.layout, todays_date=NOW, events_today=today, events_tomorrow=tomorrow)
+
+@pytest.mark.parametrize("max_width", [200, 800])
+def test_truncate_with_ellipsis(benchmark, max_width):
+    rng = seeded_rng()
+    summaries = [summary(rng) for _ in range(200)]
+    font = FontFactory().get("Lexend-Regular.ttf")
+
+    benchmark(lambda: [Renderer.truncate_with_ellipsis(s, max_width, font) for s in summaries])
+
+@pytest.mark.parametrize("encoding", [
+    EncodingConfig(),
+    EncodingConfig(levels=16, bits=4),
+    EncodingConfig(levels=16, bits=4, dither="floyd-steinberg"),
+], ids=lambda e: e.tag)
+def test_encode_png(benchmark, encoding):
+    today, tomorrow = today_and_tomorrow(synthetic_activities(100))
+    r = Renderer(**RENDERER)
+    r.render_all(todays_date=NOW, events_today=today, events_tomorrow=tomorrow)
+
+    benchmark(encode_png, r.image, encoding)
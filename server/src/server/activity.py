@@ -1,5 +1,8 @@
+import heapq
 from collections import defaultdict
-from datetime import date, datetime, time, timezone, timedelta
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from itertools import groupby
 from typing import Literal, Optional, Union
 
 from pydantic import BaseModel, ValidationError, ValidationInfo, field_validator
@@ -44,8 +47,11 @@ class Activity(BaseModel):
         datetime_end: Optional[datetime] = None,
         description: Optional[str] = None,
         location: Optional[str] = None,
+        trusted: bool = False,  # noqa: FBT001, FBT002
     ):
-        return cls(
+        """Pass `trusted` to skip validation: see `Activity.trusted`."""
+        constructor = cls.trusted if trusted else cls
+        return constructor(
             activity_type=activity_type,
             date_start=datetime_to_date(datetime_start),
             date_end=datetime_to_date(datetime_end),
@@ -56,19 +62,66 @@ class Activity(BaseModel):
             location=location,
         )
 
+    @classmethod
+    def trusted(
+        cls,
+        activity_type: str,
+        summary: str,
+        date_start: date,
+        date_end: Optional[date] = None,
+        time_start: Optional[time] = None,
+        time_end: Optional[time] = None,
+        description: Optional[str] = None,
+        location: Optional[str] = None,
+    ) -> "Activity":
+        """
+        Create an Activity without validating it, for adapters whose data is already normalised (e.g. gcal, todoist).
+        Saves a third or more of the cost of each activity, which adds up for large calendars.
+
+        The caller must guarantee what validation would: every value has exactly its field's type
+        (a `date`, not a `datetime`), time_end is only given with time_start, and date_end isn't before date_start.
+        Anything less certain (e.g. user input) should use the normal constructor.
+
+        `model_construct` would also skip validation, but costs more than validating.
+        This relies on pydantic v2's internals, hence the version pin; tests check the result matches a validated one.
+        """
+        activity = object.__new__(cls)
+        # What pydantic's own __init__ ends up with, set directly: fields live in __dict__, the rest in slots
+        fields = activity.__dict__
+        fields["activity_type"] = activity_type
+        fields["summary"] = summary
+        fields["date_start"] = date_start
+        fields["date_end"] = date_end
+        fields["time_start"] = time_start
+        fields["time_end"] = time_end
+        fields["description"] = description
+        fields["location"] = location
+        _set_fields_set(activity, set(ACTIVITY_FIELDS))
+        _set_extra(activity, None)
+        _set_private(activity, None)
+        return activity
+
     @property
     def ends_today(self) -> bool:
-        today = datetime.now(tz=timezone.utc).date()
-        return (self.date_end is None and self.date_start == today) or self.date_end == today
+        return self.ends_on(datetime.now(tz=timezone.utc).date())
 
     @property
     def ended_over_an_hour_ago(self) -> bool:
-        hour_ago = (datetime.now(tz=timezone.utc) - timedelta(hours=1)).time()
+        now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+        return self.ends_today and self.ended_by(now - HIDE_ENDED_AFTER)
 
-        return self.ends_today and not self.is_all_day and (
-            (self.time_end is not None and self.time_end <= hour_ago) or
-            (self.time_end is None and self.time_start <= hour_ago)
-        )
+    def ends_on(self, day: date) -> bool:
+        return (self.date_end or self.date_start) == day
+
+    def ended_by(self, cutoff: datetime) -> bool:
+        """
+        Whether this timed activity was over by `cutoff`, a naive datetime in the same timezone as its times.
+        All-day activities never count as ended, so they stay visible for the whole day.
+        """
+        if self.is_all_day:
+            return False
+        end = datetime.combine(self.date_end or self.date_start, self.time_end or self.time_start)
+        return end <= cutoff
 
     @property
     def is_multi_day(self) -> bool:
@@ -98,6 +151,17 @@ class Activity(BaseModel):
         return delta.days
 
 
+ACTIVITY_FIELDS = frozenset(Activity.model_fields)
+
+# BaseModel's slots, for Activity.trusted: calling their setters directly skips pydantic's __setattr__
+_set_fields_set = BaseModel.__dict__["__pydantic_fields_set__"].__set__
+_set_extra = BaseModel.__dict__["__pydantic_extra__"].__set__
+_set_private = BaseModel.__dict__["__pydantic_private__"].__set__
+
+# Timed activities drop off the dashboard this long after they end
+HIDE_ENDED_AFTER = timedelta(hours=1)
+
+
 def datetime_to_time(dt: Union[datetime, date]) -> time:
 
     if dt is None:
@@ -176,3 +240,61 @@ def group_events_by_relative_day(events: list[Activity], current_date: datetime)
 
         # Now we have all keys, so convert defaultdict to regular dictionary
         return dict(grouped_events)
+
+def activity_sort_key(activity: Activity) -> tuple[date, time]:
+    """Start date then start time, all-day activities first. The order that providers return activities in."""
+    return activity.date_start, activity.time_start or time.min
+
+def merge_sorted(*streams: Iterable[Activity]) -> Iterator[Activity]:
+    """
+    Lazily merge streams which are each in `activity_sort_key` order into one stream in that order.
+    Activities which sort equally keep the order of their streams.
+    """
+    return heapq.merge(*streams, key=activity_sort_key)
+
+def bucket_by_day(activities: Iterable[Activity], today: date, days: int) -> Iterator[list[Activity]]:
+    """
+    Lazily split activities in `activity_sort_key` order into a list for each of `days` days from `today`,
+    including empty days. Multi-day activities which started before today go in today's list.
+    Stops reading `activities` at the first which starts after the last day.
+    """
+    buckets = groupby(activities, key=lambda a: max((a.date_start - today).days, 0))
+    day = 0
+    for relative_day, bucket in buckets:
+        if relative_day >= days:
+            break
+        for _ in range(day, relative_day):
+            yield []
+        yield list(bucket)
+        day = relative_day + 1
+
+    for _ in range(day, days):
+        yield []
+
+def select_visible(
+    activities: Iterable[Activity],
+    now: datetime,
+    display_timezone: tzinfo,
+    hide_ended_after: timedelta = HIDE_ENDED_AFTER,
+) -> tuple[list[Activity], list[Activity]]:
+    """
+    Today's and tomorrow's activities, leaving out those which ended over `hide_ended_after` ago.
+    Tasks due on an earlier day are overdue rather than over, so they stay whatever their time.
+
+    Everything is judged against the single instant `now`, seen in `display_timezone` (the timezone that
+    activities' dates & times are in), so the result only depends on the arguments.
+    `activities` must be in `activity_sort_key` order, e.g. from `merge_sorted`; so are both lists.
+    Only as many activities are read as are needed to fill tomorrow.
+    """
+    local_now = now.astimezone(display_timezone).replace(tzinfo=None)
+    cutoff = local_now - hide_ended_after
+
+    today = local_now.date()
+
+    def hidden(a: Activity) -> bool:
+        return a.ended_by(cutoff) and (a.activity_type == "event" or a.ends_on(today))
+
+    visible = (a for a in activities if not hidden(a))
+    activities_today, activities_tomorrow = bucket_by_day(visible, today=today, days=2)
+
+    return activities_today, activities_tomorrow
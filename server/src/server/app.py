@@ -1,26 +1,119 @@
+import asyncio
+import hashlib
 import logging
-from concurrent.futures import ThreadPoolExecutor, wait
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import partial
 from pathlib import Path
+from typing import Annotated, Optional
 from zoneinfo import ZoneInfo
 
-from fastapi import APIRouter, Response
+import httpx
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import HTMLResponse, PlainTextResponse
-
-from server.activity import Activity, group_events_by_relative_day, sort_by_time
-from server.cal import Calendar
-from server.config import AppConfig
-from server.render import Renderer
-from server.todoist import get_tasks_todoist
+from pydantic import BaseModel, Field, ValidationError
+
+from server.activity import Activity, merge_sorted, select_visible
+from server.config import AppConfig, EncodingConfig, ImageConfig
+from server.encode import decode_image, encode_rendered
+from server.framebuffer import FRAMEBUFFERS
+from server.metrics import CONTENT_TYPE, REGISTRY, STAGE_SECONDS
+from server.owm import Weather
+from server.providers import Provider, build_providers, fetch_all
+from server.refresher import DashboardRefresher
+from server.regions import RegionTracker, format_regions
+from server.render import RenderedImage, Renderer
+from server.render_cache import RenderCache, render_key
+from server.snapshot import SnapshotStore, SourceSnapshot
 
 logger = logging.getLogger(__name__)
 
+HTTP_TIMEOUT = httpx.Timeout(30)
+HTTP_LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=120)
+
+class DashboardData(BaseModel):
+    """Everything fetched for one render of the dashboard"""
+
+    events: dict[int, list[Activity]] = Field(description="Each day's activities in time order. 0 is today")
+    current_date: datetime
+    weather: Optional[Weather] = None
+    stale_sources: dict[str, datetime] = Field(
+        default_factory=dict, description="Sources which couldn't be updated, and when their data is from"
+    )
+
+
+def encoding_overrides(
+    levels: Optional[int] = None,
+    dither: Optional[str] = None,
+    bits: Optional[int] = None,
+    compress_level: Optional[int] = None,
+    framebuffer: Optional[str] = None,
+    framebuffer_compression: Optional[str] = None,
+) -> dict:
+    """Query parameters which override the configured image encoding for a single request"""
+    overrides = {
+        "levels": levels,
+        "dither": dither,
+        "bits": bits,
+        "compress_level": compress_level,
+        "framebuffer": framebuffer,
+        "framebuffer_compression": framebuffer_compression,
+    }
+    return {k: v for k, v in overrides.items() if v is not None}
+
+
+def device_id(request: Request, device: Optional[str] = None) -> str:
+    """Identifies the device making a request: the `device` query parameter if given, else its IP address"""
+    if device is not None:
+        return device
+    return request.client.host if request.client is not None else "unknown"
+
+
 class App:
     config: AppConfig
 
     def __init__(self, config: AppConfig):
         self.config = config
 
+        server = self.config.server
+        self.render_cache = RenderCache(max_entries=server.render_cache_size)
+        # The latest content (everything but the "Refreshed" footer) drawn for each profile
+        self.content_cache = RenderCache(max_entries=1 + len(config.profiles), name="content")
+        self.regions = RegionTracker() if server.changed_regions else None
+
+        self.check_fits(config.image.encoding, config.image)
+        for profile in config.profiles.values():
+            self.check_fits(profile.encoding, profile)
+
+        self.providers: list[Provider] = build_providers(config)
+        self._http: Optional[httpx.AsyncClient] = None
+
+        self.snapshots = SnapshotStore(Path(server.server_dir) / "snapshot") if server.snapshot else None
+        if self.snapshots is not None:
+            self.restore_sources()
+
+    async def __aenter__(self) -> "App":
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.aclose()
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """One connection-pooled HTTP client, shared by every provider. Created on first use."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        return self._http
+
+    async def aclose(self) -> None:
+        for provider in self.providers:
+            await provider.aclose()
+
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
     def get_logs(self, file_name) -> str:
         logs = Path(self.config.server.server_dir) / file_name
         try:
@@ -38,42 +131,109 @@ class App:
         # TODO: this is unused for now. Implement a way for the device to send logs back to the server
         return self.get_logs(self.config.server.device_log_file_name)
 
-    def generate_image_and_save(self) -> None:
-        events, current_date = self.get_dashboard_data()
-        image = self.generate_image(events, current_date)
+    async def generate_image_and_save(self) -> None:
+        rendered = await self.render_dashboard()
         output_filepath = Path(self.config.server.server_dir) / self.config.server.image_name
 
         with Path.open(output_filepath, "wb") as f:
-            f.write(image)
+            f.write(rendered.image)
+
+    async def get_dashboard_response(
+        self,
+        if_none_match: Annotated[Optional[str], Header()] = None,
+        encoding: Annotated[Optional[dict], Depends(encoding_overrides)] = None,
+        device: Annotated[Optional[str], Depends(device_id)] = None,
+    ) -> Response:
+        rendered = await self.render_dashboard(self.resolve_encoding(encoding))
+
+        return await asyncio.to_thread(self.serve_image, rendered, if_none_match, device)
+
+    async def get_profile_dashboard_response(
+        self,
+        profile: str,
+        if_none_match: Annotated[Optional[str], Header()] = None,
+        encoding: Annotated[Optional[dict], Depends(encoding_overrides)] = None,
+        device: Annotated[Optional[str], Depends(device_id)] = None,
+    ) -> Response:
+        """The dashboard as rendered for one of the configured device profiles"""
+        resolved = self.resolve_encoding(encoding, profile)  # 404 for unknown profiles, before any fetching
+        rendered = await self.render_dashboard(resolved, profile)
+
+        return await asyncio.to_thread(self.serve_image, rendered, if_none_match, device)
+
+    def serve_image(
+        self,
+        rendered: RenderedImage,
+        if_none_match: Optional[str] = None,
+        device: Optional[str] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> Response:
+        """Like `image_response`, but also reports which regions changed since `device` last downloaded an image."""
+        headers = dict(headers or {})
+        if self.regions is not None and device is not None and not etag_matches(if_none_match, rendered.etag):
+            headers["X-Changed-Regions"] = format_regions(self.regions.update(device, rendered))
+
+        return image_response(rendered, if_none_match, headers)
+
+    def get_metrics(self) -> Response:
+        """Stage timings & cache hit rates, for Prometheus to scrape"""
+        return Response(content=REGISTRY.expose(), media_type=CONTENT_TYPE)
+
+    def get_changed_regions(self, device: Annotated[Optional[str], Depends(device_id)] = None) -> dict:
+        """What changed in the last image sent to `device`. If `full_refresh`, redraw the whole screen."""
+        boxes = None if self.regions is None else self.regions.last_changes(device)
+        return {"device": device, "full_refresh": boxes is None, "regions": boxes or []}
+
+    def image_config(self, profile: Optional[str] = None) -> ImageConfig:
+        """The image settings for a device profile, or the main image if `profile` is None"""
+        if profile is None:
+            return self.config.image
 
-    def get_dashboard_response(self) -> Response:
-        events, current_date = self.get_dashboard_data()
-        image = self.generate_image(events, current_date)
-
-        return Response(content=image, media_type="image/png")
-
-    def get_dashboard_data(self) -> tuple[dict[list[Activity]], datetime]:
+        try:
+            return self.config.profiles[profile]
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"No profile named '{profile}'") from None
+
+    async def render_dashboard(
+        self, encoding: Optional[EncodingConfig] = None, profile: Optional[str] = None
+    ) -> RenderedImage:
+        """Fetch fresh data and render it. This is the slow path: it waits on every upstream API."""
+        data = await self.get_dashboard_data()
+        return await asyncio.to_thread(self.generate_image, data, encoding, profile)
+
+    async def render_profiles(self) -> dict[Optional[str], RenderedImage]:
+        """
+        Fetch fresh data once, and render it for the main image and every profile.
+        Keyed by profile name, with the main image under None.
+        """
+        data = await self.get_dashboard_data()
+
+        rendered = {}
+        for profile in [None, *self.config.profiles]:
+            rendered[profile] = await asyncio.to_thread(self.generate_image, data, None, profile)
+
+        return rendered
+
+    async def get_dashboard_data(self) -> DashboardData:
         # list timezones: print(zoneinfo.available_timezones())
         display_timezone = ZoneInfo(self.config.calendar.display_timezone)
         current_date = datetime.now(display_timezone)
 
         logger.debug("Getting data in parallel...")
-
-        with ThreadPoolExecutor() as executor:
-            future_tasks = executor.submit(
-                self.get_tasks, current_date
-            )  # TODO: make this optional depending on config.toml
-            future_appointments = executor.submit(self.get_appointments, current_date)
-
-            # Wait for both API calls to complete
-            wait([future_tasks, future_appointments])
-
-            tasks = future_tasks.result()
-            appointments = future_appointments.result()
-
-        events_unsorted = tasks + appointments
-        events_filtered = [event for event in events_unsorted if not event.ended_over_an_hour_ago]
-        events = group_events_by_relative_day(events=events_filtered, current_date=current_date)
+        results = await fetch_all(self.providers, self.http, current_date)
+        if self.snapshots is not None:
+            await asyncio.to_thread(self.save_sources)
+
+        weather = next((results[p.name] for p in self.providers if p.kind == "weather"), None)
+        stale_sources = {p.name: p.stale_since() for p in self.providers if p.stale_since() is not None}
+
+        with STAGE_SECONDS.labels(stage="select").time():
+            # Each provider's activities are already in order, so merging them is enough
+            activities = merge_sorted(*(results[p.name] for p in self.providers if p.kind == "activities"))
+            events_today, events_tomorrow = select_visible(
+                activities, now=current_date, display_timezone=display_timezone
+            )
+            events = {0: events_today, 1: events_tomorrow}
 
         count_events = 0
         for day in events:
@@ -82,74 +242,259 @@ class App:
         log_msg = f"Retrieved {count_events} events across {len(events)} days"
         logger.debug(log_msg)
 
-        return events, current_date
+        return DashboardData(events=events, current_date=current_date, weather=weather, stale_sources=stale_sources)
+
+    def restore_sources(self) -> None:
+        """Seed each provider's cache with the data saved before the last restart"""
+        saved = self.snapshots.load_sources()
+        for provider in self.providers:
+            if provider.name in saved and hasattr(provider, "restore"):
+                try:
+                    provider.restore(saved[provider.name].fetched_at, saved[provider.name].value)
+                except (TypeError, ValueError):
+                    msg = f"Ignoring saved {provider.name} data which no longer fits"
+                    logger.warning(msg)
+                    continue
+
+                msg = f"Restored {provider.name} data from {saved[provider.name].fetched_at.isoformat()}"
+                logger.info(msg)
+
+    def save_sources(self) -> None:
+        sources = {}
+        for provider in self.providers:
+            exported = provider.export() if hasattr(provider, "export") else None
+            if exported is not None:
+                sources[provider.name] = SourceSnapshot(fetched_at=exported[0], value=exported[1])
+
+        try:
+            self.snapshots.save_sources(sources)
+        except OSError:
+            logger.exception("Failed to save snapshot of source data")
+
+    def generate_image(
+        self, data: DashboardData, encoding: Optional[EncodingConfig] = None, profile: Optional[str] = None
+    ) -> RenderedImage:
+        image = self.image_config(profile)
+        encoding = encoding or image.encoding
+        events, current_date = data.events, data.current_date
 
-    def generate_image(self, events: dict[list[Activity]], current_date: datetime) -> bytes:
-        events_today = sort_by_time(events.get(0, []))
-        events_tomorrow = sort_by_time(events.get(1, []))
+        events_today = events.get(0, [])
+        events_tomorrow = events.get(1, [])
 
+        fonts = {} if image.font_style_map is None else {"font_style_map": image.font_style_map}
         r = Renderer(
-            image_width=self.config.image.width,
-            image_height=self.config.image.height,
-            rotate_angle=self.config.image.rotate_angle,
-            margin_x=self.config.image.margin_x,
-            margin_y=self.config.image.margin_x,
-            top_row_y=250,
-            space_between_sections=100,
+            image_width=image.width,
+            image_height=image.height,
+            rotate_angle=image.rotate_angle,
+            margin_x=image.margin_x,
+            margin_y=image.margin_y,
+            top_row_y=image.top_row_y,
+            space_between_sections=image.space_between_sections,
+            columns=image.columns,
+            **fonts,
         )
 
-        r.render_all(
+        # Planning the layout is cheap; drawing & encoding it are what the cache saves
+        plan = r.layout(
             todays_date=current_date,
             events_today=events_today,
             events_tomorrow=events_tomorrow,
+            weather=data.weather,
+            stale_sources=data.stale_sources,
         )
 
+        # The renderer's settings distinguish each profile's images in the caches
+        renderer = r.model_dump(mode="json")
+        key = render_key({
+            "renderer": renderer,
+            "etag_includes_last_updated": image.etag_includes_last_updated,
+            "encoding": encoding.model_dump(),
+            "plan": plan.digest,
+        })
+
+        cached = self.render_cache.get(key)
+        if cached is not None:
+            logger.info("Layout unchanged; using cached image")
+            return cached
+
+        # The footer's time changes every minute, so usually only it needs drawing
+        content_key = render_key({"renderer": renderer, "content": plan.content_digest})
+        content = self.content_cache.get(content_key)
+        r.draw(plan, content)
+        if content is None:
+            self.content_cache.put(content_key, r.drawn_content)
+
         logger.info("Rendered successfully")
 
-        return r.get_png()
+        if image.etag_includes_last_updated:
+            digest = hashlib.blake2b(r.image.tobytes(), digest_size=16).hexdigest()
+        else:
+            digest = r.content_digest
 
-    def get_tasks(self, current_date: datetime) -> list[Activity]:
-        config = self.config.tasks
+        rendered = encode_rendered(r.image, digest, encoding)
+        self.render_cache.put(key, rendered)
 
-        project_id = config.project_id
-        date_end = current_date + timedelta(days=self.config.calendar.days_to_show)
-        return get_tasks_todoist(api_key=self.config.api_keys["todoist"], project_id=project_id, date_end=date_end)
+        return rendered
 
-    def get_appointments(self, current_date: datetime) -> list[Activity]:
-        config = self.config.calendar
+    def reencode(self, rendered: RenderedImage, encoding: EncodingConfig) -> RenderedImage:
+        """Encode an already-rendered image differently, e.g. when a request overrides the configured encoding."""
+        if rendered.encoding == encoding.tag:
+            return rendered
 
-        calendar_ids = config.ids.values()
-        credentials = config.creds
+        key = render_key({"digest": rendered.digest, "source": rendered.encoding, "encoding": encoding.model_dump()})
+        cached = self.render_cache.get(key)
+        if cached is not None:
+            return cached
 
-        # TODO: do I really need a Calendar object? It doesn't do much any more
-        cal = Calendar(
-            credentials=credentials,
-            calendar_ids=calendar_ids,
-            current_date=current_date,
-            days_to_show=config.days_to_show,
-        )
+        reencoded = encode_rendered(decode_image(rendered), rendered.digest, encoding)
+        self.render_cache.put(key, reencoded)
+
+        return reencoded
+
+    def resolve_encoding(self, overrides: Optional[dict], profile: Optional[str] = None) -> EncodingConfig:
+        """The profile's configured encoding, with any per-request overrides applied"""
+        image = self.image_config(profile)
+        if not overrides:
+            return image.encoding
+
+        try:
+            encoding = EncodingConfig(**{**image.encoding.model_dump(), **overrides})
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False)) from e
+
+        try:
+            self.check_fits(encoding, image)
+        except ValueError as e:
+            loc = ("query", "framebuffer")
+            raise RequestValidationError([{"type": "value_error", "loc": loc, "msg": str(e)}]) from e
+
+        return encoding
+
+    @staticmethod
+    def check_fits(encoding: EncodingConfig, image: ImageConfig) -> None:
+        """Raises ValueError if `encoding` is for a framebuffer that `image` isn't the size of, once rotated"""
+        if encoding.framebuffer is None:
+            return
+
+        width, height = image.width, image.height
+        if image.rotate_angle % 180 == 90:  # noqa: PLR2004
+            width, height = height, width
+        fb = FRAMEBUFFERS[encoding.framebuffer]
+        if (width, height) != (fb.width, fb.height):
+            err = f"The {width}x{height} image doesn't fit the {fb.name}'s {fb.width}x{fb.height} framebuffer"
+            raise ValueError(err)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches our (strong) ETag.
+    The header can be "*" or a comma-separated list of tags, possibly marked weak (W/).
+    """
+    if if_none_match is None:
+        return False
+
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def image_response(
+    rendered: RenderedImage, if_none_match: Optional[str] = None, headers: Optional[dict[str, str]] = None
+) -> Response:
+    """Serve an image, or 304 Not Modified if the device already has it."""
+    headers = {"ETag": rendered.etag, "Cache-Control": "no-cache", **(headers or {})}
 
-        return cal.get_events_cal()
+    if etag_matches(if_none_match, rendered.etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=rendered.image, media_type=rendered.media_type, headers=headers)
 
-    def get_weather():
-        ...
-        # owm_api_key = api["owm_api_key"]  # OpenWeatherMap API key. Required to retrieve weather forecast.
-        # lat = config["lat"] # Latitude in decimal of the location to retrieve weather forecast for
-        # lon = config["lon"] # Longitude in decimal of the location to retrieve weather forecast for
-        # owmModule = OWMModule(owm_api_key)
-        # current_weather, hourly_forecast, daily_forecast = owmModule.get_weather(lat, lon, from_cache=True)
-        # # current_weather_text=string.capwords(hourly_forecast[1]["weather"][0]["description"]),
-        # # current_weather_id=hourly_forecast[1]["weather"][0]["id"],
-        # # current_weather_temp=round(hourly_forecast[1]["temp"]),
 
 class AppServer(App):
 
     router: APIRouter = APIRouter()
+    refresher: Optional[DashboardRefresher] = None
 
     def __init__(self, config: AppConfig):
-        self.config = config
+        super().__init__(config)
+
+        # Only the main refresher runs in the background. Each of its refreshes fetches once,
+        # renders every profile, and hands each profile's image to that profile's refresher.
+        self.profile_refreshers: dict[str, DashboardRefresher] = {}
+
+        interval = self.config.server.refresh_interval
+        if interval > 0:
+            self.refresher = self.make_refresher(self.refresh_profiles, interval, None)
+            for profile in self.config.profiles:
+                render = partial(self.render_dashboard, profile=profile)
+                self.profile_refreshers[profile] = self.make_refresher(render, interval, profile)
+
         self.configure_routes()
 
+    def make_refresher(self, render, interval: float, profile: Optional[str]) -> DashboardRefresher:
+        """A refresher for the main image or a profile's, starting from its saved snapshot if there is one"""
+        on_refresh = None if self.snapshots is None else partial(self.snapshots.save_image, profile=profile)
+        refresher = DashboardRefresher(render=render, interval=interval, on_refresh=on_refresh)
+
+        saved = self.snapshots.load_image(profile) if self.snapshots is not None else None
+        if saved is not None:
+            refresher.restore(saved)
+            name = "dashboard" if profile is None else f"{profile} dashboard"
+            msg = f"Serving the {name} rendered at {saved.rendered_at.isoformat()} until the first refresh"
+            logger.info(msg)
+
+        return refresher
+
+    async def refresh_profiles(self) -> RenderedImage:
+        """Render every profile from one fetch, publishing the profiles' images. Returns the main image."""
+        rendered = await self.render_profiles()
+        for profile, refresher in self.profile_refreshers.items():
+            await refresher.publish(rendered[profile])
+        return rendered[None]
+
+    @asynccontextmanager
+    async def lifespan(self, _app: FastAPI):
+        """Runs the background refresher for as long as the server is up, then closes connections."""
+        if self.refresher is not None:
+            self.refresher.start()
+        yield
+        if self.refresher is not None:
+            await self.refresher.stop()
+        await self.aclose()
+
+    async def get_dashboard_response(
+        self,
+        if_none_match: Annotated[Optional[str], Header()] = None,
+        encoding: Annotated[Optional[dict], Depends(encoding_overrides)] = None,
+        device: Annotated[Optional[str], Depends(device_id)] = None,
+    ) -> Response:
+        if self.refresher is None:
+            return await super().get_dashboard_response(if_none_match, encoding, device)
+
+        snapshot = await self.refresher.get()
+        rendered = await asyncio.to_thread(self.reencode, snapshot, self.resolve_encoding(encoding))
+
+        return await asyncio.to_thread(
+            self.serve_image, rendered, if_none_match, device, headers=self.refresher.headers()
+        )
+
+    async def get_profile_dashboard_response(
+        self,
+        profile: str,
+        if_none_match: Annotated[Optional[str], Header()] = None,
+        encoding: Annotated[Optional[dict], Depends(encoding_overrides)] = None,
+        device: Annotated[Optional[str], Depends(device_id)] = None,
+    ) -> Response:
+        if self.refresher is None:
+            return await super().get_profile_dashboard_response(profile, if_none_match, encoding, device)
+
+        resolved = self.resolve_encoding(encoding, profile)  # 404 for unknown profiles
+        refresher = self.profile_refreshers[profile]
+        snapshot = await refresher.get()
+        rendered = await asyncio.to_thread(self.reencode, snapshot, resolved)
+
+        # Refresh failures are the main refresher's: it does the fetching for every profile
+        headers = {**self.refresher.headers(), **refresher.headers()}
+        return await asyncio.to_thread(self.serve_image, rendered, if_none_match, device, headers=headers)
+
     def configure_routes(self):
         self.router = APIRouter()
         self.router.add_api_route(
@@ -165,6 +510,27 @@ class AppServer(App):
             methods=["GET"],
             )
 
+        self.router.add_api_route(
+            "/dashboard/changes",
+            endpoint=self.get_changed_regions,
+            methods=["GET"],
+            )
+
+        # After /dashboard/changes, which would otherwise be taken for a profile
+        self.router.add_api_route(
+            "/dashboard/{profile}",
+            response_class=Response,
+            endpoint=self.get_profile_dashboard_response,
+            methods=["GET"],
+            )
+
+        self.router.add_api_route(
+            "/metrics",
+            response_class=Response,
+            endpoint=self.get_metrics,
+            methods=["GET"],
+            )
+
         self.router.add_api_route(
             "/logs/server",
             response_class=PlainTextResponse,
@@ -1,7 +1,7 @@
 import logging
 from datetime import datetime, time, timedelta
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 from pydantic import BaseModel, PositiveInt
 
@@ -31,8 +31,9 @@ class Calendar(BaseModel):
     def end_date(self) -> datetime:
         return self.start_date + timedelta(days=self.days_to_show)
 
-    def get_events_cal(self) -> list[Activity]:
-        c = GCal(self.credentials)
+    def get_events_cal(self, client: Optional[GCal] = None) -> list[Activity]:
+        """Pass a long-lived `client` to reuse its connections & cached calendar list."""
+        c = client or GCal(self.credentials)
         return c.get_events(
             date_from=self.start_date,
             date_to=self.end_date,
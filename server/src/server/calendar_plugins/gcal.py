@@ -1,15 +1,25 @@
 import logging
 import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from http import HTTPStatus
 from pathlib import Path
+from time import monotonic
 from typing import Optional, Union
 
+from gcsa.event import Event
 from gcsa.google_calendar import GoogleCalendar
+from gcsa.serializers.event_serializer import EventSerializer
+from gcsa.util.date_time_util import ensure_datetime, to_localized_iso
 from google.auth.transport.requests import Request
 from google.oauth2 import service_account
 from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.errors import HttpError
+from tzlocal import get_localzone_name
 
-from server.activity import Activity
+from server.activity import Activity, activity_sort_key, merge_sorted
+from server.metrics import FETCH_SECONDS
 
 logger = logging.getLogger(__name__)
 logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.WARN)
@@ -18,12 +28,86 @@ SCOPES = ["https://www.googleapis.com/auth/calendar"]
 USE_SERVICE_ACCOUNT = True
 
 
+PRIMARY_CALENDAR = "primary"
+
+
+class CalendarFetchError(Exception):
+    """Raised when no calendar could be fetched. `errors` maps each calendar ID to its exception."""
+
+    def __init__(self, errors: dict[str, Exception]):
+        self.errors = errors
+        details = "; ".join(f"{calendar_id}: {e}" for calendar_id, e in errors.items())
+        super().__init__(f"Failed to retrieve any calendars. {details}")
+
+
+class EventStore:
+    """
+    A local copy of one calendar's events in `window`, keyed by event ID, plus the token for the next
+    incremental sync. Callers must hold `lock` while syncing or reading.
+    """
+
+    def __init__(self):
+        self.events: dict[str, Event] = {}
+        self.sync_token: Optional[str] = None
+        self.window: Optional[tuple[datetime, datetime]] = None
+        self.lock = threading.Lock()
+
+    def clear(self) -> None:
+        self.events.clear()
+        self.sync_token = None
+        self.window = None
+
+    def apply(self, items: list[dict]) -> None:
+        """Apply events from the API: cancelled ones are removed, anything else is added or replaced"""
+        for item in items:
+            if item.get("status") == "cancelled":
+                self.events.pop(item["id"], None)
+            else:
+                self.events[item["id"]] = EventSerializer.to_object(dict(item))
+
+    def events_between(self, date_from: datetime, date_to: datetime) -> list[Event]:
+        """
+        Events overlapping [date_from, date_to), ordered by start, matching the API's timeMin/timeMax.
+        Naive datetimes & all-day dates are treated as local time, as gcsa does.
+        """
+        tz = get_localzone_name()
+        date_from = ensure_datetime(date_from, tz)
+        date_to = ensure_datetime(date_to, tz)
+
+        matching = [
+            e for e in self.events.values()
+            if ensure_datetime(e.start, tz) < date_to and ensure_datetime(e.end or e.start, tz) > date_from
+        ]
+        return sorted(matching, key=lambda e: ensure_datetime(e.start, tz))
+
+    def prune(self) -> None:
+        """
+        Drop events outside `window`. Changes since a sync token aren't limited by timeMin/timeMax,
+        so without this every edit to an event months away would be kept.
+        """
+        if self.window is not None:
+            keep = self.events_between(*self.window)
+            self.events = {e.event_id: e for e in keep}
+
+
 class GCal:
     """
     Manages connections to Google Calendar and facilitates extraction of events.
+
+    Intended to be long-lived and shared between threads. Credentials are loaded once and
+    only refreshed when they expire. Each thread gets its own GoogleCalendar client (httplib2
+    connections aren't thread-safe), which is then reused for every request that thread makes.
+    Calendars are queried on a fixed pool of threads, so there are never more than
+    `max_concurrent_fetches` of those clients. Call `close` when finished with.
     """
 
-    def __init__(self, creds_path: Path):
+    def __init__(
+        self,
+        creds_path: Path,
+        calendar_list_ttl: float = 3600,
+        max_concurrent_fetches: int = 4,
+        incremental_sync: bool = False,  # noqa: FBT001, FBT002
+    ):
         # Uncomment if using general oauth flow ###
         # current_path = str(pathlib.Path(__file__).parent.absolute())
         # creds_filename = 'credentials_service.json' if USE_SERVICE_ACCOUNT else 'credentials_oauth.json'
@@ -38,8 +122,44 @@ class GCal:
             err = f"No credentials file found at {creds_path}"
             raise FileNotFoundError(err)
 
-        self.calendar = self.create_calendar_service_user(creds_path)
-        self.available_calendars = self.get_available_calendars()
+        self.credentials = self.load_service_user_credentials(creds_path)
+        self.calendar_list_ttl = calendar_list_ttl
+        self.max_concurrent_fetches = max_concurrent_fetches
+        self.last_fetch_errors: dict[str, Exception] = {}
+
+        self.incremental_sync = incremental_sync
+        self._stores: dict[str, EventStore] = {}
+        self._stores_lock = threading.Lock()
+
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_fetches, thread_name_prefix="gcal")
+        self._calendar_list_lock = threading.Lock()
+        self._available_calendars: Optional[dict[str, str]] = None
+        self._available_calendars_fetched_at = 0.0
+
+    def close(self) -> None:
+        """Stop the query threads, once any queries in progress have finished"""
+        self._executor.shutdown()
+
+    @property
+    def calendar(self) -> GoogleCalendar:
+        """This thread's client"""
+        calendar = getattr(self._local, "calendar", None)
+        if calendar is None:
+            calendar = GoogleCalendar(credentials=self.credentials, read_only=True)
+            self._local.calendar = calendar
+        return calendar
+
+    @property
+    def available_calendars(self) -> dict[str, str]:
+        """Calendars this account can see. Cached, and only re-fetched once `calendar_list_ttl` seconds old."""
+        with self._calendar_list_lock:
+            age = monotonic() - self._available_calendars_fetched_at
+            if self._available_calendars is None or age > self.calendar_list_ttl:
+                self._available_calendars = self.get_available_calendars()
+                self._available_calendars_fetched_at = monotonic()
+
+            return self._available_calendars
 
     @staticmethod
     def is_token_valid(token_path):
@@ -104,11 +224,15 @@ class GCal:
         return GoogleCalendar(credentials_path=creds_path, read_only=True)
 
     @staticmethod
-    def create_calendar_service_user(creds_path):
-        creds = service_account.Credentials.from_service_account_file(
+    def load_service_user_credentials(creds_path) -> service_account.Credentials:
+        return service_account.Credentials.from_service_account_file(
             creds_path, scopes=SCOPES
         )
 
+    @staticmethod
+    def create_calendar_service_user(creds_path):
+        creds = GCal.load_service_user_credentials(creds_path)
+
         return GoogleCalendar(credentials=creds, read_only=True)
 
     def validate_calendars(self, calendars_to_validate: list[str]):
@@ -116,20 +240,21 @@ class GCal:
             err = "No calendars to validate."
             raise ValueError(err)
 
-        if (self.available_calendars is None) or len(self.available_calendars) == 0:
+        available_calendars = self.available_calendars
+        if (available_calendars is None) or len(available_calendars) == 0:
             err = "No calendars available."
             raise ValueError(err)
 
         invalid_calendars = []
         # for calendar in calendars_to_validate:
-        #     if calendar not in self.available_calendars:
+        #     if calendar not in available_calendars:
         #         invalid_calendars.append(calendar)
 
-        invalid_calendars = [calendar for calendar in calendars_to_validate if calendar not in self.available_calendars]
+        invalid_calendars = [calendar for calendar in calendars_to_validate if calendar not in available_calendars]
 
         if len(invalid_calendars) > 0:
             err = f"""Invalid calendars: {", ".join(invalid_calendars)}.
-            Available calendars are: {", ".join(self.available_calendars)}"""
+            Available calendars are: {", ".join(available_calendars)}"""
             raise ValueError(err)
 
     def query_events_api(
@@ -145,6 +270,9 @@ class GCal:
         For gcsa API ref see https://google-calendar-simple-api.readthedocs.io/en/latest/code/event.html
         """
 
+        if self.incremental_sync:
+            return self.query_events_synced(calendar_id or PRIMARY_CALENDAR, date_from, date_to)
+
         if calendar_id is None:
             response = self.calendar.get_events(
                 single_events=True, time_min=date_from, time_max=date_to
@@ -157,17 +285,66 @@ class GCal:
                 time_max=date_to,
             )
 
-        return [
-            Activity.from_datetimes(
-                activity_type="event",
-                summary=e.summary,
-                datetime_start=e.start,
-                datetime_end=e.end,
-                description=e.description,
-                location=e.location,
-            )
-            for e in list(response)
-        ]
+        return [event_to_activity(e) for e in list(response)]
+
+    def query_events_synced(self, calendar_id: str, date_from: datetime, date_to: datetime) -> list[Activity]:
+        """
+        Like `query_events_api`, but answered from a local copy of the calendar which is
+        brought up to date with just the changes since the last query.
+        """
+        with self._stores_lock:
+            store = self._stores.setdefault(calendar_id, EventStore())
+
+        with store.lock:
+            self.sync_store(calendar_id, store, date_from, date_to)
+            events = store.events_between(date_from, date_to)
+
+        return [event_to_activity(e) for e in events]
+
+    def sync_store(self, calendar_id: str, store: EventStore, date_from: datetime, date_to: datetime) -> None:
+        """
+        Apply changes since the last sync to `store`, using the Calendar API's sync tokens.
+
+        A full sync of [date_from, date_to) is done the first time, whenever the window moves (usually
+        once a day) and whenever Google expires the sync token (410 Gone). Recurring events are expanded
+        by the API (singleEvents), so bounding the window keeps that to the instances which are shown.
+        """
+        window = (date_from, date_to)
+        if store.sync_token is not None and store.window == window:
+            try:
+                self.list_event_changes(calendar_id, store, {"syncToken": store.sync_token})
+            except HttpError as e:
+                if e.resp.status != HTTPStatus.GONE:
+                    raise
+                msg = f"Sync token for calendar {calendar_id} expired; doing a full sync."
+                logger.info(msg)
+            else:
+                store.prune()
+                return
+
+        store.clear()
+        tz = get_localzone_name()
+        self.list_event_changes(
+            calendar_id, store, {"timeMin": to_localized_iso(date_from, tz), "timeMax": to_localized_iso(date_to, tz)}
+        )
+        store.window = window
+
+    def list_event_changes(self, calendar_id: str, store: EventStore, params: dict) -> None:
+        """Page through events().list, applying every item to `store`, then save the next sync token"""
+        request = self.calendar.service.events()
+        page_token = None
+        while True:
+            response = request.list(
+                calendarId=calendar_id, singleEvents=True, maxResults=2500, pageToken=page_token, **params
+            ).execute()
+            store.apply(response.get("items", []))
+
+            page_token = response.get("nextPageToken")
+            if page_token is None:
+                break
+
+        # Without a token (it's only given on the last page) the next query is a full sync
+        store.sync_token = response.get("nextSyncToken")
 
     def get_events(
         self,
@@ -182,11 +359,7 @@ class GCal:
         msg = f"Retrieving events between {min_time_str} and {max_time_str}..."
         logger.debug(msg)
 
-        events = []
-
-        if not exclude_default_calendar:
-            events_primary = self.query_events_api(date_from=date_from, date_to=date_to)
-            events.extend(events_primary)
+        calendar_ids = [] if exclude_default_calendar else [PRIMARY_CALENDAR]
 
         # Convert to single-element list if it's a string
         if isinstance(additional_calendars, str):
@@ -199,15 +372,65 @@ class GCal:
                 self.validate_calendars(
                     additional_calendars
                 )  # will throw error if an invalid calendar is detected
-                for cal_id in additional_calendars:
-                    events.extend(
-                        self.query_events_api(
-                            calendar_id=cal_id, date_from=date_from, date_to=date_to
-                        )
-                    )
+                calendar_ids.extend(additional_calendars)
         else:
             warn_msg = f"""Invalid input for additional calendars.
                         Expected str or list[str], but got {type(additional_calendars)}."""
             logger.warning(warn_msg)
 
-        return events
+        return self.query_calendars_concurrently(calendar_ids, date_from, date_to)
+
+    def query_calendars_concurrently(
+        self, calendar_ids: list[str], date_from: datetime, date_to: datetime
+    ) -> list[Activity]:
+        """
+        Queries each calendar at the same time (up to `max_concurrent_fetches` at once).
+        Events are returned in `activity_sort_key` order; events at the same time are in the order of `calendar_ids`,
+        however long each calendar took.
+
+        A calendar that fails is logged and recorded in `last_fetch_errors`, and the rest are still returned.
+        Only if every calendar fails is an error raised.
+        """
+        if len(calendar_ids) == 0:
+            return []
+
+        def query(calendar_id: str) -> list[Activity]:
+            with FETCH_SECONDS.labels(source=f"calendar/{calendar_id}").time():
+                return self.query_events_api(
+                    calendar_id=None if calendar_id == PRIMARY_CALENDAR else calendar_id,
+                    date_from=date_from,
+                    date_to=date_to,
+                )
+
+        # The same threads every time, so each reuses its client & connection
+        futures = [self._executor.submit(query, calendar_id) for calendar_id in calendar_ids]
+
+        calendars = []
+        errors = {}
+        for calendar_id, future in zip(calendar_ids, futures):
+            try:
+                calendars.append(sorted(future.result(), key=activity_sort_key))
+            except Exception as e:  # noqa: BLE001
+                msg = f"Failed to retrieve events from calendar {calendar_id}: {e}"
+                logger.error(msg)  # noqa: TRY400
+                errors[calendar_id] = e
+
+        self.last_fetch_errors = errors
+
+        if len(errors) == len(calendar_ids):
+            raise CalendarFetchError(errors)
+
+        return list(merge_sorted(*calendars))
+
+
+def event_to_activity(e: Event) -> Activity:
+    # gcsa has already parsed the API's dates & times, so there's nothing for validation to do
+    return Activity.from_datetimes(
+        activity_type="event",
+        summary=e.summary or "",  # untitled events have no summary
+        datetime_start=e.start,
+        datetime_end=e.end,
+        description=e.description,
+        location=e.location,
+        trusted=True,
+    )
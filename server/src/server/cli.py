@@ -1,12 +1,16 @@
+import asyncio
+import io
 import logging
 from pathlib import Path
 from types import SimpleNamespace
 from typing import Annotated
 
+from PIL import Image
 from typer import Context, Option, Typer
 
 from server.app import App, AppServer
-from server.config import AppConfig
+from server.config import AppConfig, EncodingConfig
+from server.encode import candidate_encodings, compare_encodings
 
 cli = Typer(add_completion=False)
 current_dir = Path.cwd()
@@ -53,8 +57,26 @@ def logs(ctx: Context):
 @cli.command()
 def once(ctx: Context):
     """ Run the app once, generating an image and saving it """
-    app: App = App(ctx.obj.config)
-    app.generate_image_and_save()
+    async def run():
+        async with App(ctx.obj.config) as app:
+            await app.generate_image_and_save()
+
+    asyncio.run(run())
+
+
+@cli.command()
+def encodings(ctx: Context):
+    """ Render once, then compare the size & encode time of different PNG encodings """
+    async def fetch():
+        async with App(ctx.obj.config) as app:
+            return app, await app.get_dashboard_data()
+
+    app, data = asyncio.run(fetch())
+    rendered = app.generate_image(data, EncodingConfig())
+    image = Image.open(io.BytesIO(rendered.image))
+
+    for report in compare_encodings(image, candidate_encodings()):
+        print(f"{report.tag:<32} {report.size_bytes:>9} bytes {report.encode_ms:>8.1f} ms")  # noqa: T201
 
 
 @cli.command()
@@ -64,7 +86,7 @@ def start(ctx: Context):
     from fastapi import FastAPI
 
     app: AppServer = AppServer(ctx.obj.config)
-    f = FastAPI()
+    f = FastAPI(lifespan=app.lifespan)
     f.include_router(app.router)
 
     uvicorn.run(f, host=str(app.config.server.host), port=app.config.server.port)
@@ -1,12 +1,13 @@
 import json
+import re
 from collections.abc import Iterator
 from ipaddress import IPv4Address
 from pathlib import Path
-from typing import Optional
+from typing import Literal, Optional
 
 import toml
 import yaml
-from pydantic import BaseModel, Field, SecretStr
+from pydantic import BaseModel, Field, SecretStr, model_validator
 
 
 class MultipleFilesFoundError(Exception):
@@ -109,13 +110,104 @@ class ServerConfig(BaseModel):
     server_log_file_name: str = Field(default="server.log", description="File name to write server logs to")
     device_log_file_name: str = Field(default="device.log", description="File name to write device logs to")
     image_name: str = Field(default="dashboard.png", description="Image name, if writing as file")
+    refresh_interval: int = Field(
+        default=300, ge=0,
+        description="Seconds between background re-renders of the dashboard. 0 renders on every request instead."
+    )
+    render_cache_size: int = Field(
+        default=8, ge=0, description="Number of rendered images to keep in memory, keyed by what they show"
+    )
+    changed_regions: bool = Field(
+        default=False,
+        description="""Report the regions that changed since each device's last download, for partial e-ink refreshes.
+            Off by default: it decodes every image sent and keeps a frame per device in memory,
+            and the device scripts don't use it yet."""
+    )
+    snapshot: bool = Field(
+        default=True,
+        description="""Save the latest data & image in server_dir/snapshot, and load them at startup,
+            so the first request after a restart is answered without waiting on any APIs."""
+    )
+
+class EncodingConfig(BaseModel):
+    levels: int = Field(
+        default=256, ge=2, le=256,
+        description="Grey levels to quantize to. Kindle panels can only show 16, so more just costs bytes."
+    )
+    dither: Literal["none", "ordered", "floyd-steinberg"] = Field(
+        default="none", description="How to spread quantization error. Smooths gradients, but makes larger files."
+    )
+    bits: Literal[4, 8] = Field(default=8, description="PNG bit depth. 4 requires levels <= 16")
+    compress_level: int = Field(default=6, ge=0, le=9, description="zlib compression level for the PNG")
+    framebuffer: Optional[Literal["PW2", "PW3", "K4"]] = Field(
+        default=None,
+        description="""Instead of a PNG, send raw pixels laid out for this Kindle's framebuffer, ready to copy
+            to /dev/fb0. The image must be the device's size. bits & compress_level don't apply.""",
+    )
+    framebuffer_compression: Literal["none", "gzip"] = Field(
+        default="gzip", description="How to compress raw framebuffer images. gzip is at its fastest level"
+    )
+
+    @model_validator(mode="after")
+    def validate_bits(self):
+        if self.bits == 4 and self.levels > 16:  # noqa: PLR2004
+            err = "4-bit PNGs can hold at most 16 grey levels"
+            raise ValueError(err)
+        return self
+
+    @property
+    def tag(self) -> str:
+        """Short, unique name for these settings"""
+        if self.framebuffer is not None:
+            return f"L{self.levels}-{self.dither}-fb{self.framebuffer}-{self.framebuffer_compression}"
+        return f"L{self.levels}-{self.dither}-{self.bits}bit-z{self.compress_level}"
 
 class ImageConfig(BaseModel):
     width: int = Field(gt = 0, description="Image width, in pixels")
     height: int = Field(gt = 0, description="Image height, in pixels")
     margin_x: int = Field(gt = 0, default = 100, description="Margin from left and right edges of image, in pixels.")
     margin_y: int = Field(gt = 0, default = 200, description="Margin from top and bottom edges of image, in pixels.")
+    top_row_y: int = Field(ge = 0, default = 250, description="Pixels from the top to the date & weather's baseline")
+    space_between_sections: int = Field(
+        ge = 0, default = 100, description="Vertical pixels between the date & weather, today, and tomorrow"
+    )
     rotate_angle: int = Field(default = 0, description="Angle to rotate the rendered image")
+    font_style_map: Optional[dict[str, str]] = Field(
+        default = None,
+        description="""Map of style names (regular, bold, weather etc.) to .ttf files in the font directory.
+            None uses the default Lexend fonts."""
+    )
+    columns: int = Field(
+        gt = 0, default = 1, description="Columns to flow activities into, for wide (e.g. rotated) images"
+    )
+    etag_includes_last_updated: bool = Field(
+        default = False,
+        description="""If false, the "Refreshed" time is left out of the ETag, so the device only
+            re-downloads & redraws when something else on the dashboard has changed."""
+    )
+    encoding: EncodingConfig = Field(default_factory=EncodingConfig, description="How to encode the PNG")
+
+class DataCacheConfig(BaseModel):
+    fresh_ttl: float = Field(
+        default=60, ge=0, description="Seconds to use fetched data for without checking for updates"
+    )
+    stale_ttl: float = Field(
+        default=300, ge=0,
+        description="""Seconds to keep using fetched data for while it's updated in the background.
+            After that, wait for an update."""
+    )
+    fetch_timeout: float = Field(
+        default=10, gt=0,
+        description="""Seconds to wait for an update before falling back to the last data we have, if any.
+            The update carries on in the background."""
+    )
+
+    @model_validator(mode="after")
+    def validate_ttls(self):
+        if self.stale_ttl < self.fresh_ttl:
+            err = "stale_ttl must be at least fresh_ttl"
+            raise ValueError(err)
+        return self
 
 class CalendarConfig(BaseModel):
     display_timezone: str = "Europe/London"
@@ -126,23 +218,65 @@ class CalendarConfig(BaseModel):
     creds: Path = Field(
         description="Path to credentials file. Intended for Google Calendar"
     )
+    calendar_list_ttl: int = Field(
+        default=3600, ge=0, description="Seconds to cache the list of available calendars for"
+    )
+    max_concurrent_fetches: int = Field(default=4, gt=0, description="Maximum calendars to query at once")
+    incremental_sync: bool = Field(
+        default=False,
+        description=(
+            "Keep a local copy of each calendar and only download changes, using Google's sync tokens. "
+            "The copy covers the days shown, with recurring events expanded, and is re-downloaded in full "
+            "each day as that window moves"
+        ),
+    )
+    cache: DataCacheConfig = Field(default_factory=DataCacheConfig, description="How long to reuse fetched events")
 
 class TasksConfig(BaseModel):
     project_id: int
+    collaborator_ttl: int = Field(
+        default=3600, ge=0, description="Seconds to cache the project's collaborators for"
+    )
+    incremental_sync: bool = Field(
+        default=False,
+        description="Keep a local copy of the tasks and only download changes, using Todoist's Sync API"
+    )
+    cache: DataCacheConfig = Field(default_factory=DataCacheConfig, description="How long to reuse fetched tasks")
 
 class WeatherConfig(BaseModel):
     latitude: float
     longitude: float
+    cache: DataCacheConfig = Field(
+        default_factory=lambda: DataCacheConfig(fresh_ttl=3600, stale_ttl=7200),
+        description="How long to reuse fetched weather. It updates hourly, so fresh_ttl defaults to an hour"
+    )
+
+# Profile names appear in URLs and file names. "changes" would clash with /dashboard/changes
+PROFILE_NAME = re.compile(r"[A-Za-z0-9_-]+")
+RESERVED_PROFILE_NAMES = {"changes"}
 
 class AppConfig(BaseModel): # TODO: make this available to Typer in cli.py as a "config-helper" command
     server: ServerConfig
     image: ImageConfig
+    profiles: dict[str, ImageConfig] = Field(
+        default_factory=dict,
+        description="""Named images for other devices, served at /dashboard/<name>. Each is rendered from
+            the same fetched data as the main image. Settings not given are taken from the main image."""
+    )
 
     api_keys: Optional[dict[str, SecretStr]] = None
     calendar: Optional[CalendarConfig] = None
     weather: Optional[WeatherConfig] = None
     tasks: Optional[TasksConfig] = None
 
+    @model_validator(mode="after")
+    def validate_profiles(self):
+        for name in self.profiles:
+            if not PROFILE_NAME.fullmatch(name) or name in RESERVED_PROFILE_NAMES:
+                err = f"Invalid profile name '{name}': use letters, digits, - and _, and not {RESERVED_PROFILE_NAMES}"
+                raise ValueError(err)
+        return self
+
     @classmethod
     def from_dir(cls, directory: Path):
         """
@@ -187,10 +321,13 @@ class AppConfig(BaseModel): # TODO: make this available to Typer in cli.py as a
         calendar = CalendarConfig(**config["calendar"]) if "calendar" in config else None
         weather = WeatherConfig(**config["weather"]) if "weather" in config else None
         tasks = TasksConfig(**config["tasks"]) if "tasks" in config else None
+        # Each profile only needs to say how it differs from the main image
+        profiles = {name: ImageConfig(**{**config["image"], **p}) for name, p in config.get("profiles", {}).items()}
 
         return cls(
             server = ServerConfig(**config["server"]),
             image = ImageConfig(**config["image"]),
+            profiles = profiles,
             api_keys = api_keys, # TODO: move these into their respective Configs
             calendar = calendar,
             weather = weather,
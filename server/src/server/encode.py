@@ -0,0 +1,210 @@
+"""
+Turns a rendered greyscale image into the bytes sent to the device.
+
+Kindle panels show 16 grey levels, so anti-aliased text rendered at 256 levels wastes bytes on
+detail the device can't display. Quantizing (optionally with dithering) before encoding gives
+smaller PNGs and so shorter WiFi transfers.
+
+Alternatively, the pixels can be sent raw, laid out as the device's framebuffer expects (see framebuffer.py).
+"""
+
+import gzip
+import io
+import logging
+import time
+from functools import lru_cache
+
+from PIL import Image, ImageChops
+from pydantic import BaseModel
+
+from server.config import EncodingConfig
+from server.framebuffer import FRAMEBUFFERS, compress, pack, unpack
+from server.metrics import STAGE_SECONDS
+from server.render import RenderedImage
+
+logger = logging.getLogger(__name__)
+
+# 8x8 Bayer matrix, for ordered dithering
+BAYER_8 = (
+    (0, 32, 8, 40, 2, 34, 10, 42),
+    (48, 16, 56, 24, 50, 18, 58, 26),
+    (12, 44, 4, 36, 14, 46, 6, 38),
+    (60, 28, 52, 20, 62, 30, 54, 22),
+    (3, 35, 11, 43, 1, 33, 9, 41),
+    (51, 19, 59, 27, 49, 17, 57, 25),
+    (15, 47, 7, 39, 13, 45, 5, 37),
+    (63, 31, 55, 23, 61, 29, 53, 21),
+)
+
+
+class EncodingReport(BaseModel):
+    tag: str
+    size_bytes: int
+    encode_ms: float
+
+
+def grey_levels(levels: int) -> list[int]:
+    """Evenly spaced grey values, from black (0) to white (255)"""
+    return [round(i * 255 / (levels - 1)) for i in range(levels)]
+
+
+@lru_cache(maxsize=16)
+def _level_index_lut(levels: int) -> tuple[int, ...]:
+    """Maps each 0-255 grey value to the index of its nearest level"""
+    return tuple(round(v * (levels - 1) / 255) for v in range(256))
+
+
+@lru_cache(maxsize=16)
+def _nearest_level_lut(levels: int) -> tuple[int, ...]:
+    values = grey_levels(levels)
+    return tuple(values[i] for i in _level_index_lut(levels))
+
+
+@lru_cache(maxsize=4)
+def _bayer_tile(size: tuple[int, int], levels: int) -> Image.Image:
+    """Threshold offsets in [0, step) covering an image of `size`, where step is the gap between levels"""
+    step = 255 / (levels - 1)
+    cell = Image.new("L", (8, 8))
+    cell.putdata([int((v + 0.5) / 64 * step) for row in BAYER_8 for v in row])
+
+    width, height = size
+    strip = Image.new("L", (width, 8))
+    for x in range(0, width, 8):
+        strip.paste(cell, (x, 0))
+
+    tile = Image.new("L", size)
+    for y in range(0, height, 8):
+        tile.paste(strip, (0, y))
+
+    return tile
+
+
+def quantize(image: Image.Image, levels: int, dither: str = "none") -> Image.Image:
+    """
+    Reduce an "L" image to `levels` evenly spaced greys.
+    Returns an "L" image, except for Floyd-Steinberg which returns a "P" image indexed by level.
+    """
+    if dither == "floyd-steinberg":
+        palette = Image.new("P", (1, 1))
+        palette.putpalette([v for grey in grey_levels(levels) for v in (grey, grey, grey)])
+        # Pillow only dithers against a palette from RGB
+        return image.convert("RGB").quantize(palette=palette, dither=Image.Dither.FLOYDSTEINBERG)
+
+    if dither == "ordered":
+        # Shift each pixel by its threshold (centred on 0), then round to the nearest level
+        step = 255 / (levels - 1)
+        image = ImageChops.add(image, _bayer_tile(image.size, levels), offset=-round(step / 2))
+
+    if levels == 256:  # noqa: PLR2004
+        return image
+
+    return image.point(_nearest_level_lut(levels))
+
+
+def to_palette(image: Image.Image, levels: int) -> Image.Image:
+    """Convert a quantized "L" image to a "P" image whose palette is the grey levels"""
+    indexed = image.point(_level_index_lut(levels))
+    indexed.putpalette([v for grey in grey_levels(levels) for v in (grey, grey, grey)])
+    return indexed
+
+
+def encode_png(image: Image.Image, encoding: EncodingConfig) -> bytes:
+    start = time.perf_counter()
+
+    quantized = quantize(image, encoding.levels, encoding.dither)
+
+    if encoding.bits == 4:  # noqa: PLR2004
+        if quantized.mode != "P":
+            quantized = to_palette(quantized, encoding.levels)
+        params = {"bits": 4}
+    else:
+        if quantized.mode != "L":
+            quantized = quantized.convert("L")
+        params = {}
+
+    with io.BytesIO() as output:
+        quantized.save(output, format="PNG", compress_level=encoding.compress_level, **params)
+        png = output.getvalue()
+
+    elapsed = time.perf_counter() - start
+    STAGE_SECONDS.labels(stage="encode").observe(elapsed)
+
+    msg = f"Encoded {encoding.tag} PNG: {len(png)} bytes in {elapsed * 1000:.1f}ms"
+    logger.debug(msg)
+
+    return png
+
+
+def encode_framebuffer(image: Image.Image, encoding: EncodingConfig) -> bytes:
+    start = time.perf_counter()
+
+    fb = FRAMEBUFFERS[encoding.framebuffer]
+    levels = min(encoding.levels, 16) if fb.bits == 4 else encoding.levels  # noqa: PLR2004
+    data = pack(quantize(image, levels, encoding.dither).convert("L"), fb)
+    if encoding.framebuffer_compression == "gzip":
+        data = compress(data)
+
+    elapsed = time.perf_counter() - start
+    STAGE_SECONDS.labels(stage="encode").observe(elapsed)
+
+    msg = f"Encoded {encoding.tag} framebuffer: {len(data)} bytes in {elapsed * 1000:.1f}ms"
+    logger.debug(msg)
+
+    return data
+
+
+def encode_image(image: Image.Image, encoding: EncodingConfig) -> bytes:
+    """`image` as a PNG, or as raw framebuffer pixels if `encoding` names a framebuffer"""
+    if encoding.framebuffer is not None:
+        return encode_framebuffer(image, encoding)
+    return encode_png(image, encoding)
+
+
+def media_type(encoding: EncodingConfig) -> str:
+    """The Content-Type of images encoded with `encoding`"""
+    if encoding.framebuffer is None:
+        return "image/png"
+    return "application/gzip" if encoding.framebuffer_compression == "gzip" else "application/octet-stream"
+
+
+def encode_rendered(image: Image.Image, digest: str, encoding: EncodingConfig) -> RenderedImage:
+    return RenderedImage(
+        image=encode_image(image, encoding),
+        digest=digest,
+        encoding=encoding.tag,
+        media_type=media_type(encoding),
+        framebuffer=encoding.framebuffer,
+    )
+
+
+def decode_image(rendered: RenderedImage) -> Image.Image:
+    """The "L" image an encoded image shows, whether it's a PNG or raw framebuffer pixels"""
+    if rendered.framebuffer is None:
+        return Image.open(io.BytesIO(rendered.image)).convert("L")
+
+    data = gzip.decompress(rendered.image) if rendered.media_type == "application/gzip" else rendered.image
+    return unpack(data, FRAMEBUFFERS[rendered.framebuffer])
+
+
+def compare_encodings(image: Image.Image, encodings: list[EncodingConfig]) -> list[EncodingReport]:
+    """Encode `image` with each of `encodings`, reporting size & time, smallest first"""
+    reports = []
+    for encoding in encodings:
+        start = time.perf_counter()
+        png = encode_png(image, encoding)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        reports.append(EncodingReport(tag=encoding.tag, size_bytes=len(png), encode_ms=elapsed_ms))
+
+    return sorted(reports, key=lambda r: r.size_bytes)
+
+
+def candidate_encodings() -> list[EncodingConfig]:
+    """A spread of settings worth comparing for an e-ink panel"""
+    candidates = [EncodingConfig()]
+    for dither in ["none", "ordered", "floyd-steinberg"]:
+        for bits in [8, 4]:
+            for compress_level in [6, 9]:
+                candidates.append(  # noqa: PERF401
+                    EncodingConfig(levels=16, dither=dither, bits=bits, compress_level=compress_level)
+                )
+    return candidates
@@ -0,0 +1,22 @@
+import os
+import tempfile
+from pathlib import Path
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """
+    Write to a uniquely-named temporary file in the same directory, sync it to disk, then rename it over `path`.
+    Readers never see a partial file, concurrent writers don't share a temporary file,
+    and a power cut leaves either the old or the new contents.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    tmp_path = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(path)  # os.replace: atomic, and overwrites on every platform
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
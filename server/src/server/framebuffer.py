@@ -0,0 +1,101 @@
+"""
+Raw framebuffer images: pixels already laid out as a Kindle's /dev/fb0 expects them.
+
+Decoding a PNG takes `eips -g` a noticeable time on the Kindle's slow ARM CPU, with WiFi still on.
+A raw image can just be copied (or zcat'd) into the framebuffer, then the screen refreshed.
+
+The layouts match the devices in the Kindle's dash.sh (DEVICE_TYPE). All three framebuffers are used unrotated:
+dash.sh's FBROTATE is never run, and would only set the PW2 & PW3 rotation to 0 anyway (the K4's is a display
+update, not a rotation). Any rotation happens when rendering (the profile's `rotate_angle`), before packing.
+"""
+
+import gzip
+from typing import Literal
+
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel, Field
+
+# Cheap to compress on the server and to decompress on the Kindle, and e-ink dashboards are mostly white
+GZIP_LEVEL = 1
+
+
+class FramebufferFormat(BaseModel):
+    name: str
+    width: int = Field(gt=0, description="Visible pixels per line")
+    height: int = Field(gt=0, description="Visible lines")
+    stride: int = Field(gt=0, description="Bytes per line, including any padding after the visible pixels")
+    bits: Literal[4, 8] = Field(description="Bits per pixel. 4-bit pixels are packed two per byte, left one high")
+    inverted: bool = Field(default=False, description="Whether 0 is white rather than black")
+
+    @property
+    def size(self) -> int:
+        """Bytes in a whole screen"""
+        return self.stride * self.height
+
+    @property
+    def white(self) -> int:
+        """A byte of white pixels, used to pad each line"""
+        return 0x00 if self.inverted else 0xFF
+
+
+FRAMEBUFFERS: dict[str, FramebufferFormat] = {
+    "PW2": FramebufferFormat(name="PW2", width=758, height=1024, stride=768, bits=8),
+    "PW3": FramebufferFormat(name="PW3", width=1072, height=1448, stride=1088, bits=8),
+    "K4": FramebufferFormat(name="K4", width=600, height=800, stride=300, bits=4, inverted=True),
+}
+
+
+def pack(image: Image.Image, fb: FramebufferFormat) -> bytes:
+    """
+    An "L" image as `fb`'s raw pixels. For 4-bit framebuffers, each grey becomes the nearest of 16 levels.
+    The image must already be exactly the framebuffer's size.
+    """
+    if image.size != (fb.width, fb.height):
+        err = f"A {image.width}x{image.height} image doesn't fit the {fb.name}'s {fb.width}x{fb.height} framebuffer"
+        raise ValueError(err)
+
+    pixels = np.asarray(image.convert("L"))
+
+    if fb.bits == 4:  # noqa: PLR2004
+        values = ((pixels.astype(np.uint16) * 15 + 127) // 255).astype(np.uint8)
+        if fb.inverted:
+            values = 15 - values
+        if fb.width % 2 == 1:
+            values = np.pad(values, ((0, 0), (0, 1)), constant_values=fb.white & 0xF)
+        rows = (values[:, 0::2] << 4) | values[:, 1::2]
+    else:
+        rows = 255 - pixels if fb.inverted else pixels
+
+    frame = np.full((fb.height, fb.stride), fb.white, dtype=np.uint8)
+    frame[:, :rows.shape[1]] = rows
+    return frame.tobytes()
+
+
+def unpack(data: bytes, fb: FramebufferFormat) -> Image.Image:
+    """The visible pixels of a raw `fb` screen, as an "L" image in the framebuffer's orientation"""
+    if len(data) != fb.size:
+        err = f"Expected {fb.size} bytes for the {fb.name}'s framebuffer, got {len(data)}"
+        raise ValueError(err)
+
+    rows = np.frombuffer(data, dtype=np.uint8).reshape(fb.height, fb.stride)
+
+    if fb.bits == 4:  # noqa: PLR2004
+        values = np.empty((fb.height, rows.shape[1] * 2), dtype=np.uint8)
+        values[:, 0::2] = rows >> 4
+        values[:, 1::2] = rows & 0xF
+        values = values[:, :fb.width]
+        if fb.inverted:
+            values = 15 - values
+        pixels = values * 17
+    else:
+        pixels = rows[:, :fb.width]
+        if fb.inverted:
+            pixels = 255 - pixels
+
+    return Image.fromarray(np.ascontiguousarray(pixels, dtype=np.uint8), mode="L")
+
+
+def compress(data: bytes) -> bytes:
+    # mtime=0 so the same pixels always give the same bytes
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,65 @@
+"""
+Layout plans: where every piece of text and every line on the dashboard goes, worked out before anything is drawn.
+
+Planning only measures text (with the fonts' cached metrics); it never touches pixels.
+A plan is plain data, so it can be cached, compared with the previous refresh's plan, and drawn any number of times.
+"""
+
+import hashlib
+from typing import Annotated, Literal, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+class TextItem(BaseModel):
+    kind: Literal["text"] = "text"
+    x: float
+    y: float
+    text: str
+    font: str = Field(description="Font style name, as in the Renderer's font_style_map")
+    size: Optional[int] = Field(default=None, description="Font size. None for the default size")
+    colour: str = "black"
+    anchor: Optional[str] = None
+
+
+class LineItem(BaseModel):
+    kind: Literal["line"] = "line"
+    x0: float
+    y0: float
+    x1: float
+    y1: float
+    colour: str = "gray"
+    width: int = 1
+
+
+LayoutItem = Annotated[Union[TextItem, LineItem], Field(discriminator="kind")]
+
+
+class LayoutPlan(BaseModel):
+    """Everything to draw on one image, in drawing order"""
+
+    width: int
+    height: int
+    background: str = "white"
+    content: list[LayoutItem] = Field(default_factory=list)
+    footer: list[LayoutItem] = Field(
+        default_factory=list, description="Drawn after the content digest is taken, e.g. the last-updated time"
+    )
+    overflow: int = Field(default=0, description="Activities which didn't fit, and are summarised as '+ N more'")
+
+    @property
+    def digest(self) -> str:
+        """Hash of the whole plan. Equal plans draw identical images."""
+        return hashlib.blake2b(self.model_dump_json().encode(), digest_size=16).hexdigest()
+
+    @property
+    def content_digest(self) -> str:
+        """Hash of everything but the footer. Equal plans draw identical images before the footer is added."""
+        content = self.model_dump_json(exclude={"footer"})
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+def column_bounds(left: int, right: int, columns: int, gap: int) -> list[tuple[int, int]]:
+    """The (left, right) x-coordinates of `columns` equal columns between `left` and `right`, `gap` pixels apart"""
+    width = (right - left - gap * (columns - 1)) // columns
+    return [(left + i * (width + gap), left + i * (width + gap) + width) for i in range(columns)]
@@ -0,0 +1,217 @@
+"""
+Lightweight timing & cache metrics, served in Prometheus' text format on /metrics.
+
+Observing a value is a bisect and a few additions under a lock, so it's cheap enough to leave on in production:
+regressions on the device's server show up on a dashboard rather than needing a profiler.
+
+    with STAGE_SECONDS.labels(stage="draw").time():
+        ...
+"""
+
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Optional
+
+# Seconds. From a cache lookup (~1ms) up to a slow upstream API on a Raspberry Pi
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: Optional[tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if len(pairs) == 0:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class _Timer:
+    """Observes the seconds spent inside a `with` block"""
+
+    __slots__ = ("_observe", "_start")
+
+    def __init__(self, observe):
+        self._observe = observe
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._observe(time.perf_counter() - self._start)
+
+
+class HistogramChild:
+    """One labelled series of a histogram"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # the last is for values above every bucket
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self.observe)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """(upper bound, observations at or below it) for every bucket, ending with +Inf"""
+        with self._lock:
+            counts = list(self._counts)
+        running, result = 0, []
+        for bound, count in zip((*self._buckets, float("inf")), counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+class CounterChild:
+    """One labelled series of a counter"""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels: str):
+        """The series for these label values, created on first use"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A new series, for one set of label values"""
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """Every series' sample lines, in the text format"""
+
+    def expose(self) -> str:
+        header = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(header + self.samples())
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def samples(self) -> list[str]:
+        lines = []
+        for values, child in sorted(self._children.items()):
+            for bound, count in child.cumulative():
+                le = _format_labels(self.labelnames, values, ("le", _format_number(bound)))
+                lines.append(f"{self.name}_bucket{le} {count}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_number(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {child.value}"
+            for values, child in sorted(self._children.items())
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), **kwargs) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, **kwargs))
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def _add(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        """Every metric, in Prometheus' text exposition format"""
+        return "\n".join(metric.expose() for metric in self._metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "dashboard_stage_seconds",
+    "Time spent in each stage of producing the dashboard: select, layout, draw, rotate, encode",
+    ("stage",),
+)
+FETCH_SECONDS = REGISTRY.histogram(
+    "dashboard_fetch_seconds",
+    "Time spent fetching from each upstream source (calendar/<id> is a single Google calendar)",
+    ("source",),
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "dashboard_cache_lookups_total",
+    "Cache lookups by cache and result: hit or miss for render & content; fresh, stale, miss or fallback for data",
+    ("cache", "result"),
+)
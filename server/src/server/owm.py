@@ -1,76 +1,183 @@
 """
 This is where we retrieve weather forecast from OpenWeatherMap. Before doing so, make sure you have both the
-signed up for an OWM account and also obtained a valid API key that is specified in the config.json file.
+signed up for an OWM account and also obtained a valid API key that is specified in the api_keys file.
+
+Only the current conditions are requested, as that's all the dashboard shows. Results are cached on disk
+per location, so the API is called at most once per TTL however often the dashboard is rendered.
 """
 
 import json
 import logging
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from pydantic import BaseModel, ValidationError
 
-import requests
+from server.files import write_atomic
 
 logger = logging.getLogger(__name__)
 
+OWM_URL = "https://api.openweathermap.org/data/3.0/onecall"
+
+# The dashboard only shows current conditions, so skip the (much larger) forecasts
+EXCLUDE = "minutely,hourly,daily,alerts"
+
+# OWM condition codes (https://openweathermap.org/weather-conditions) to weathericons glyphs
+WEATHER_ICONS: dict[int, str] = {
+    # Thunderstorm
+    200: "\uf01e", 201: "\uf01e", 202: "\uf01e", 210: "\uf016", 211: "\uf016", 212: "\uf016",
+    221: "\uf016", 230: "\uf01e", 231: "\uf01e", 232: "\uf01e",
+    # Drizzle
+    300: "\uf01c", 301: "\uf01c", 302: "\uf01c", 310: "\uf01c", 311: "\uf01c", 312: "\uf01c",
+    313: "\uf01c", 314: "\uf01c", 321: "\uf01c",
+    # Rain
+    500: "\uf01c", 501: "\uf019", 502: "\uf019", 503: "\uf019", 504: "\uf019", 511: "\uf017",
+    520: "\uf01a", 521: "\uf01a", 522: "\uf01a", 531: "\uf01d",
+    # Snow
+    600: "\uf01b", 601: "\uf01b", 602: "\uf0b5", 611: "\uf017", 612: "\uf017", 613: "\uf017",
+    615: "\uf017", 616: "\uf017", 620: "\uf017", 621: "\uf01b", 622: "\uf01b",
+    # Atmosphere: mist, smoke, haze, dust, fog, sand, dust, ash, squalls, tornado
+    701: "\uf01a", 711: "\uf062", 721: "\uf0b6", 731: "\uf063", 741: "\uf014", 751: "\uf082",
+    761: "\uf063", 762: "\uf0c8", 771: "\uf011", 781: "\uf056",
+    # Clouds
+    804: "\uf013",
+}
+
+# Clear & partly cloudy skies look different by day and night
+DAY_ICONS: dict[int, str] = {800: "\uf00d", 801: "\uf002", 802: "\uf002", 803: "\uf002"}
+NIGHT_ICONS: dict[int, str] = {800: "\uf02e", 801: "\uf086", 802: "\uf086", 803: "\uf086"}
+
+UNKNOWN_ICON = "\uf07b"  # "N/A"
+
+
+class WeatherFetchError(Exception):
+    """OpenWeatherMap couldn't be queried. The message never includes the request URL, which holds the API key."""
+
+
+class RedactApiKey(logging.Filter):
+    """Hides `appid=...` in log messages, e.g. the request URLs httpx logs at INFO"""
+
+    APPID = re.compile(r"(appid=)[^&\s\"']+")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if "appid=" in message:
+            record.msg, record.args = self.APPID.sub(r"\1<redacted>", message), ()
+        return True
+
+
+logging.getLogger("httpx").addFilter(RedactApiKey())
+
+
+def weather_icon(condition_id: int, is_day: bool = True) -> str:  # noqa: FBT001, FBT002
+    """The weathericons glyph for an OWM condition code"""
+    icons = DAY_ICONS if is_day else NIGHT_ICONS
+    return icons.get(condition_id) or WEATHER_ICONS.get(condition_id, UNKNOWN_ICON)
+
+
+class Weather(BaseModel):
+    """Current conditions: just the parts the dashboard shows"""
+
+    temperature: float
+    description: str
+    condition_id: int
+    is_day: bool = True
+
+    @property
+    def icon(self) -> str:
+        return weather_icon(self.condition_id, self.is_day)
+
+    @property
+    def text(self) -> str:
+        return f"{self.description.capitalize()} | {round(self.temperature)}º"
+
+    @classmethod
+    def from_owm(cls, data: dict) -> "Weather":
+        current = data["current"]
+        condition = current["weather"][0]
+        return cls(
+            temperature=current["temp"],
+            description=condition["description"],
+            condition_id=condition["id"],
+            is_day=not condition.get("icon", "").endswith("n"),
+        )
+
 
 class OWMModule:
-    def __init__(self, api_key: str):
+    """
+    Requests go through the caller's `httpx.AsyncClient`, so they share its pooled connections.
+    If `cache_dir` is given, each location's weather is kept there for `ttl` seconds, surviving restarts.
+    """
+
+    def __init__(self, api_key: str, cache_dir: Optional[Path] = None, ttl: float = 3600):
         self.api_key = api_key
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    async def get_weather(self, http: httpx.AsyncClient, lat: float, lon: float) -> Weather:
+        weather = self.read_cache(lat, lon)
+        if weather is not None:
+            return weather
+
+        weather = await self.get_owm_weather(http, lat, lon)
+        self.write_cache(lat, lon, weather)
+
+        return weather
+
+    async def get_owm_weather(self, http: httpx.AsyncClient, lat: float, lon: float) -> Weather:
+        logger.debug("Querying OpenWeatherMap.")
+        params = {"lat": lat, "lon": lon, "appid": self.api_key, "exclude": EXCLUDE, "units": "metric"}
+        try:
+            response = await http.get(OWM_URL, params=params)
+            response.raise_for_status()
+            return Weather.from_owm(response.json())
+        except httpx.HTTPStatusError as e:
+            # httpx's own message (and so any traceback) includes the URL, and with it the API key
+            err = f"Failed to get weather: OpenWeatherMap returned {e.response.status_code}"
+        except httpx.HTTPError as e:
+            err = f"Failed to get weather: {type(e).__name__}"
+        except Exception:
+            logger.exception("Failed to get weather.")
+            raise
+
+        logger.error(err)
+        raise WeatherFetchError(err) from None
+
+    def cache_path(self, lat: float, lon: float) -> Path:
+        return self.cache_dir / f"{lat:.4f}_{lon:.4f}.json"
+
+    def read_cache(self, lat: float, lon: float) -> Optional[Weather]:
+        """The cached weather for this location, if it's less than `ttl` seconds old"""
+        if self.cache_dir is None:
+            return None
+
+        try:
+            cached = json.loads(self.cache_path(lat, lon).read_text())
+            fetched_at = datetime.fromisoformat(cached["fetched_at"])
+            weather = Weather(**cached["weather"])
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, TypeError, ValueError, ValidationError):
+            logger.warning("Ignoring unreadable cached weather")
+            return None
+
+        if (datetime.now(tz=timezone.utc) - fetched_at).total_seconds() >= self.ttl:
+            return None
+
+        return weather
+
+    def write_cache(self, lat: float, lon: float, weather: Weather) -> None:
+        if self.cache_dir is None:
+            return
 
-    def get_owm_weather(self, lat: float, lon: float, cache: bool = False):
-        url = f"https://api.openweathermap.org/data/3.0/onecall \
-                ?lat={lat}&lon={lon}&appid={self.api_key} \
-                &exclude=minutely,alerts&units=metric"
-        response = requests.get(url, timeout=30)
-        data = json.loads(response.text)
-        curr_weather = data["current"]
-        hourly_forecast = data["hourly"]
-        # print(json.dumps(curr_weather, indent=2))
-        daily_forecast = data["daily"]
-        # print(json.dumps(forecast, indent=2))
-        results = {
-            "current_weather": curr_weather,
-            "hourly_forecast": hourly_forecast,
-            "daily_forecast": daily_forecast,
-        }
-
-        if cache:
-            cache = json.dumps(results)
-            with open("weather.json", "w") as weather_file:
-                weather_file.write(cache)
-
-        return results
-
-    def get_weather(self, lat: float, lon: float, from_cache: bool = False):
-        current_weather, daily_forecast = {}, {}
-
-        if from_cache:
-            with open("weather.json") as weather_file:
-                weather_results = json.load(weather_file)
-        else:
-            weather_results = self.get_owm_weather(lat, lon)
-
-        current_weather = weather_results["current_weather"]
-        hourly_forecast = weather_results["hourly_forecast"]
-        daily_forecast = weather_results["daily_forecast"]
-
-        """
-        print("Current weather is %s, and the temperature is %s." % (
-            string.capwords(current_weather["weather"][0]["description"]), current_weather["temp"]))
-
-        print("")
-        dt = datetime.datetime.fromtimestamp(hourly_forecast[1]["dt"])
-        print("Next Hour: " + dt.strftime("%m/%d/%Y, %H:%M:%S"))
-        print("Type: " + string.capwords(hourly_forecast[1]["weather"][0]["description"]))
-        print("Temp: " + str(round(hourly_forecast[1]["temp"])))
-        print("Chance of Rain: " + str(hourly_forecast[1]["pop"] * 100) + "%")
-
-        for i in range(3):
-            print("")
-            dt = datetime.datetime.fromtimestamp(daily_forecast[i]["dt"])
-            print("Date: " + dt.strftime("%m/%d/%Y, %H:%M:%S"))
-            print("Type: " + string.capwords(daily_forecast[i]["weather"][0]["description"]))
-            print("Min: " + str(round(daily_forecast[i]["temp"]["min"])))
-            print("Max: " + str(round(daily_forecast[i]["temp"]["max"])))
-            print("Chance of Rain: " + str(daily_forecast[i]["pop"] * 100) + "%")
-        """
-
-        return current_weather, hourly_forecast, daily_forecast
+        cached = {"fetched_at": datetime.now(tz=timezone.utc).isoformat(), "weather": weather.model_dump()}
+        try:
+            write_atomic(self.cache_path(lat, lon), json.dumps(cached).encode())
+        except OSError:
+            logger.exception("Failed to cache weather")
@@ -0,0 +1,394 @@
+"""
+Sources of dashboard data: calendar events, tasks, weather...
+
+Each source is a `Provider`, whose `fetch` the App awaits alongside every other provider's.
+To add a source, subclass `Provider` (or `ActivityProvider`, for things shown in the day columns)
+and decorate it with `@register`; it will be used whenever its configuration is present.
+Providers with a `cache` config are wrapped in a `CachedProvider`, so a slow or failing source
+doesn't hold up or break the dashboard.
+"""
+
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from time import monotonic
+from typing import Any, ClassVar, Generic, Optional, TypeVar
+
+import httpx
+from pydantic import SecretStr
+
+from server.activity import Activity, activity_sort_key
+from server.cal import Calendar
+from server.calendar_plugins.gcal import GCal
+from server.config import AppConfig, CalendarConfig, DataCacheConfig, TasksConfig, WeatherConfig
+from server.metrics import CACHE_LOOKUPS, FETCH_SECONDS
+from server.owm import OWMModule, Weather
+from server.todoist import TodoistClient
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Provider(ABC, Generic[T]):
+    """
+    A source of dashboard data, created once and kept for the life of the App.
+
+    `fetch` is given the App's shared `httpx.AsyncClient`, which should be used for any HTTP requests,
+    so that every provider reuses the same pooled, kept-alive connections.
+    Providers built on blocking SDKs run them with `asyncio.to_thread` instead.
+    """
+
+    name: ClassVar[str]
+    kind: ClassVar[str] = "data"
+    required: ClassVar[bool] = True  # if False, the dashboard is rendered without this source when it fails
+    cache: Optional[DataCacheConfig] = None
+
+    @classmethod
+    @abstractmethod
+    def from_config(cls, config: AppConfig) -> Optional["Provider"]:
+        """The provider described by `config`, or None if this source isn't configured."""
+
+    @abstractmethod
+    async def fetch(self, http: httpx.AsyncClient, current_date: datetime) -> T:
+        ...
+
+    async def aclose(self) -> None:
+        """Release anything kept between fetches."""
+
+    def stale_since(self) -> Optional[datetime]:
+        """
+        If the last fetch returned old or incomplete data because (part of) an update failed,
+        when complete data was last fetched
+        """
+        return None
+
+    def dump(self, value: T) -> Any:
+        """`value` as JSON-compatible data, for saving to disk. Override if `fetch` returns anything else."""
+        return value
+
+    def load(self, data: Any) -> T:
+        """The inverse of `dump`"""
+        return data
+
+
+class ActivityProvider(Provider[list[Activity]]):
+    """
+    Provides activities (events, tasks...) to show under each day.
+    `fetch` returns them in `activity_sort_key` order, so the App can merge providers' activities without sorting.
+    """
+
+    kind = "activities"
+
+    def dump(self, value: list[Activity]) -> list[dict]:
+        return [a.model_dump(mode="json") for a in value]
+
+    def load(self, data: list[dict]) -> list[Activity]:
+        return [Activity.model_validate(a) for a in data]
+
+
+class CachedProvider(Provider[T]):
+    """
+    Stale-while-revalidate cache around another provider.
+
+    For `fresh_ttl` seconds after a successful fetch, the cached value is returned without any I/O.
+    Until `stale_ttl`, it's still returned straight away, while an update runs in the background.
+    After that, callers wait for the update; but for no longer than `fetch_timeout` if there's
+    an older value to fall back on. Any failed update, in the background or not, marks the cached value
+    as stale in `stale_since`, until an update succeeds. So does the wrapped provider reporting an incomplete
+    result, which is then only treated as fresh until the next fetch.
+    Errors are only raised if there's nothing cached at all.
+    """
+
+    def __init__(self, provider: Provider[T], cache: DataCacheConfig):
+        self.provider = provider
+        self.name = provider.name
+        self.kind = provider.kind
+        self.required = provider.required
+        self.cache = cache
+
+        self._value: Optional[T] = None
+        self._fetched_at: Optional[float] = None  # monotonic
+        self._fetched_time: Optional[datetime] = None
+        self._falling_back = False
+        self._update: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, _config: AppConfig) -> None:
+        return None
+
+    def age(self) -> Optional[float]:
+        """Seconds since the cached value was fetched, or None if nothing's cached"""
+        return None if self._fetched_at is None else monotonic() - self._fetched_at
+
+    async def fetch(self, http: httpx.AsyncClient, current_date: datetime) -> T:
+        age = self.age()
+        if age is not None and age < self.cache.fresh_ttl:
+            CACHE_LOOKUPS.labels(cache=self.name, result="fresh").inc()
+            return self._value
+
+        update = self._start_update(http, current_date)
+
+        if age is not None and age < self.cache.stale_ttl:
+            msg = f"Using {self.name} from {age:.0f}s ago while it updates"
+            logger.debug(msg)
+            CACHE_LOOKUPS.labels(cache=self.name, result="stale").inc()
+            return self._value
+
+        CACHE_LOOKUPS.labels(cache=self.name, result="miss").inc()
+        if age is None:
+            return await asyncio.shield(update)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(update), timeout=self.cache.fetch_timeout)
+        except Exception as e:  # noqa: BLE001
+            msg = f"Couldn't update {self.name} ({type(e).__name__}); using data from {age:.0f}s ago"
+            logger.warning(msg)
+            CACHE_LOOKUPS.labels(cache=self.name, result="fallback").inc()
+            self._falling_back = True
+            return self._value
+
+    def _start_update(self, http: httpx.AsyncClient, current_date: datetime) -> asyncio.Task:
+        """Fetch from the wrapped provider, unless that's already under way"""
+        if self._update is None or self._update.done():
+            self._update = asyncio.get_running_loop().create_task(self._fetch_and_store(http, current_date))
+            # Background updates can fail with no one waiting on them; that's logged, not raised
+            self._update.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self._update
+
+    async def _fetch_and_store(self, http: httpx.AsyncClient, current_date: datetime) -> T:
+        try:
+            value = await timed_fetch(self.provider, http, current_date)
+        except Exception:
+            msg = f"Failed to fetch {self.name}"
+            logger.exception(msg)
+            self._falling_back = self._fetched_time is not None
+            raise
+
+        self._value = value
+        self._fetched_at = monotonic()
+        self._fetched_time = datetime.now(tz=timezone.utc)
+        self._falling_back = False
+
+        if self.provider.stale_since() is not None:
+            # Incomplete: keep serving it, but try again on the next fetch
+            self._fetched_at -= self.cache.fresh_ttl
+
+        return value
+
+    def stale_since(self) -> Optional[datetime]:
+        # A failed update leaves the provider's report describing the cached value, so both apply
+        times = [self._fetched_time if self._falling_back else None, self.provider.stale_since()]
+        return min((t for t in times if t is not None), default=None)
+
+    def dump(self, value: T) -> Any:
+        return self.provider.dump(value)
+
+    def load(self, data: Any) -> T:
+        return self.provider.load(data)
+
+    def export(self) -> Optional[tuple[datetime, Any]]:
+        """When the cached value was fetched, and the value as JSON-compatible data. None if nothing's cached."""
+        if self._fetched_time is None:
+            return None
+        return self._fetched_time, self.dump(self._value)
+
+    def restore(self, fetched_at: datetime, data: Any) -> None:
+        """Seed the cache with data saved by `export`, e.g. before a restart. It ages from `fetched_at`."""
+        if self._fetched_time is not None:
+            return
+
+        age = max(0.0, (datetime.now(tz=timezone.utc) - fetched_at).total_seconds())
+        self._value = self.load(data)
+        self._fetched_time = fetched_at
+        self._fetched_at = monotonic() - age
+
+    async def aclose(self) -> None:
+        if self._update is not None and not self._update.done():
+            self._update.cancel()
+        await self.provider.aclose()
+
+
+async def timed_fetch(provider: Provider[T], http: httpx.AsyncClient, current_date: datetime) -> T:
+    """`provider.fetch`, recording how long it took (failures included) in the fetch metrics"""
+    with FETCH_SECONDS.labels(source=provider.name).time():
+        return await provider.fetch(http, current_date)
+
+
+PROVIDERS: list[type[Provider]] = []
+
+
+def register(cls: type[Provider]) -> type[Provider]:
+    PROVIDERS.append(cls)
+    return cls
+
+
+def build_providers(config: AppConfig) -> list[Provider]:
+    """An instance of every registered provider which is configured, cached if it has a cache config"""
+    providers = [p for p in (cls.from_config(config) for cls in PROVIDERS) if p is not None]
+    providers = [p if p.cache is None else CachedProvider(p, p.cache) for p in providers]
+
+    msg = f"Data providers: {', '.join(p.name for p in providers) or 'none'}"
+    logger.debug(msg)
+
+    return providers
+
+
+async def fetch_all(
+    providers: list[Provider], http: httpx.AsyncClient, current_date: datetime
+) -> dict[str, Any]:
+    """
+    Fetch from every provider at once. Results are keyed by provider name.
+    A provider which isn't `required` gives None if it fails; any other failure is raised.
+    """
+    results = await asyncio.gather(
+        *(
+            p.fetch(http, current_date) if isinstance(p, CachedProvider) else timed_fetch(p, http, current_date)
+            for p in providers
+        ),
+        return_exceptions=True,
+    )
+
+    fetched = {}
+    for p, result in zip(providers, results):
+        if not isinstance(result, BaseException):
+            fetched[p.name] = result
+        elif p.required or not isinstance(result, Exception):
+            raise result
+        else:
+            msg = f"Rendering without {p.name}: {type(result).__name__}"
+            logger.warning(msg)
+            fetched[p.name] = None
+    return fetched
+
+
+@register
+class GoogleCalendarProvider(ActivityProvider):
+    name = "calendar"
+
+    def __init__(self, config: CalendarConfig):
+        self.config = config
+        self.cache = config.cache
+        self._gcal: Optional[GCal] = None
+        self._gcal_lock = threading.Lock()
+        self._complete_time: Optional[datetime] = None  # when every calendar was last fetched
+        self._incomplete_time: Optional[datetime] = None  # when the last fetch was, if some calendars failed
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> Optional["GoogleCalendarProvider"]:
+        return None if config.calendar is None else cls(config.calendar)
+
+    async def fetch(self, _http: httpx.AsyncClient, current_date: datetime) -> list[Activity]:
+        return await asyncio.to_thread(self.get_appointments, current_date)
+
+    def get_appointments(self, current_date: datetime) -> list[Activity]:
+        config = self.config
+
+        calendar_ids = config.ids.values()
+        credentials = config.creds
+
+        # TODO: do I really need a Calendar object? It doesn't do much any more
+        cal = Calendar(
+            credentials=credentials,
+            calendar_ids=calendar_ids,
+            current_date=current_date,
+            days_to_show=config.days_to_show,
+        )
+
+        events = cal.get_events_cal(client=self.gcal)
+
+        now = datetime.now(tz=timezone.utc)
+        if self.gcal.last_fetch_errors:
+            msg = f"Showing events without calendars {', '.join(self.gcal.last_fetch_errors)}"
+            logger.warning(msg)
+            self._incomplete_time = now
+        else:
+            self._complete_time = now
+            self._incomplete_time = None
+
+        return events
+
+    def stale_since(self) -> Optional[datetime]:
+        """If some calendars failed last time, when every calendar was last fetched (or if never, the last fetch)"""
+        if self._incomplete_time is None:
+            return None
+        return self._complete_time or self._incomplete_time
+
+    async def aclose(self) -> None:
+        if self._gcal is not None:
+            await asyncio.to_thread(self._gcal.close)
+
+    @property
+    def gcal(self) -> GCal:
+        """A single Google Calendar session, created on first use and shared by every fetch"""
+        with self._gcal_lock:
+            if self._gcal is None:
+                config = self.config
+                self._gcal = GCal(
+                    config.creds,
+                    calendar_list_ttl=config.calendar_list_ttl,
+                    max_concurrent_fetches=config.max_concurrent_fetches,
+                    incremental_sync=config.incremental_sync,
+                )
+            return self._gcal
+
+
+@register
+class TodoistProvider(ActivityProvider):
+    name = "tasks"
+
+    def __init__(self, config: TasksConfig, api_key: SecretStr, days_to_show: int = 2):
+        self.config = config
+        self.cache = config.cache
+        self.days_to_show = days_to_show
+        self.client = TodoistClient(
+            api_key,
+            collaborator_ttl=config.collaborator_ttl,
+            incremental_sync=config.incremental_sync,
+        )
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> Optional["TodoistProvider"]:
+        if config.tasks is None or "todoist" not in (config.api_keys or {}):
+            return None
+
+        days_to_show = config.calendar.days_to_show if config.calendar is not None else 2
+        return cls(config.tasks, config.api_keys["todoist"], days_to_show)
+
+    async def fetch(self, http: httpx.AsyncClient, current_date: datetime) -> list[Activity]:
+        date_end = current_date + timedelta(days=self.days_to_show)
+        tasks = await self.client.get_tasks(http, project_id=self.config.project_id, date_end=date_end)
+        return sorted(tasks, key=activity_sort_key)
+
+
+@register
+class OpenWeatherMapProvider(Provider[Weather]):
+    """Current weather. Also cached on disk per location, so restarts & re-renders don't cost API calls."""
+
+    name = "weather"
+    kind = "weather"
+    required = False  # only decoration: not worth failing the dashboard over
+
+    def __init__(self, config: WeatherConfig, api_key: SecretStr, cache_dir: Optional[Path] = None):
+        self.config = config
+        self.cache = config.cache
+        self.owm = OWMModule(api_key.get_secret_value(), cache_dir=cache_dir, ttl=config.cache.fresh_ttl)
+
+    @classmethod
+    def from_config(cls, config: AppConfig) -> Optional["OpenWeatherMapProvider"]:
+        if config.weather is None or "owm_api_key" not in (config.api_keys or {}):
+            return None
+        cache_dir = Path(config.server.server_dir) / "weather"
+        return cls(config.weather, config.api_keys["owm_api_key"], cache_dir)
+
+    async def fetch(self, http: httpx.AsyncClient, _current_date: datetime) -> Weather:
+        return await self.owm.get_weather(http, self.config.latitude, self.config.longitude)
+
+    def dump(self, value: Weather) -> dict:
+        return value.model_dump()
+
+    def load(self, data: dict) -> Weather:
+        return Weather.model_validate(data)
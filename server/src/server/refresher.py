@@ -0,0 +1,148 @@
+import asyncio
+import contextlib
+import logging
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timezone
+from typing import Optional
+
+from server.render import RenderedImage
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardSnapshot(RenderedImage):
+    """The most recently rendered dashboard, ready to be served."""
+
+    rendered_at: datetime
+
+    @property
+    def age_seconds(self) -> int:
+        return int((datetime.now(tz=timezone.utc) - self.rendered_at).total_seconds())
+
+
+class DashboardRefresher:
+    """
+    Re-renders the dashboard in a background task every `interval` seconds and keeps
+    the latest image in memory, so requests never wait on Google or Todoist.
+
+    A failed refresh keeps the previous image; the failure is reported via `headers()`.
+    `on_refresh` is called (in a worker thread) with each new snapshot, e.g. to save it.
+    """
+
+    def __init__(
+        self,
+        render: Callable[[], Awaitable[RenderedImage]],
+        interval: float,
+        on_refresh: Optional[Callable[[DashboardSnapshot], None]] = None,
+    ):
+        self._render = render
+        self.interval = interval
+        self._on_refresh = on_refresh
+
+        self._snapshot: Optional[DashboardSnapshot] = None
+        self._last_error: Optional[str] = None
+        self._failures = 0
+
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def _refresh_lock(self) -> asyncio.Lock:
+        # Created on first use, from within the event loop: on Python 3.9 a lock binds to the loop current at creation
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def snapshot(self) -> Optional[DashboardSnapshot]:
+        return self._snapshot
+
+    async def refresh(self) -> DashboardSnapshot:
+        """Render now, replacing the stored snapshot. Raises if rendering fails."""
+        async with self._refresh_lock:
+            try:
+                rendered = await self._render()
+            except Exception as e:
+                self._failures += 1
+                self._last_error = f"{type(e).__name__}: {e}"
+                raise
+
+            return await self.publish(rendered)
+
+    async def publish(self, rendered: RenderedImage) -> DashboardSnapshot:
+        """Replace the stored snapshot with an image rendered elsewhere, e.g. alongside another dashboard."""
+        self._snapshot = DashboardSnapshot(**dict(rendered), rendered_at=datetime.now(tz=timezone.utc))
+        self._last_error = None
+        self._failures = 0
+
+        if self._on_refresh is not None:
+            try:
+                await asyncio.to_thread(self._on_refresh, self._snapshot)
+            except Exception:
+                logger.exception("Failed to handle refreshed dashboard")
+
+        return self._snapshot
+
+    def restore(self, snapshot: DashboardSnapshot) -> None:
+        """Serve `snapshot` (e.g. saved before a restart) until the first refresh, unless there's already one."""
+        if self._snapshot is None:
+            self._snapshot = snapshot
+
+    async def get(self) -> DashboardSnapshot:
+        """Returns the latest snapshot, rendering one first if nothing has been rendered yet."""
+        if self._snapshot is None:
+            async with self._refresh_lock:
+                pass  # wait for any refresh already in progress
+            if self._snapshot is None:
+                return await self.refresh()
+
+        return self._snapshot
+
+    def headers(self) -> dict[str, str]:
+        headers = {}
+
+        snapshot = self._snapshot
+        if snapshot is not None:
+            headers["X-Dashboard-Rendered-At"] = snapshot.rendered_at.isoformat(timespec="seconds")
+            headers["X-Dashboard-Age"] = str(snapshot.age_seconds)
+
+        if self._failures > 0:
+            headers["X-Dashboard-Refresh-Failures"] = str(self._failures)
+            headers["X-Dashboard-Refresh-Error"] = header_safe(self._last_error)
+
+        return headers
+
+    def start(self) -> None:
+        """Start refreshing in the background. Must be called from within the server's event loop."""
+        if self._task is not None:
+            return
+
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="dashboard-refresher")
+
+        msg = f"Started background refresh every {self.interval}s"
+        logger.info(msg)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                logger.debug("Background refresh complete")
+            except Exception:
+                logger.exception("Background refresh failed; keeping previous image.")
+
+            await asyncio.sleep(self.interval)
+
+
+def header_safe(text: str, max_length: int = 200) -> str:
+    """HTTP header values must be a single line of latin-1."""
+    first_line = text.splitlines()[0] if text else ""
+    return first_line.encode("latin-1", errors="replace").decode("latin-1")[:max_length]
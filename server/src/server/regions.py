@@ -0,0 +1,100 @@
+"""
+Works out which parts of the dashboard changed since a device last downloaded it,
+so the device can refresh just those regions of its e-ink panel.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from server.encode import decode_image
+from server.render import RenderedImage
+
+# (left, top, right, bottom) in image pixels; right & bottom are exclusive, as for PIL
+Box = tuple[int, int, int, int]
+
+
+def changed_regions(previous: np.ndarray, current: np.ndarray, max_gap: int = 8, max_regions: int = 16) -> list[Box]:
+    """
+    Bounding boxes of the pixels that differ between two greyscale images of the same shape.
+
+    Changed rows are grouped into horizontal bands (bands closer than `max_gap` rows are merged,
+    as one slightly larger refresh is cheaper than two), and each band gets the box of its changed columns.
+    If there would be more than `max_regions` boxes, a single box covering all changes is returned instead.
+    """
+    mask = previous != current
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return []
+
+    # Split the changed rows wherever the gap to the next changed row is too big
+    breaks = np.flatnonzero(np.diff(rows) > max_gap + 1)
+    band_starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+    band_ends = np.concatenate((rows[breaks], [rows[-1]])) + 1
+
+    if band_starts.size > max_regions:
+        band_starts, band_ends = band_starts[:1], band_ends[-1:]
+
+    boxes = []
+    for top, bottom in zip(band_starts, band_ends):
+        cols = np.flatnonzero(mask[top:bottom].any(axis=0))
+        boxes.append((int(cols[0]), int(top), int(cols[-1]) + 1, int(bottom)))
+
+    return boxes
+
+
+def format_regions(boxes: Optional[list[Box]]) -> str:
+    """For a response header. "full" means the whole screen should be redrawn."""
+    if boxes is None:
+        return "full"
+    return ";".join(",".join(str(v) for v in box) for box in boxes)
+
+
+class RegionTracker:
+    """
+    Remembers the last image served to each device, to report what changed in the next one.
+    Only the most recently seen `max_devices` devices are remembered.
+    """
+
+    def __init__(self, max_devices: int = 8):
+        self.max_devices = max_devices
+        self._devices: OrderedDict[str, tuple[bytes, np.ndarray, Optional[list[Box]]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, device: str, rendered: RenderedImage) -> Optional[list[Box]]:
+        """
+        Record that `device` was sent `rendered`.
+        Returns the changed regions, or None if the whole screen needs redrawing.
+        """
+        # Not the ETag: that can ignore the "Refreshed" time, and we need every pixel
+        image_hash = hashlib.blake2b(rendered.image, digest_size=16).digest()
+
+        with self._lock:
+            previous = self._devices.get(device)
+
+        if previous is not None and previous[0] == image_hash:
+            current, boxes = previous[1], []
+        else:
+            current = np.asarray(decode_image(rendered))
+
+            if previous is None or previous[1].shape != current.shape:
+                boxes = None
+            else:
+                boxes = changed_regions(previous[1], current)
+
+        with self._lock:
+            self._devices[device] = (image_hash, current, boxes)
+            self._devices.move_to_end(device)
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+
+        return boxes
+
+    def last_changes(self, device: str) -> Optional[list[Box]]:
+        """The regions reported with the last image sent to `device` (None: redraw everything)"""
+        with self._lock:
+            previous = self._devices.get(device)
+        return None if previous is None else previous[2]
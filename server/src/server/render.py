@@ -1,16 +1,24 @@
+import hashlib
 import io
 import logging
 
 # if TYPE_CHECKING:
 from datetime import datetime
+from functools import lru_cache
 from os import listdir
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 from PIL import Image, ImageDraw, ImageFont
 from pydantic import BaseModel, Field, NonNegativeInt, PositiveFloat, PositiveInt, PrivateAttr
 
 from server.activity import Activity
+from server.layout import LayoutItem, LayoutPlan, LineItem, TextItem, column_bounds
+from server.metrics import STAGE_SECONDS
+from server.textmeasure import TextMeasurer
+
+if TYPE_CHECKING:
+    from server.owm import Weather
 
 """
 TODO:
@@ -21,51 +29,68 @@ logger = logging.getLogger(__name__)
 
 script_dir = Path(__file__).resolve().parent
 
+# Enough for every (font, size) combination a dashboard uses, with headroom for a few layouts.
+FONT_CACHE_SIZE = 32
+
 class Font:
     """
     An abstraction over PIL's ImageFont.
     - Allows easier interrogation & reuse of calculated height.
     - Allows fonts to draw themselves, rather than passing around ImageFonts.
-    """
 
-    def __init__(self, draw: ImageDraw, file: Path, size: int):
-        self._draw = draw
+    Fonts aren't tied to a particular image: the drawing surface is passed in on each write,
+    so a single loaded font (see `load_font`) can be shared by every render.
+    """
 
+    def __init__(self, file: Path, size: int):
         f = ImageFont.truetype(str(file), size)
         self._font = f
-        self._height = f.getbbox("lq")[
-            3
-        ]  # max height for a line of this size, not its actual height
+        self._measure = TextMeasurer(f)
+        self._height = self._measure.height("lq")  # max height for a line of this size, not its actual height
 
     def width(self, text: str) -> int:
-        return self._font.getbbox(text)[2]
+        return self._measure.width(text)
 
     def height(self, text: Optional[str] = None) -> int:
         if text is None:
             return self._height
 
-        return self._font.getbbox(text)[3]
+        return self._measure.height(text)
 
     def size(self, text: str) -> int:
         return self.width(text), self.height(text)
 
+    def truncate(self, text: str, max_width: int) -> str:
+        return self._measure.truncate(text, max_width)
+
     def write(
         self,
+        draw: ImageDraw,
         position: tuple,
         text: str,
         colour: str = "black",
         anchor: Optional[str] = None,
     ) -> None:
-        self._draw.text(position, text, font=self._font, fill=colour, anchor=anchor)
+        draw.text(position, text, font=self._font, fill=colour, anchor=anchor)
 
     def image_font(self) -> ImageFont:
         return self._font
 
 
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(file: Path, size: int) -> Font:
+    """
+    Parsing a .ttf is slow on a Raspberry Pi, so loaded fonts are shared process-wide.
+    Keyed by (file, size); the least recently used font is dropped once the cache is full.
+    """
+    msg = f"Loading font {file.name} at size {size}"
+    logger.debug(msg)
+    return Font(file, size)
+
+
 class FontFactory:
     def __init__(
         self,
-        draw: ImageDraw,
         font_dir: Optional[Path] = None,
         font_map: Optional[dict[str]] = None,
     ):
@@ -75,7 +100,7 @@ class FontFactory:
             current_path = Path(__file__).parent.absolute()
             self.font_dir = current_path / "font"
         else:
-            self.font_dir = font_dir
+            self.font_dir = Path(font_dir)
 
         if font_map is None:
             # Just use the file names as the alias
@@ -85,8 +110,6 @@ class FontFactory:
         else:
             self.font_map = font_map
 
-        self.draw = draw
-
         # example:
         # font_map = {
         #         "light": "Lexend-Light.ttf",
@@ -96,7 +119,7 @@ class FontFactory:
         #         "weather": "weathericons-regular-webfont.ttf"
         # }
 
-    def get(self, name: str, size: Optional[int] = None):
+    def get(self, name: str, size: Optional[int] = None) -> Font:
         if size is None:
             size = self.default_size
 
@@ -106,7 +129,46 @@ class FontFactory:
 
         font_file = self.font_dir / self.font_map[name]
 
-        return Font(self.draw, font_file, size)
+        return load_font(font_file, size)
+
+
+# Image.rotate's right angles (anticlockwise), as lossless transposes
+RIGHT_ANGLE_TRANSPOSES = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+def rotate(image: Image.Image, angle: int) -> Image.Image:
+    """
+    `image` rotated anticlockwise by `angle` degrees, expanded to fit, like `Image.rotate(angle, expand=True)`.
+    No rotation returns `image` itself, and right angles only move pixels, so neither copies & resamples the frame.
+    """
+    angle %= 360
+    if angle == 0:
+        return image
+
+    transpose = RIGHT_ANGLE_TRANSPOSES.get(angle)
+    if transpose is not None:
+        return image.transpose(transpose)
+
+    return image.rotate(angle, expand=True)
+
+
+class RenderedImage(BaseModel):
+    """An encoded dashboard image, plus a fingerprint of what it shows."""
+
+    image: bytes
+    digest: str = Field(description="Hash of what the image shows, independent of how it's encoded")
+    encoding: str = Field(default="png", description="Tag identifying how the image was encoded")
+    media_type: str = "image/png"
+    framebuffer: Optional[str] = Field(
+        default=None, description="For raw framebuffer images, which device's layout. None for PNGs"
+    )
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest}-{self.encoding}"'
 
 
 class Renderer(BaseModel):
@@ -119,7 +181,7 @@ class Renderer(BaseModel):
 
     # Optional fields
     background_colour: str = Field(default="white")
-    fonts_file_dir: str = Field(
+    fonts_file_dir: Path = Field(
         default = script_dir / "font",
         description="Path to directory containing .ttf fonts",
     )
@@ -139,7 +201,7 @@ class Renderer(BaseModel):
         default=1.1,
         description="Multiple of height to space apart bullet points.")
 
-    bullet_formats: str = Field(
+    bullet_formats: dict[str, str] = Field(
         default={"event": "•", "task": ">"},
         description="Bullet point markers. Can be an empty string."
     )
@@ -157,223 +219,347 @@ class Renderer(BaseModel):
         description="Angle in degrees to rotate the image after rendering. Useful for multiple-column layouts?",
     )
 
+    columns: PositiveInt = Field(
+        default=1, description="Columns to flow activities into, left to right, once one is full"
+    )
+    column_gap: NonNegativeInt = Field(default=50, description="Horizontal pixels between columns")
+
     # Private fields computed post-init
-    _image: Image = PrivateAttr()
-    _draw: ImageDraw = PrivateAttr()
+    _image: Optional[Image.Image] = PrivateAttr(default=None)
     _ff: FontFactory = PrivateAttr()
+    _content_digest: Optional[str] = PrivateAttr(default=None)
+    _drawn_content: Optional[tuple[Image.Image, str]] = PrivateAttr(default=None)
 
     def model_post_init(self, __context) -> None:
-        self._image = Image.new("L", (self.image_width, self.image_height), self.background_colour)
-        self._draw = ImageDraw.Draw(self._image)
-        self._ff = FontFactory(self._draw, self.fonts_file_dir, self.font_style_map)
+        self._ff = FontFactory(self.fonts_file_dir, self.font_style_map)
 
     @staticmethod
     def truncate_with_ellipsis(text: str, max_width: int, font: Font) -> str:
-        if font.width(text) <= max_width:
-            return text
-
-        # Binary search to find the optimal truncation point
-        left = 0
-        right = len(text) - 1
-        while left <= right:
-            mid = (left + right) // 2
-            if font.width(text[:mid] + "...") <= max_width:
-                left = mid + 1
-            else:
-                right = mid - 1
-
-        return text[: left - 1] + "..."
+        return font.truncate(text, max_width)
 
-    def render_single_activity(
-        self, position: tuple[int], activity_text: str, bullet: str, font: Font, prefix: Optional[str] = None
-    ):
+    def plan_single_activity(
+        self, position: tuple[int], right: int, activity_text: str, bullet: str, prefix: Optional[str] = None
+    ) -> list[LayoutItem]:
         """
-        Writes a bullet-point, some grey text (prefix), then some black text (activity_text).
-        The black text is truncated with ... if it extends past the right-hand margin.
+        A bullet-point, some grey text (prefix), then some black text (activity_text).
+        The black text is truncated with ... if it would extend past `right`.
         """
+        font = self._ff.get("regular")
         x_0, y = position
+        items = []
 
-        # Write the bullet
+        # The bullet
         if len(bullet) > 0:
             bullet = bullet + " "
-            font.write((x_0, y), bullet)
+            items.append(TextItem(x=x_0, y=y, text=bullet, font="regular"))
 
             width_bullet = font.width(bullet)
         else:
             width_bullet = 0 # needed to know where to start writing the prefix
 
-        # Write the prefix text
+        # The prefix text
         x_prefix = x_0 + width_bullet
         if prefix is not None and len(prefix) > 0:
             prefix = prefix + " "
-            font.write((x_prefix, y), prefix, colour="gray")
+            items.append(TextItem(x=x_prefix, y=y, text=prefix, font="regular", colour="gray"))
 
             width_prefix = font.width(prefix)
         else:
             width_prefix = 0
 
-        # Write the main text
+        # The main text
         x_activity_text = x_prefix + width_prefix
-        max_width = self.image_width - (self.margin_x + x_activity_text)
         activity_text_truncated = self.truncate_with_ellipsis(
-            text=activity_text, max_width=max_width, font=font
+            text=activity_text, max_width=right - x_activity_text, font=font
         )
-        font.write((x_activity_text, y), activity_text_truncated)
+        items.append(TextItem(x=x_activity_text, y=y, text=activity_text_truncated, font="regular"))
 
-    def render_activities(self, section_title: str, events: list[Activity], y: int) -> int:
-        """Renders a section with a title and bullet points starting at the given y-coordinate."""
+        return items
 
+    def plan_section_title(self, section_title: str, y: int, left: int, right: int) -> list[LayoutItem]:
+        """
+        A grey title, centred between `left` and `right`, with lines either side.
+        The lines are left out if the column is too narrow for them.
+        """
+        title_width = self._ff.get("light").width(section_title)
+        title_pos_x = left + (right - left) // 2
+        line_gap = title_width // 2 + 50
+
+        items: list[LayoutItem] = [
+            TextItem(x=title_pos_x, y=y, text=section_title, font="light", colour="gray", anchor="mm")
+        ]
+        if title_pos_x - line_gap > left:
+            items.append(LineItem(x0=left, y0=y, x1=title_pos_x - line_gap, y1=y))
+            items.append(LineItem(x0=title_pos_x + line_gap, y0=y, x1=right, y1=y))
+        return items
+
+    def plan_activities(self, sections: list[tuple[str, list[Activity]]], y: int) -> LayoutPlan:
+        """
+        Sections of bullet points, each under a title, starting at the given y-coordinate.
+        When a column is full, activities carry on at the top of the next. Once the last column is full,
+        the rest (including any later sections) are summarised as "+ N more...".
+        Nothing is placed past the bottom margin: each row is measured before it's placed,
+        and the last column keeps a line free for the "+ N more..." until the final activity.
+        """
         event_title = self._ff.get("light")
-        event_regular = self._ff.get("regular")
-        event_nothing = self._ff.get("extralight")
-
-        # Title text
-        title_width = event_title.width(section_title)
-        title_pos_x = self.image_width // 2
-        event_title.write((title_pos_x, y), section_title, colour="gray", anchor="mm")
-
-        # Lines either side of title
-        left_line_x_start = self.margin_x
-        left_line_x_end = title_pos_x - (title_width // 2 + 50)
-        right_line_x_start = title_pos_x + (title_width // 2 + 50)
-        right_line_x_end = self.image_width - self.margin_x
-
-        self._draw.line(
-            [left_line_x_start, y, left_line_x_end, y], fill="gray", width=1
-        )
-        self._draw.line(
-            [right_line_x_start, y, right_line_x_end, y], fill="gray", width=1
-        )
-
-        y += event_title.height()  # Add spacing after the title
-
-        # Bullets
-        line_height = event_regular.height()
-
-        if len(events) == 0:
-            # Can show a message if nothing to display
-            text_nothing = ""
-            event_nothing.write(
-                (self.image_width / 2, y), text_nothing, colour="gray", anchor="ma"
-            )
-            y += line_height + 5
-            return y
-
-        for index, activity in enumerate(events):
-            # Stop rendering events if we're past the bottom margin
-            if y > self.image_height - self.margin_y:
-                remaining = len(events) - index
-                event_regular.write((self.margin_x, y), f"     + {remaining} more...")
-                break
-
-            text = activity.summary
-            time = activity.time_start_short
-            bullet = self.bullet_formats[activity.activity_type]
-
-            position = (self.margin_x, y)
-            if time is None:
-                self.render_single_activity(
-                    position=position,
-                    activity_text=text,
-                    bullet=bullet,
-                    font=event_regular
-                )
-            else:
-                self.render_single_activity(
-                    position=position,
+        line_height = self._ff.get("regular").height()
+        row_step = (line_height*self.activity_line_spacing) + 5  # Add spacing between bullet points
+
+        columns = column_bounds(self.margin_x, self.image_width - self.margin_x, self.columns, self.column_gap)
+        column = 0
+        left, right = columns[column]
+        y_top = y
+        y_bottom = self.image_height - self.margin_y
+        remaining = sum(len(events) for _, events in sections)
+
+        plan = LayoutPlan(width=self.image_width, height=self.image_height, background=self.background_colour)
+
+        def next_column() -> bool:
+            nonlocal column, left, right, y
+            if column + 1 == len(columns):
+                return False
+            column += 1
+            left, right = columns[column]
+            y = y_top
+            return True
+
+        def summarise_rest() -> LayoutPlan:
+            plan.overflow = remaining
+            # Clamped: after a section's spacing, y may be past where the overflow line fits
+            y_overflow = min(y, y_bottom - line_height)
+            plan.content.append(TextItem(x=left, y=y_overflow, text=f"     + {remaining} more...", font="regular"))
+            return plan
+
+        def row_fits() -> bool:
+            # In the last column, unless this is the last activity, the overflow line must fit below it too
+            if column + 1 == len(columns) and remaining > 1:
+                return y + row_step + line_height <= y_bottom
+            return y + line_height <= y_bottom
+
+        for section_title, events in sections:
+            # The title needs a line under it too (its first activity, or the overflow), or it'd be left alone
+            if y + event_title.height() + line_height > y_bottom and not next_column():
+                return summarise_rest()
+
+            plan.content.extend(self.plan_section_title(section_title, y, left, right))
+            y += event_title.height()  # Add spacing after the title
+
+            if len(events) == 0:
+                # Could show a message if nothing to display
+                y += line_height + 5
+                continue
+
+            for activity in events:
+                while not row_fits():
+                    if not next_column():
+                        return summarise_rest()
+
+                time = activity.time_start_short
+                plan.content.extend(self.plan_single_activity(
+                    position=(left, y),
+                    right=right,
+                    activity_text=activity.summary,
+                    bullet=self.bullet_formats[activity.activity_type],
                     prefix=time,
-                    activity_text=text,
-                    bullet=bullet,
-                    font=event_regular
-                )
+                ))
+                remaining -= 1
 
-            y += (line_height*self.activity_line_spacing) + 5  # Add spacing between bullet points
+                y += row_step
 
-        return y + self.space_between_sections
+            y += self.space_between_sections
 
-    def render_date(self, day: str, day_of_week: str, month: str):
-        date_num = self._ff.get("bold", 200)
-        date_rest = self._ff.get("regular")
+        return plan
 
-        date_num.write((self.margin_x, self.top_row_y), day, anchor="ls")
-        day_width = date_num.width(day)
+    def plan_date(self, day: str, day_of_week: str, month: str) -> list[LayoutItem]:
+        day_width = self._ff.get("bold", 200).width(day)
+        date_rest_height = self._ff.get("regular").height()
 
-        date_rest.write(
-            (self.margin_x + day_width + 10, self.top_row_y),
-            day_of_week,
-            colour="gray",
-            anchor="ls",
-        )
-        date_rest.write(
-            (self.margin_x + day_width + 10, self.top_row_y - date_rest.height()),
-            month,
-            colour="gray",
-            anchor="ls",
-        )
+        x_rest = self.margin_x + day_width + 10
+        return [
+            TextItem(x=self.margin_x, y=self.top_row_y, text=day, font="bold", size=200, anchor="ls"),
+            TextItem(x=x_rest, y=self.top_row_y, text=day_of_week, font="regular", colour="gray", anchor="ls"),
+            TextItem(
+                x=x_rest, y=self.top_row_y - date_rest_height, text=month, font="regular", colour="gray", anchor="ls"
+            ),
+        ]
 
-    # TODO: this won't currently work!
-    def render_weather(self, text: str, icon: str):
+    def plan_weather(self, text: str, icon: str) -> list[LayoutItem]:
         weather_icon = self._ff.get("weather", 150)
         weather_text = self._ff.get("regular")
 
-        weather_text.write(
-            (
-                self.image_width - self.margin_x - weather_text.width(text),
-                self.top_row_y,
+        return [
+            TextItem(
+                x=self.image_width - self.margin_x - weather_text.width(text),
+                y=self.top_row_y,
+                text=text,
+                font="regular",
+                colour="gray",
+                anchor="ls",
             ),
-            text,
-            colour="gray",
-            anchor="ls",
-        )
-        weather_icon.write(
-            (
-                self.image_width - self.margin_x - weather_icon.width(icon),
-                self.top_row_y - weather_text.height(),
+            TextItem(
+                x=self.image_width - self.margin_x - weather_icon.width(icon),
+                y=self.top_row_y - weather_text.height(),
+                text=icon,
+                font="weather",
+                size=150,
+                anchor="ls",
             ),
-            icon,
-            anchor="ls",
+        ]
+
+    def plan_last_updated(self, time: str) -> TextItem:
+        return TextItem(
+            x=self.image_width // 2,
+            y=self.image_height - 0.5 * self.margin_y,
+            text=f"Refreshed {time}",
+            font="regular",
+            size=20,
+            colour="gray",
+            anchor="ms",
         )
 
-    def render_last_updated(self, time: str):
-        text = f"Refreshed {time}"
-        f = self._ff.get("regular", 20)
-        f.write(
-            (self.image_width // 2, self.image_height - 0.5 * self.margin_y),
-            text,
+    def plan_stale_marker(self, text: str) -> TextItem:
+        """A small note above the footer, saying which data couldn't be updated"""
+        height = self._ff.get("regular", 20).height()
+        return TextItem(
+            x=self.image_width // 2,
+            y=self.image_height - 0.5 * self.margin_y - 1.5 * height,
+            text=text,
+            font="regular",
+            size=20,
             colour="gray",
             anchor="ms",
         )
 
-    def render_all(
+    @staticmethod
+    def stale_fields(stale_sources: Optional[dict[str, datetime]], todays_date: datetime) -> Optional[str]:
+        """The staleness note, e.g. "Not updated: tasks (09:15)", or None if everything is up to date."""
+        if not stale_sources:
+            return None
+        sources = ", ".join(
+            f"{name} ({fetched.astimezone(todays_date.tzinfo).strftime('%H:%M')})"
+            for name, fetched in sorted(stale_sources.items())
+        )
+        return f"Not updated: {sources}"
+
+    @staticmethod
+    def date_fields(todays_date: datetime) -> tuple[str, str, str, str]:
+        """The parts of the date & time which appear on the dashboard: day, day of week, month, time."""
+        return (
+            todays_date.strftime("%-d"),
+            todays_date.strftime("%a"),
+            todays_date.strftime("%b"),
+            todays_date.strftime("%H:%M"),
+        )
+
+    def layout(
         self,
         todays_date: datetime,
         events_today: list[Activity],
         events_tomorrow: list[Activity],
-        weather = None
-    ) -> None:
-        # Render top row
-        day = todays_date.strftime("%-d")
-        day_of_week = todays_date.strftime("%a")
-        month = todays_date.strftime("%b")
-        time = todays_date.strftime("%H:%M")
-        self.render_date(day, day_of_week, month)
-        # render_weather(text="Broken clouds | 11º", icon="\uf00d")
-
+        weather: Optional["Weather"] = None,
+        stale_sources: Optional[dict[str, datetime]] = None,
+    ) -> LayoutPlan:
+        """Plan the whole dashboard, without drawing anything"""
+        with STAGE_SECONDS.labels(stage="layout").time():
+            return self._layout(todays_date, events_today, events_tomorrow, weather, stale_sources)
+
+    def _layout(
+        self,
+        todays_date: datetime,
+        events_today: list[Activity],
+        events_tomorrow: list[Activity],
+        weather: Optional["Weather"],
+        stale_sources: Optional[dict[str, datetime]],
+    ) -> LayoutPlan:
         y0 = self.top_row_y + self.space_between_sections
-        y1 = self.render_activities("Today", events_today, y0)
-        self.render_activities("Tomorrow", events_tomorrow, y1)
+        plan = self.plan_activities([("Today", events_today), ("Tomorrow", events_tomorrow)], y0)
+
+        # Top row
+        day, day_of_week, month, time = self.date_fields(todays_date)
+        header = self.plan_date(day, day_of_week, month)
+        if weather is not None:
+            header.extend(self.plan_weather(text=weather.text, icon=weather.icon))
+        plan.content[:0] = header
+
+        stale = self.stale_fields(stale_sources, todays_date)
+        if stale is not None:
+            plan.content.append(self.plan_stale_marker(stale))
+
+        plan.footer.append(self.plan_last_updated(time))
+
+        return plan
+
+    def draw(self, plan: LayoutPlan, content: Optional[tuple[Image.Image, str]] = None) -> None:
+        """
+        Draw a plan onto a new image, then rotate it.
+        `content` is `drawn_content` from an earlier draw of a plan with the same content, so only the footer is drawn.
+        """
+        with STAGE_SECONDS.labels(stage="draw").time():
+            if content is None:
+                image = Image.new("L", (plan.width, plan.height), plan.background)
+                self.draw_items(ImageDraw.Draw(image), plan.content)
+                # Fingerprint everything except the footer (the "Refreshed" time), which changes on every render.
+                # The rotation too, as the image is fingerprinted before it's rotated
+                fingerprint = hashlib.blake2b(image.tobytes(), digest_size=16)
+                fingerprint.update(f"rotate={self.rotate_angle % 360}".encode())
+                self._drawn_content = (image.copy(), fingerprint.hexdigest())
+            else:
+                image = content[0].copy()
+                self._drawn_content = content
+
+            self._content_digest = self._drawn_content[1]
+            self.draw_items(ImageDraw.Draw(image), plan.footer)
+
+        with STAGE_SECONDS.labels(stage="rotate").time():
+            self._image = rotate(image, self.rotate_angle)
+
+    def draw_items(self, draw: ImageDraw.ImageDraw, items: list[LayoutItem]) -> None:
+        for item in items:
+            if isinstance(item, TextItem):
+                self._ff.get(item.font, item.size).write(draw, (item.x, item.y), item.text, item.colour, item.anchor)
+            else:
+                draw.line([item.x0, item.y0, item.x1, item.y1], fill=item.colour, width=item.width)
+
+    def render_all(
+        self,
+        todays_date: datetime,
+        events_today: list[Activity],
+        events_tomorrow: list[Activity],
+        weather: Optional["Weather"] = None,
+        stale_sources: Optional[dict[str, datetime]] = None,
+    ) -> LayoutPlan:
+        """Plan & draw the whole dashboard. Returns the plan."""
+        plan = self.layout(todays_date, events_today, events_tomorrow, weather, stale_sources)
+        self.draw(plan)
+        return plan
+
+    @property
+    def content_digest(self) -> Optional[str]:
+        """
+        Hash of the rendered pixels, excluding the last-updated footer.
+        Two renders with equal digests differ at most in their "Refreshed" time.
+        """
+        return self._content_digest
 
-        self.render_last_updated(time)
+    @property
+    def drawn_content(self) -> Optional[tuple[Image.Image, str]]:
+        """The last image drawn, before its footer was added or it was rotated, and its content digest"""
+        return self._drawn_content
 
-        self._image = self._image.rotate(self.rotate_angle, expand=True)
+    @property
+    def image(self) -> Image.Image:
+        """The drawn image, or a blank one if nothing's been drawn yet"""
+        if self._image is None:
+            self._image = Image.new("L", (self.image_width, self.image_height), self.background_colour)
+        return self._image
 
     def get_png(self) -> bytes:
         with io.BytesIO() as output:
-            self._image.save(output, format="PNG")
+            self.image.save(output, format="PNG")
             return output.getvalue()
 
     def save_png(self, output_filepath: str) -> None:
         """
         Full path with .png extension
         """
-        self._image.save(output_filepath, format="PNG")
+        self.image.save(output_filepath, format="PNG")
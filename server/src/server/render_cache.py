@@ -0,0 +1,50 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from server.metrics import CACHE_LOOKUPS
+
+
+def render_key(inputs: Any) -> str:
+    """
+    A stable hash of everything that determines a rendered image.
+    `inputs` must be JSON-serialisable once dates/times are converted to strings.
+    """
+    payload = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+
+class RenderCache:
+    """
+    Rendered images (or anything else worth keeping per `render_key`) in an in-memory LRU,
+    so identical inputs are never rendered twice. Lookups are counted in the metrics under `name`.
+    """
+
+    def __init__(self, max_entries: int = 8, name: str = "render"):
+        self.max_entries = max_entries
+        self.name = name
+
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+
+        CACHE_LOOKUPS.labels(cache=self.name, result="miss" if value is None else "hit").inc()
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        if self.max_entries == 0:
+            return
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
@@ -0,0 +1,142 @@
+"""
+Keeps the latest fetched data and rendered image on disk, so that after a restart the dashboard
+can be served straight away while fresh data is fetched in the background.
+
+Source data is stored as gzipped JSON and the image as its encoded bytes plus a small JSON file of metadata.
+Every file carries a format version: files from a different version are ignored, never misread.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+from pydantic import BaseModel, ValidationError
+
+from server.files import write_atomic
+from server.refresher import DashboardSnapshot
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class SourceSnapshot(BaseModel):
+    """One source's data (as JSON-compatible values) and when it was fetched"""
+
+    fetched_at: datetime
+    value: Any
+
+
+class SnapshotStore:
+    """Reads & writes snapshots in `directory`. Every write is atomic, so a power cut can't leave half a file."""
+
+    SOURCES_FILE = "sources.json.gz"
+    IMAGE_FILE = "dashboard.img"
+    IMAGE_META_FILE = "dashboard.json"
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._sources_hash: Optional[str] = None
+        self._image_etags: dict[Optional[str], Optional[str]] = {}  # profile -> ETag of the image on disk
+
+    def save_sources(self, sources: dict[str, SourceSnapshot]) -> bool:
+        """
+        Write the sources' data, unless it's unchanged since the last write. Returns whether it wrote.
+        Only the values are compared, not when they were fetched: re-fetching the same data doesn't
+        rewrite the file, at the cost of it looking older (so being refreshed sooner) after a restart.
+        """
+        payload = {"version": SNAPSHOT_VERSION, "sources": {k: v.model_dump(mode="json") for k, v in sources.items()}}
+        data = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
+
+        values = {k: v["value"] for k, v in payload["sources"].items()}
+        data_hash = hashlib.blake2b(json.dumps(values, sort_keys=True).encode(), digest_size=16).hexdigest()
+        if data_hash == self._sources_hash:
+            return False
+
+        # mtime=0 so identical data gives identical files
+        write_atomic(self.directory / self.SOURCES_FILE, gzip.compress(data, mtime=0))
+        self._sources_hash = data_hash
+
+        msg = f"Saved snapshot of {', '.join(sources) or 'no'} sources"
+        logger.debug(msg)
+        return True
+
+    def load_sources(self) -> dict[str, SourceSnapshot]:
+        path = self.directory / self.SOURCES_FILE
+        try:
+            payload = json.loads(gzip.decompress(path.read_bytes()))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable snapshot of source data")
+            return {}
+
+        if not self._current_version(payload, path):
+            return {}
+
+        try:
+            return {k: SourceSnapshot(**v) for k, v in payload["sources"].items()}
+        except (KeyError, TypeError, ValidationError):
+            logger.warning("Ignoring malformed snapshot of source data")
+            return {}
+
+    def _image_paths(self, profile: Optional[str]) -> tuple[Path, Path]:
+        """The image & metadata files for a device profile's image, or the main image if `profile` is None"""
+        if profile is None:
+            return self.directory / self.IMAGE_FILE, self.directory / self.IMAGE_META_FILE
+        image, meta = Path(self.IMAGE_FILE), Path(self.IMAGE_META_FILE)
+        return (
+            self.directory / f"{image.stem}-{profile}{image.suffix}",
+            self.directory / f"{meta.stem}-{profile}{meta.suffix}",
+        )
+
+    def save_image(self, snapshot: DashboardSnapshot, profile: Optional[str] = None) -> bool:
+        """Write the image, unless the one on disk has the same ETag. Returns whether it wrote."""
+        if profile not in self._image_etags:
+            saved = self.load_image(profile)
+            self._image_etags[profile] = None if saved is None else saved.etag
+        if self._image_etags[profile] == snapshot.etag:
+            return False
+
+        meta = {"version": SNAPSHOT_VERSION, **snapshot.model_dump(mode="json", exclude={"image"})}
+        image_path, meta_path = self._image_paths(profile)
+
+        # Image first: the metadata file only ever describes a complete image
+        write_atomic(image_path, snapshot.image)
+        write_atomic(meta_path, json.dumps(meta).encode())
+        self._image_etags[profile] = snapshot.etag
+        return True
+
+    def load_image(self, profile: Optional[str] = None) -> Optional[DashboardSnapshot]:
+        image_path, meta_path = self._image_paths(profile)
+        try:
+            meta = json.loads(meta_path.read_text())
+            image = image_path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning("Ignoring unreadable snapshot of dashboard image")
+            return None
+
+        if not self._current_version(meta, meta_path):
+            return None
+
+        try:
+            return DashboardSnapshot(image=image, **{k: v for k, v in meta.items() if k != "version"})
+        except ValidationError:
+            logger.warning("Ignoring malformed snapshot of dashboard image")
+            return None
+
+    @staticmethod
+    def _current_version(payload: dict, path: Path) -> bool:
+        version = payload.get("version") if isinstance(payload, dict) else None
+        if version != SNAPSHOT_VERSION:
+            msg = f"Ignoring {path.name}: snapshot version {version}, expected {SNAPSHOT_VERSION}"
+            logger.warning(msg)
+            return False
+        return True
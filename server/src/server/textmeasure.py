@@ -0,0 +1,92 @@
+import threading
+from collections import OrderedDict
+
+from PIL import ImageFont
+
+ELLIPSIS = "..."
+
+
+class TextMeasurer:
+    """
+    Memoised text measurements for a single ImageFont.
+
+    Fonts are shared process-wide, so these caches outlive any one render:
+    - string bounding boxes, in a bounded LRU (summaries repeat between refreshes);
+    - per-character advances, which are few and never evicted.
+
+    Advances are only used to estimate where a string must be cut;
+    every answer is confirmed with the same `getbbox` measurement PIL uses to draw.
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont, max_entries: int = 4096):
+        self._font = font
+        self._max_entries = max_entries
+        self._bboxes: OrderedDict[str, tuple[int, int, int, int]] = OrderedDict()
+        self._advances: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def bbox(self, text: str) -> tuple[int, int, int, int]:
+        with self._lock:
+            box = self._bboxes.get(text)
+            if box is not None:
+                self._bboxes.move_to_end(text)
+                return box
+
+        box = self._font.getbbox(text)
+
+        with self._lock:
+            self._bboxes[text] = box
+            if len(self._bboxes) > self._max_entries:
+                self._bboxes.popitem(last=False)
+
+        return box
+
+    def width(self, text: str) -> int:
+        return self.bbox(text)[2]
+
+    def height(self, text: str) -> int:
+        return self.bbox(text)[3]
+
+    def advance(self, char: str) -> float:
+        adv = self._advances.get(char)
+        if adv is None:
+            adv = self._font.getlength(char)
+            self._advances[char] = adv
+        return adv
+
+    def truncate(self, text: str, max_width: int, ellipsis: str = ELLIPSIS) -> str:
+        """
+        Returns `text` if it fits in `max_width`, otherwise its longest prefix that still fits
+        once `ellipsis` is appended.
+
+        Gives exactly the same answer as a binary search over prefixes 0..len(text)-1,
+        but starts from an estimate built from cached advances, so usually only a couple of
+        exact measurements are needed.
+        """
+        if self.width(text) <= max_width:
+            return text
+
+        last = len(text) - 1
+
+        def fits(k: int) -> bool:
+            return self.width(text[:k] + ellipsis) <= max_width
+
+        # Estimate the cut from cumulative advances (ignores kerning & side bearings)
+        budget = max_width - self.width(ellipsis)
+        k = 0
+        total = 0.0
+        for char in text[:last]:
+            total += self.advance(char)
+            if total > budget:
+                break
+            k += 1
+
+        # Correct the estimate against exact measurements
+        while k < last and fits(k + 1):
+            k += 1
+        while k >= 0 and not fits(k):
+            k -= 1
+
+        # If not even the ellipsis fits then k == -1, and like the binary search
+        # we fall back to dropping the last character.
+        return text[:k] + ellipsis
@@ -1,68 +1,253 @@
+import asyncio
+import json
 import logging
-from datetime import datetime, timezone
+from datetime import date, datetime, time, tzinfo
+from time import monotonic
 from typing import Optional
 
+import httpx
 from pydantic import SecretStr
-from todoist_api_python.api import TodoistAPI
-from todoist_api_python.models import Due
+from todoist_api_python.endpoints import COLLABORATORS_ENDPOINT, PROJECTS_ENDPOINT, REST_API, TASKS_ENDPOINT
+from todoist_api_python.models import Collaborator, Task
 
 from server.activity import Activity
 
 logger = logging.getLogger(__name__)
 
-def get_tasks_todoist(api_key: SecretStr, project_id: int, date_end: datetime) -> list[Activity]:
+SYNC_URL = "https://api.todoist.com/sync/v9/sync"
+SYNC_TIMEOUT = 30
+FULL_SYNC = "*"  # the sync token which asks for everything
 
+
+class TaskStore:
     """
-    Returns all tasks within a given Project before the specified end date (i.e. includes overdue tasks).
+    A local copy of the account's open tasks (as returned by the Sync API) and collaborator names,
+    plus the token for the next incremental sync.
     """
 
-    tz: timezone = date_end.tzinfo
-
-    api = TodoistAPI(api_key.get_secret_value())
+    def __init__(self):
+        self.items: dict[str, dict] = {}
+        self.collaborators: dict[str, str] = {}
+        self.sync_token = FULL_SYNC
 
-    logger.debug("Querying Todoist.")
-    logger.debug("Getting collaborators...")
-    try:
-        collaborators = api.get_collaborators(project_id=project_id)
-    except Exception:
-        logger.exception("Failed to get collaborators.")
-        raise
+    def apply(self, response: dict) -> None:
+        """Apply a Sync API response: completed & deleted tasks are removed, anything else is added or replaced"""
+        if response.get("full_sync"):
+            self.items.clear()
+            self.collaborators.clear()
 
-    logger.debug("Getting tasks...")
-    try:
-        tasks = api.get_tasks(project_id=project_id, is_completed=False)
-    except Exception:
-        logger.exception("Failed to get tasks.")
-        raise
+        for item in response.get("items", []):
+            if item.get("is_deleted") or item.get("checked"):
+                self.items.pop(item["id"], None)
+            else:
+                self.items[item["id"]] = item
 
-    def include_task(due: Optional[Due]) -> bool:
-        return due is not None and datetime.fromisoformat(due.date).replace(tzinfo=tz) <= date_end
+        for collaborator in response.get("collaborators", []):
+            self.collaborators[collaborator["id"]] = collaborator["full_name"]
 
-    tasks_due = filter(lambda x: include_task(x.due), tasks)
+        self.sync_token = response["sync_token"]
 
-    my_collaborators = {c.id: c.name for c in collaborators}
+    def project_items(self, project_id: int) -> list[dict]:
+        return [item for item in self.items.values() if item["project_id"] == str(project_id)]
 
-    my_tasks: list[Activity] = []
 
-    logger.debug("Constructing activity list from tasks...")
-    for task in tasks_due:
-        # task_id = task.id
-        # priority = task.priority
-        assignee_str = "" if task.assignee_id is None else f" [{my_collaborators.get(task.assignee_id)}]"
-        summary = task.content + assignee_str
-        desc = task.description
-        # due = task.due.date if task.due.datetime is None else task.due.datetime
+class TodoistClient:
+    """
+    A long-lived Todoist session, with a cache of each project's collaborators.
+    Every request goes through the `httpx.AsyncClient` it's given, i.e. the App's shared, pooled client.
 
-        e = Activity(
-            activity_type="task",
-            summary=summary,
-            date_start=datetime.fromisoformat(task.due.date),
-            time_start=datetime.fromisoformat(task.due.datetime).time() if task.due.datetime is not None else None,
-            description=desc
-        )
-        my_tasks.append(e)
+    Collaborators rarely change, so they're only fetched again once `collaborator_ttl` seconds have passed,
+    or when a task is assigned to someone we don't know.
 
-    log_msg = f"Built a list of {len(my_tasks)} tasks."
-    logger.debug(log_msg)
+    With `incremental_sync`, tasks come from the Sync API instead: the first call downloads every open task,
+    and later calls only download what changed since, which are applied to a local `TaskStore`.
+    """
 
-    return my_tasks
+    def __init__(
+        self,
+        api_key: SecretStr,
+        collaborator_ttl: int = 3600,
+        incremental_sync: bool = False,  # noqa: FBT001, FBT002
+        sync_url: str = SYNC_URL,
+        rest_url: str = REST_API,
+    ):
+        self.collaborator_ttl = collaborator_ttl
+        self.incremental_sync = incremental_sync
+        self.sync_url = sync_url
+        self.rest_url = rest_url
+        self._api_key = api_key
+        self._store = TaskStore()
+        self._store_lock: Optional[asyncio.Lock] = None
+
+        self._collaborators: dict[int, tuple[float, dict[str, str]]] = {}  # project -> (fetched at, id -> name)
+
+    @property
+    def _headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self._api_key.get_secret_value()}"}
+
+    @property
+    def _sync_lock(self) -> asyncio.Lock:
+        # Created on first use, from within the event loop: on Python 3.9 a lock binds to the loop current at creation
+        if self._store_lock is None:
+            self._store_lock = asyncio.Lock()
+        return self._store_lock
+
+    async def get_tasks(self, http: httpx.AsyncClient, project_id: int, date_end: datetime) -> list[Activity]:
+        """
+        Returns all tasks within a given Project before the specified end date (i.e. includes overdue tasks).
+        Tasks due at a fixed time are shown in `date_end`'s timezone, i.e. the display timezone.
+        """
+        logger.debug("Querying Todoist.")
+        if self.incremental_sync:
+            return await self.get_tasks_synced(http, project_id, date_end)
+
+        collaborators = self.cached_collaborators(project_id)
+
+        if collaborators is None:
+            # Nothing cached: fetch collaborators alongside the tasks rather than before them
+            tasks, collaborators = await asyncio.gather(
+                self.fetch_tasks(http, project_id), self.fetch_collaborators(http, project_id)
+            )
+        else:
+            tasks = await self.fetch_tasks(http, project_id)
+            if any(t.assignee_id is not None and t.assignee_id not in collaborators for t in tasks):
+                logger.debug("Found a task assigned to an unknown collaborator.")
+                collaborators = await self.fetch_collaborators(http, project_id)
+
+        tasks_due = [t for t in tasks if t.due is not None and is_due_by(t.due.date, date_end)]
+
+        logger.debug("Constructing activity list from tasks...")
+        my_tasks = [task_to_activity(task, collaborators, date_end.tzinfo) for task in tasks_due]
+
+        log_msg = f"Built a list of {len(my_tasks)} tasks."
+        logger.debug(log_msg)
+
+        return my_tasks
+
+    async def get_tasks_synced(self, http: httpx.AsyncClient, project_id: int, date_end: datetime) -> list[Activity]:
+        """As `get_tasks`, but bringing the local task store up to date rather than downloading every task"""
+        async with self._sync_lock:
+            await self.sync(http)
+            items = self._store.project_items(project_id)
+            collaborators = dict(self._store.collaborators)
+
+        items_due = [i for i in items if i.get("due") is not None and is_due_by(i["due"]["date"], date_end)]
+        my_tasks = [item_to_activity(item, collaborators, date_end.tzinfo) for item in items_due]
+
+        log_msg = f"Built a list of {len(my_tasks)} tasks."
+        logger.debug(log_msg)
+
+        return my_tasks
+
+    async def sync(self, http: httpx.AsyncClient) -> None:
+        """Fetch tasks & collaborators changed since the last sync, and apply them to the store"""
+        full = self._store.sync_token == FULL_SYNC
+        msg = f"{'Full' if full else 'Incremental'} Todoist sync..."
+        logger.debug(msg)
+
+        try:
+            response = await http.post(
+                self.sync_url,
+                headers=self._headers,
+                data={"sync_token": self._store.sync_token, "resource_types": json.dumps(["items", "collaborators"])},
+                timeout=SYNC_TIMEOUT,
+            )
+            response.raise_for_status()
+            changes = response.json()
+        except Exception:
+            logger.exception("Failed to sync tasks.")
+            raise
+
+        self._store.apply(changes)
+
+        msg = f"Applied {len(changes.get('items', []))} task changes; {len(self._store.items)} open tasks stored."
+        logger.debug(msg)
+
+    def cached_collaborators(self, project_id: int) -> Optional[dict[str, str]]:
+        """The project's collaborators by id, if they were fetched recently enough"""
+        cached = self._collaborators.get(project_id)
+        if cached is None or monotonic() - cached[0] >= self.collaborator_ttl:
+            return None
+        return cached[1]
+
+    async def get_json(self, http: httpx.AsyncClient, path: str, params: Optional[dict] = None) -> list[dict]:
+        """GET from the REST API"""
+        response = await http.get(self.rest_url + path, headers=self._headers, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def fetch_collaborators(self, http: httpx.AsyncClient, project_id: int) -> dict[str, str]:
+        logger.debug("Getting collaborators...")
+        try:
+            path = f"{PROJECTS_ENDPOINT}/{project_id}/{COLLABORATORS_ENDPOINT}"
+            collaborators = [Collaborator.from_dict(c) for c in await self.get_json(http, path)]
+        except Exception:
+            logger.exception("Failed to get collaborators.")
+            raise
+
+        names = {c.id: c.name for c in collaborators}
+        self._collaborators[project_id] = (monotonic(), names)
+
+        return names
+
+    async def fetch_tasks(self, http: httpx.AsyncClient, project_id: int) -> list[Task]:
+        logger.debug("Getting tasks...")
+        try:
+            # The REST API only returns open tasks
+            return [Task.from_dict(t) for t in await self.get_json(http, TASKS_ENDPOINT, {"project_id": project_id})]
+        except Exception:
+            logger.exception("Failed to get tasks.")
+            raise
+
+
+def parse_due(due: str, tz: Optional[tzinfo]) -> tuple[date, Optional[time]]:
+    """
+    A Todoist due date as a date & time (None if it's all day). It's one of "YYYY-MM-DD",
+    "YYYY-MM-DDTHH:MM:SS" (a floating time, the same wherever you are) or "YYYY-MM-DDTHH:MM:SSZ"
+    (a fixed time in UTC, which is converted to `tz`).
+    """
+    if "T" not in due:
+        return date.fromisoformat(due), None
+
+    # fromisoformat only accepts "Z" from Python 3.11
+    due_at = datetime.fromisoformat(due[:-1] + "+00:00" if due.endswith("Z") else due)
+    if due_at.tzinfo is not None and tz is not None:
+        due_at = due_at.astimezone(tz)
+    return due_at.date(), due_at.time()
+
+
+def is_due_by(due_date: str, date_end: datetime) -> bool:
+    """Whether a due date, as in `parse_due`, is on or before `date_end`'s date (in its timezone)"""
+    return parse_due(due_date, date_end.tzinfo)[0] <= date_end.date()
+
+
+def task_to_activity(task: Task, collaborators: dict[str, str], tz: Optional[tzinfo] = None) -> Activity:
+    # task_id = task.id
+    # priority = task.priority
+    assignee_str = "" if task.assignee_id is None else f" [{collaborators.get(task.assignee_id)}]"
+    summary = task.content + assignee_str
+    desc = task.description
+    date_start, time_start = parse_due(task.due.date if task.due.datetime is None else task.due.datetime, tz)
+
+    return Activity.trusted(
+        activity_type="task",
+        summary=summary,
+        date_start=date_start,
+        time_start=time_start,
+        description=desc
+    )
+
+
+def item_to_activity(item: dict, collaborators: dict[str, str], tz: Optional[tzinfo] = None) -> Activity:
+    """As `task_to_activity`, for a task from the Sync API, whose due date includes the time if there is one"""
+    assignee_id = item.get("responsible_uid")
+    assignee_str = "" if assignee_id is None else f" [{collaborators.get(assignee_id)}]"
+    date_start, time_start = parse_due(item["due"]["date"], tz)
+
+    return Activity.trusted(
+        activity_type="task",
+        summary=item["content"] + assignee_str,
+        date_start=date_start,
+        time_start=time_start,
+        description=item.get("description", ""),
+    )
@@ -0,0 +1,29 @@
+from typing import Callable, Optional
+
+import pytest
+
+from server.config import AppConfig
+
+CALENDAR = {"ids": {}, "creds": "/missing/creds.json"}
+
+
+@pytest.fixture
+def make_config(tmp_path) -> Callable[..., AppConfig]:
+    """
+    Builds an AppConfig which writes to `tmp_path`, with snapshots off and a calendar that's never queried.
+    `server` & `image` settings are merged over the defaults; other sections replace them (None leaves one out).
+    """
+    def make(
+        server: Optional[dict] = None,
+        image: Optional[dict] = None,
+        api_keys: Optional[dict] = None,
+        **sections,
+    ) -> AppConfig:
+        config = {
+            "server": {"server_dir": str(tmp_path), "snapshot": False, **(server or {})},
+            "image": {"width": 600, "height": 800, **(image or {})},
+            **{k: v for k, v in {"calendar": CALENDAR, **sections}.items() if v is not None},
+        }
+        return AppConfig.from_dicts(config, api_keys)
+
+    return make
@@ -1,5 +1,5 @@
-from datetime import date, datetime, time, timedelta
-from typing import Union
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Union
 from zoneinfo import ZoneInfo
 
 import pytest
@@ -7,10 +7,14 @@ from pydantic import ValidationError
 
 from server.activity import (
     Activity,
+    activity_sort_key,
+    bucket_by_day,
     calculate_short_time,
     datetime_to_date,
     datetime_to_time,
     group_events_by_relative_day,
+    merge_sorted,
+    select_visible,
     sort_by_time,
 )
 
@@ -304,3 +308,134 @@ def test_sort_by_time(date_past):
     assert activities_sorted[4].summary == "2"
     assert activities_sorted[5].summary == "1"
 
+
+@pytest.mark.parametrize("start,end", [
+    (datetime(2024, 1, 1, 9, 30, tzinfo=TZ), datetime(2024, 1, 1, 10, tzinfo=TZ)),
+    (datetime(2024, 1, 1, 9, 30, tzinfo=TZ), None),
+    (date(2024, 1, 1), date(2024, 1, 3)),
+    (date(2024, 1, 1), None),
+])
+def test_trusted_matches_validated(start, end):
+    kwargs = {"activity_type": "event", "summary": SUMMARY, "datetime_start": start, "datetime_end": end,
+              "description": "desc", "location": "here"}
+
+    validated = Activity.from_datetimes(**kwargs)
+    trusted = Activity.from_datetimes(**kwargs, trusted=True)
+
+    assert trusted == validated
+    assert trusted.model_fields_set == validated.model_fields_set
+    assert trusted.model_dump() == validated.model_dump()
+    assert trusted.model_dump(exclude_unset=True) == validated.model_dump(exclude_unset=True)
+    assert trusted.model_dump_json() == validated.model_dump_json()
+    assert (trusted.__pydantic_extra__, trusted.__pydantic_private__) == (
+        validated.__pydantic_extra__, validated.__pydantic_private__
+    )
+    assert (trusted.is_all_day, trusted.is_multi_day, trusted.time_start_short) == (
+        validated.is_all_day, validated.is_multi_day, validated.time_start_short
+    )
+
+def test_trusted_is_a_normal_activity(date_future):
+    trusted = Activity.trusted(activity_type="task", summary=SUMMARY, date_start=date_future)
+
+    assert isinstance(trusted, Activity)
+    assert Activity.model_validate(trusted.model_dump()) == trusted
+    assert trusted.model_copy(update={"summary": "copy"}).summary == "copy"
+
+def test_trusted_skips_validation(date_future):
+    # Which is why it's only for data that's already known to be valid
+    Activity.trusted(activity_type="event", summary=SUMMARY, date_start=date_future, time_end=time(10))
+
+    with pytest.raises(ValidationError):
+        Activity(activity_type="event", summary=SUMMARY, date_start=date_future, time_end=time(10))
+
+def timed(day: date, start: time, end: Optional[time] = None, summary: str = SUMMARY) -> Activity:
+    return Activity(activity_type="event", summary=summary, date_start=day, time_start=start, time_end=end)
+
+def test_select_visible():
+    now = datetime(2024, 1, 10, 12, 0, tzinfo=TZ)
+    today, tomorrow = date(2024, 1, 10), date(2024, 1, 11)
+
+    activities = [
+        Activity(activity_type="event", summary="multi-day", date_start=date(2024, 1, 8), date_end=tomorrow),
+        Activity(activity_type="task", summary="all day", date_start=today),
+        timed(today, time(9), time(10, 30), summary="ended"),
+        timed(today, time(10), time(11, 30), summary="just ended"),
+        timed(today, time(10, 45), summary="point in time, ended"),
+        timed(today, time(11, 30), summary="point in time, just passed"),
+        timed(tomorrow, time(9), summary="tomorrow"),
+        timed(date(2024, 1, 12), time(9), summary="day after"),
+    ]
+
+    activities_today, activities_tomorrow = select_visible(activities, now=now, display_timezone=TZ)
+
+    assert [a.summary for a in activities_today] == [
+        "multi-day", "all day", "just ended", "point in time, just passed"
+    ]
+    assert [a.summary for a in activities_tomorrow] == ["tomorrow"]
+
+def test_select_visible_keeps_overdue_tasks():
+    now = datetime(2024, 1, 10, 12, 0, tzinfo=TZ)
+    activities = [
+        Activity(activity_type="task", summary="overdue", date_start=date(2024, 1, 9), time_start=time(9)),
+        Activity(activity_type="task", summary="due this morning", date_start=date(2024, 1, 10), time_start=time(9)),
+        timed(date(2024, 1, 10), time(13), summary="later"),
+    ]
+
+    activities_today, _ = select_visible(activities, now=now, display_timezone=TZ)
+
+    assert [a.summary for a in activities_today] == ["overdue", "later"]
+
+def test_select_visible_uses_display_timezone():
+    # 23:30 UTC is already tomorrow in London in summer, and the cutoff is before midnight
+    now = datetime(2024, 7, 1, 23, 30, tzinfo=timezone.utc)
+    activities = [
+        timed(date(2024, 7, 1), time(22), time(23), summary="ended yesterday"),
+        timed(date(2024, 7, 1), time(23), time(23, 45), summary="ended 45 minutes ago"),
+        timed(date(2024, 7, 2), time(9), summary="today"),
+        timed(date(2024, 7, 3), time(9), summary="tomorrow"),
+    ]
+
+    activities_today, activities_tomorrow = select_visible(activities, now=now, display_timezone=TZ)
+
+    assert [a.summary for a in activities_today] == ["ended 45 minutes ago", "today"]
+    assert [a.summary for a in activities_tomorrow] == ["tomorrow"]
+
+def test_merge_sorted():
+    day = date(2024, 1, 10)
+    events = [timed(day, time(9), summary="event 9"), timed(day, time(11), summary="event 11")]
+    tasks = [
+        Activity(activity_type="task", summary="task all day", date_start=day),
+        timed(day, time(9), summary="task 9"),
+        timed(day + timedelta(days=1), time(8), summary="task tomorrow"),
+    ]
+
+    merged = list(merge_sorted(events, tasks))
+
+    # Activities at the same time keep the order of their streams
+    assert [a.summary for a in merged] == ["task all day", "event 9", "task 9", "event 11", "task tomorrow"]
+    assert merged == sorted(events + tasks, key=activity_sort_key)
+
+def test_bucket_by_day():
+    today = date(2024, 1, 10)
+    activities = [
+        Activity(activity_type="event", summary="ongoing", date_start=date(2024, 1, 9), date_end=today),
+        timed(today, time(9), summary="today"),
+        timed(date(2024, 1, 12), time(9), summary="in two days"),
+    ]
+
+    buckets = list(bucket_by_day(activities, today=today, days=4))
+
+    assert [[a.summary for a in bucket] for bucket in buckets] == [["ongoing", "today"], [], ["in two days"], []]
+
+def test_bucket_by_day_stops_reading_after_last_day():
+    today = date(2024, 1, 10)
+    read = []
+    def activities():
+        for days in range(5):
+            read.append(days)
+            yield timed(today + timedelta(days=days), time(9))
+
+    buckets = list(bucket_by_day(activities(), today=today, days=2))
+
+    assert [len(bucket) for bucket in buckets] == [1, 1]
+    assert read == [0, 1, 2]
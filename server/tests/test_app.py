@@ -0,0 +1,36 @@
+import pytest
+
+from server.app import etag_matches, image_response
+from server.render import RenderedImage
+
+ETAG = '"abc123-png"'
+
+@pytest.mark.parametrize(("if_none_match", "expected"), [
+    (None, False),
+    ('"other"', False),
+    (ETAG, True),
+    (f"W/{ETAG}", True),
+    (f'"other", {ETAG}', True),
+    ("*", True),
+])
+def test_etag_matches(if_none_match, expected):
+    assert etag_matches(if_none_match, ETAG) == expected
+
+def test_image_response_not_modified():
+    rendered = RenderedImage(image=b"png", digest="abc123")
+
+    response = image_response(rendered, if_none_match=ETAG)
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["ETag"] == ETAG
+
+def test_image_response_modified():
+    rendered = RenderedImage(image=b"png", digest="abc123")
+
+    response = image_response(rendered, if_none_match='"stale"', headers={"X-Extra": "1"})
+
+    assert response.status_code == 200
+    assert response.body == b"png"
+    assert response.headers["ETag"] == ETAG
+    assert response.headers["X-Extra"] == "1"
@@ -0,0 +1,51 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from server.config import EncodingConfig
+from server.encode import candidate_encodings, compare_encodings, encode_png, grey_levels, quantize
+
+
+@pytest.fixture
+def gradient() -> Image.Image:
+    image = Image.linear_gradient("L").resize((64, 32))
+    ImageDraw.Draw(image).text((2, 2), "Hello", fill="black")
+    return image
+
+def decode(png: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(png))
+
+def test_grey_levels():
+    assert grey_levels(2) == [0, 255]
+    assert grey_levels(16)[:3] == [0, 17, 34]
+    assert grey_levels(16)[-1] == 255
+
+def test_default_encoding_is_lossless(gradient):
+    assert decode(encode_png(gradient, EncodingConfig())).tobytes() == gradient.tobytes()
+
+@pytest.mark.parametrize("dither", ["none", "ordered", "floyd-steinberg"])
+@pytest.mark.parametrize("bits", [4, 8])
+def test_quantized_output_only_uses_levels(gradient, dither, bits):
+    encoding = EncodingConfig(levels=16, dither=dither, bits=bits)
+
+    decoded = decode(encode_png(gradient, encoding))
+
+    assert decoded.mode == ("P" if bits == 4 else "L")
+    assert set(decoded.convert("L").tobytes()) <= set(grey_levels(16))
+
+def test_quantize_none_rounds_to_nearest_level():
+    image = Image.new("L", (1, 1), 10)
+
+    assert quantize(image, 16).getpixel((0, 0)) == 17
+
+def test_four_bits_needs_at_most_sixteen_levels():
+    with pytest.raises(ValueError, match="16 grey levels"):
+        EncodingConfig(levels=32, bits=4)
+
+def test_compare_encodings_smallest_first(gradient):
+    reports = compare_encodings(gradient, candidate_encodings())
+
+    sizes = [r.size_bytes for r in reports]
+    assert sizes == sorted(sizes)
+    assert len({r.tag for r in reports}) == len(reports)
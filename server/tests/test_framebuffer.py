@@ -0,0 +1,89 @@
+import gzip
+import io
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
+
+from server.app import AppServer
+from server.config import EncodingConfig
+from server.encode import decode_image, encode_png, encode_rendered
+from server.framebuffer import FRAMEBUFFERS, FramebufferFormat, compress, pack, unpack
+
+
+def dashboard_like(width: int, height: int) -> Image.Image:
+    image = Image.linear_gradient("L").resize((width, height))
+    ImageDraw.Draw(image).text((10, 10), "Bins", fill="black")
+    return image
+
+@pytest.mark.parametrize("name", list(FRAMEBUFFERS))
+@pytest.mark.parametrize("dither", ["none", "ordered"])
+def test_round_trips_against_png(name, dither):
+    fb = FRAMEBUFFERS[name]
+    image = dashboard_like(fb.width, fb.height)
+    encoding = EncodingConfig(levels=16, dither=dither, framebuffer=name)
+
+    data = gzip.decompress(encode_rendered(image, "digest", encoding).image)
+    png = encode_png(image, encoding)
+
+    assert len(data) == fb.size
+    assert unpack(data, fb).tobytes() == Image.open(io.BytesIO(png)).convert("L").tobytes()
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_decodes_framebuffer_images(compression):
+    image = dashboard_like(600, 800)
+    encoding = EncodingConfig(levels=16, framebuffer="K4", framebuffer_compression=compression)
+
+    rendered = encode_rendered(image, "digest", encoding)
+
+    assert rendered.framebuffer == "K4"
+    assert decode_image(rendered).tobytes() == unpack(pack(image, FRAMEBUFFERS["K4"]), FRAMEBUFFERS["K4"]).tobytes()
+
+def test_lines_are_padded_to_the_stride_with_white():
+    fb = FramebufferFormat(name="test", width=3, height=2, stride=4, bits=8)
+    image = Image.new("L", (3, 2), 0)
+
+    assert pack(image, fb) == bytes([0, 0, 0, 255] * 2)
+
+def test_four_bit_inverted_packs_left_pixel_high():
+    fb = FramebufferFormat(name="test", width=3, height=1, stride=3, bits=4, inverted=True)
+    image = Image.new("L", (3, 1))
+    image.putdata([0, 255, 17])
+
+    # Black is 0xF, white 0x0; the odd pixel out and the stride's padding are white
+    assert pack(image, fb) == bytes([0xF0, 0xE0, 0x00])
+    assert unpack(pack(image, fb), fb).tobytes() == bytes([0, 255, 17])
+
+def test_wrong_size_image_is_rejected():
+    with pytest.raises(ValueError, match="doesn't fit the PW3's"):
+        pack(Image.new("L", (600, 800)), FRAMEBUFFERS["PW3"])
+
+def test_compression_is_deterministic():
+    data = pack(dashboard_like(600, 800), FRAMEBUFFERS["K4"])
+
+    assert compress(data) == compress(data)
+    assert len(compress(data)) < len(data)
+
+def test_tag_distinguishes_framebuffers():
+    tags = {EncodingConfig(framebuffer=fb).tag for fb in FRAMEBUFFERS} | {EncodingConfig().tag}
+
+    assert len(tags) == len(FRAMEBUFFERS) + 1
+
+def test_dashboard_endpoint_serves_framebuffer(make_config):
+    config = make_config(server={"refresh_interval": 0})
+    server = AppServer(config)
+    server.providers = []
+    api = FastAPI()
+    api.include_router(server.router)
+
+    with TestClient(api) as client:
+        raw = client.get("/dashboard", params={"framebuffer": "K4", "framebuffer_compression": "none"})
+        zipped = client.get("/dashboard", params={"framebuffer": "K4"})
+        wrong_size = client.get("/dashboard", params={"framebuffer": "PW3"})
+
+    assert raw.headers["content-type"] == "application/octet-stream"
+    assert len(raw.content) == FRAMEBUFFERS["K4"].size
+    assert zipped.headers["content-type"] == "application/gzip"
+    assert gzip.decompress(zipped.content) == raw.content
+    assert wrong_size.status_code == 422
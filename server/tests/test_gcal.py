@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from datetime import date, datetime, timezone
+from datetime import time as dt_time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from server.activity import Activity
+from server.calendar_plugins.gcal import PRIMARY_CALENDAR, CalendarFetchError, GCal
+
+DATE_FROM = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DATE_TO = datetime(2024, 1, 3, tzinfo=timezone.utc)
+
+
+@pytest.fixture(scope="module")
+def creds_path(tmp_path_factory):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+
+    path = tmp_path_factory.mktemp("creds") / "credentials_service.json"
+    path.write_text(json.dumps({
+        "type": "service_account",
+        "project_id": "test",
+        "private_key_id": "1",
+        "private_key": pem,
+        "client_email": "test@test.iam.gserviceaccount.com",
+        "client_id": "1",
+        "token_uri": "https://oauth2.googleapis.com/token",
+    }))
+    return path
+
+def test_missing_credentials(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        GCal(tmp_path / "missing.json")
+
+def test_client_reused_within_thread_but_not_shared(creds_path):
+    gcal = GCal(creds_path)
+
+    other_thread = []
+    t = threading.Thread(target=lambda: other_thread.append(gcal.calendar))
+    t.start()
+    t.join()
+
+    assert gcal.calendar is gcal.calendar
+    assert other_thread[0] is not gcal.calendar
+    assert other_thread[0].credentials is gcal.calendar.credentials
+
+def test_calendar_list_cached_for_ttl(creds_path, monkeypatch):
+    calls = []
+    def get_available_calendars(_self):
+        calls.append(1)
+        return {"id_1": "Calendar 1"}
+    monkeypatch.setattr(GCal, "get_available_calendars", get_available_calendars)
+
+    gcal = GCal(creds_path, calendar_list_ttl=3600)
+    gcal.validate_calendars(["id_1"])
+    gcal.validate_calendars(["id_1"])
+    assert len(calls) == 1
+
+    gcal.calendar_list_ttl = 0
+    gcal.validate_calendars(["id_1"])
+    assert len(calls) == 2
+
+def fake_query(delays: dict, failures: set):
+    def query_events_api(_self, calendar_id=None, **_dates):
+        calendar_id = calendar_id or PRIMARY_CALENDAR
+        time.sleep(delays.get(calendar_id, 0))
+        if calendar_id in failures:
+            err = f"{calendar_id} is down"
+            raise ConnectionError(err)
+        return [Activity(activity_type="event", summary=calendar_id, date_start=date(2024, 1, 1))]
+    return query_events_api
+
+@pytest.fixture
+def gcal_with_calendars(creds_path, monkeypatch):
+    monkeypatch.setattr(GCal, "get_available_calendars", lambda _: {"a": "A", "b": "B", "c": "C"})
+    return GCal(creds_path, max_concurrent_fetches=4)
+
+def test_events_merged_in_calendar_order(gcal_with_calendars, monkeypatch):
+    monkeypatch.setattr(GCal, "query_events_api", fake_query({PRIMARY_CALENDAR: 0.2, "a": 0.1}, set()))
+
+    start = time.monotonic()
+    events = gcal_with_calendars.get_events(DATE_FROM, DATE_TO, ["a", "b", "c"])
+    elapsed = time.monotonic() - start
+
+    assert [e.summary for e in events] == [PRIMARY_CALENDAR, "a", "b", "c"]
+    assert elapsed < 0.3  # concurrent, so not 0.2 + 0.1
+
+def test_failed_calendar_reported_separately(gcal_with_calendars, monkeypatch):
+    monkeypatch.setattr(GCal, "query_events_api", fake_query({}, {"b"}))
+
+    events = gcal_with_calendars.get_events(DATE_FROM, DATE_TO, ["a", "b", "c"])
+
+    assert [e.summary for e in events] == [PRIMARY_CALENDAR, "a", "c"]
+    assert list(gcal_with_calendars.last_fetch_errors) == ["b"]
+
+def test_all_calendars_failing_raises(gcal_with_calendars, monkeypatch):
+    monkeypatch.setattr(GCal, "query_events_api", fake_query({}, {PRIMARY_CALENDAR, "a"}))
+
+    with pytest.raises(CalendarFetchError) as e:
+        gcal_with_calendars.get_events(DATE_FROM, DATE_TO, ["a"])
+
+    assert set(e.value.errors) == {PRIMARY_CALENDAR, "a"}
+
+def test_events_merged_in_time_order(gcal_with_calendars, monkeypatch):
+    hours = {PRIMARY_CALENDAR: [15, 9], "a": [10, 12], "b": [9]}
+
+    def query_events_api(_self, calendar_id=None, **_dates):
+        calendar_id = calendar_id or PRIMARY_CALENDAR
+        return [
+            Activity(activity_type="event", summary=f"{calendar_id} {h}", date_start=date(2024, 1, 1),
+                     time_start=dt_time(h))
+            for h in hours[calendar_id]
+        ]
+    monkeypatch.setattr(GCal, "query_events_api", query_events_api)
+
+    events = gcal_with_calendars.get_events(DATE_FROM, DATE_TO, ["a", "b"])
+
+    assert [e.summary for e in events] == [f"{PRIMARY_CALENDAR} 9", "b 9", "a 10", "a 12", f"{PRIMARY_CALENDAR} 15"]
+
+def test_clients_are_reused_across_fetches(creds_path, monkeypatch):
+    built = []
+
+    class CountingCalendar:
+        def __init__(self, **_):
+            built.append(self)
+
+    def query_events_api(self, calendar_id=None, **_):
+        _ = self.calendar
+        time.sleep(0.01)
+        return [Activity(activity_type="event", summary=calendar_id or PRIMARY_CALENDAR, date_start=date(2024, 1, 1))]
+
+    monkeypatch.setattr("server.calendar_plugins.gcal.GoogleCalendar", CountingCalendar)
+    monkeypatch.setattr(GCal, "get_available_calendars", lambda _: {"a": "A", "b": "B"})
+    monkeypatch.setattr(GCal, "query_events_api", query_events_api)
+    gcal = GCal(creds_path, max_concurrent_fetches=2)
+
+    counts = []
+    for _ in range(3):
+        gcal.get_events(DATE_FROM, DATE_TO, ["a", "b"])
+        counts.append(len(built))
+    gcal.close()
+
+    assert counts[0] == counts[-1]
+    assert counts[-1] <= 2
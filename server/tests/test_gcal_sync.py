@@ -0,0 +1,159 @@
+"""
+Incremental sync is tested against a local stand-in for the Calendar API's events().list,
+which hands out sync tokens and only returns changes made since the token was issued.
+"""
+import copy
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from server.calendar_plugins.gcal import EventStore, GCal
+
+
+def timed_event(event_id: str, summary: str, start: str, end: str) -> dict:
+    return {
+        "id": event_id,
+        "status": "confirmed",
+        "summary": summary,
+        "start": {"dateTime": start, "timeZone": "Europe/London"},
+        "end": {"dateTime": end, "timeZone": "Europe/London"},
+    }
+
+
+class FakeEventsApi:
+    """Just enough of events().list to exercise full & incremental sync, including paging and 410 Gone"""
+
+    def __init__(self, page_size: int = 2):
+        self.page_size = page_size
+        self.log: list[tuple[str, dict]] = []  # (event id, item) in order of change
+        self.requests: list[dict] = []
+        self.expired_tokens: set[str] = set()
+
+    def put(self, item: dict) -> None:
+        self.log.append((item["id"], copy.deepcopy(item)))
+
+    def cancel(self, event_id: str) -> None:
+        self.log.append((event_id, {"id": event_id, "status": "cancelled"}))
+
+    def events(self):
+        return self
+
+    def list(self, **params):
+        self.requests.append(params)
+        return SimpleNamespace(execute=lambda: self._execute(params))
+
+    def _execute(self, params: dict) -> dict:
+        token = params.get("syncToken")
+        if token in self.expired_tokens:
+            raise HttpError(httplib2.Response({"status": 410}), b"Sync token is no longer valid")
+
+        if token is None:
+            # Full sync: the current state of every live event in [timeMin, timeMax)
+            latest = dict(self.log)
+            items = [
+                item for item in latest.values()
+                if item["status"] != "cancelled"
+                and item["start"]["dateTime"] < params["timeMax"] and item["end"]["dateTime"] > params["timeMin"]
+            ]
+        else:
+            items = [item for _, item in self.log[int(token):]]
+
+        offset = int(params.get("pageToken") or 0)
+        page = items[offset:offset + self.page_size]
+        response = {"items": copy.deepcopy(page)}
+        if offset + self.page_size < len(items):
+            response["nextPageToken"] = str(offset + self.page_size)
+        else:
+            response["nextSyncToken"] = str(len(self.log))
+        return response
+
+
+@pytest.fixture
+def api() -> FakeEventsApi:
+    api = FakeEventsApi()
+    api.put(timed_event("1", "Dentist", "2024-01-01T09:00:00+00:00", "2024-01-01T10:00:00+00:00"))
+    api.put(timed_event("2", "Lunch", "2024-01-01T12:00:00+00:00", "2024-01-01T13:00:00+00:00"))
+    api.put(timed_event("3", "Next week", "2024-01-08T12:00:00+00:00", "2024-01-08T13:00:00+00:00"))
+    return api
+
+@pytest.fixture
+def gcal(api, monkeypatch) -> GCal:
+    monkeypatch.setattr(GCal, "calendar", property(lambda _: SimpleNamespace(service=api)))
+    monkeypatch.setattr(GCal, "load_service_user_credentials", staticmethod(lambda _: None))
+    monkeypatch.setattr("server.calendar_plugins.gcal.Path.exists", lambda _: True)
+    return GCal("creds.json", incremental_sync=True)
+
+DATE_FROM = datetime.fromisoformat("2024-01-01T00:00:00+00:00")
+DATE_TO = datetime.fromisoformat("2024-01-03T00:00:00+00:00")
+
+def summaries(gcal: GCal) -> list[str]:
+    return [a.summary for a in gcal.query_events_api("cal", DATE_FROM, DATE_TO)]
+
+def test_first_query_is_a_full_sync(gcal, api):
+    assert summaries(gcal) == ["Dentist", "Lunch"]
+
+    assert "syncToken" not in api.requests[0]
+    assert "timeMin" in api.requests[0]
+    assert "timeMax" in api.requests[0]
+    assert len(api.requests) == 1  # "Next week" is outside the window, so it's never downloaded
+
+def test_later_queries_only_fetch_changes(gcal, api):
+    summaries(gcal)
+    api.requests.clear()
+
+    api.put(timed_event("2", "Late lunch", "2024-01-01T14:00:00+00:00", "2024-01-01T15:00:00+00:00"))
+    api.cancel("1")
+    api.put(timed_event("4", "Dinner", "2024-01-02T19:00:00+00:00", "2024-01-02T20:00:00+00:00"))
+
+    assert summaries(gcal) == ["Late lunch", "Dinner"]
+    assert all("syncToken" in r for r in api.requests)
+    assert sum(len(api._execute(r)["items"]) for r in api.requests) == 3  # noqa: SLF001
+
+def test_changes_outside_the_window_are_not_kept(gcal, api):
+    summaries(gcal)
+    api.put(timed_event("5", "Next month", "2024-02-01T12:00:00+00:00", "2024-02-01T13:00:00+00:00"))
+    api.put(timed_event("2", "Moved lunch", "2024-01-09T12:00:00+00:00", "2024-01-09T13:00:00+00:00"))
+
+    assert summaries(gcal) == ["Dentist"]
+    assert set(gcal._stores["cal"].events) == {"1"}  # noqa: SLF001
+
+def test_moving_window_does_a_full_sync(gcal, api):
+    summaries(gcal)
+    api.requests.clear()
+
+    events = gcal.query_events_api("cal", DATE_FROM + timedelta(days=7), DATE_TO + timedelta(days=7))
+
+    assert [a.summary for a in events] == ["Next week"]
+    assert "syncToken" not in api.requests[0]
+
+def test_unchanged_calendar_fetches_nothing(gcal, api):
+    summaries(gcal)
+    api.requests.clear()
+
+    assert summaries(gcal) == ["Dentist", "Lunch"]
+    assert len(api.requests) == 1
+    assert api._execute(api.requests[0])["items"] == []  # noqa: SLF001
+
+def test_expired_sync_token_falls_back_to_full_sync(gcal, api):
+    summaries(gcal)
+    api.expired_tokens.add(str(len(api.log)))
+    api.cancel("2")
+    api.requests.clear()
+
+    assert summaries(gcal) == ["Dentist"]
+    assert "syncToken" in api.requests[0]
+    assert "syncToken" not in api.requests[1]
+
+def test_store_apply_and_window():
+    store = EventStore()
+    store.apply([
+        timed_event("b", "Second", "2024-01-01T12:00:00+00:00", "2024-01-01T13:00:00+00:00"),
+        timed_event("a", "First", "2024-01-01T09:00:00+00:00", "2024-01-01T10:00:00+00:00"),
+        timed_event("c", "Outside", "2024-01-05T09:00:00+00:00", "2024-01-05T10:00:00+00:00"),
+    ])
+    store.apply([{"id": "b", "status": "cancelled"}, {"id": "unknown", "status": "cancelled"}])
+
+    assert [e.summary for e in store.events_between(DATE_FROM, DATE_TO)] == ["First"]
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from server.app import AppServer
+from server.config import DataCacheConfig
+from server.metrics import CACHE_LOOKUPS, FETCH_SECONDS, STAGE_SECONDS, MetricsRegistry
+from server.providers import CachedProvider, Provider
+
+NOW = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+
+
+def test_histogram_buckets_are_cumulative():
+    h = MetricsRegistry().histogram("t_seconds", "Test", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5):
+        h.labels(stage="a").observe(value)
+
+    child = h.labels(stage="a")
+    assert child.cumulative() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert child.count == 4
+    assert child.sum == 5.65
+
+def test_exposition_format():
+    registry = MetricsRegistry()
+    h = registry.histogram("t_seconds", "Time taken", ("stage",), buckets=(0.5,))
+    c = registry.counter("t_total", "Things counted", ("cache", "result"))
+    h.labels(stage="draw").observe(0.25)
+    c.labels(cache='say "hi"', result="hit").inc(2)
+
+    assert registry.expose() == "\n".join([  # noqa: FLY002
+        "# HELP t_seconds Time taken",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{stage="draw",le="0.5"} 1',
+        't_seconds_bucket{stage="draw",le="+Inf"} 1',
+        't_seconds_sum{stage="draw"} 0.25',
+        't_seconds_count{stage="draw"} 1',
+        "# HELP t_total Things counted",
+        "# TYPE t_total counter",
+        't_total{cache="say \\"hi\\"",result="hit"} 2',
+    ]) + "\n"
+
+def test_timer_observes_even_on_error():
+    h = MetricsRegistry().histogram("t_seconds", "Test")
+    err = "failed"
+    with pytest.raises(ValueError, match=err), h.labels().time():
+        raise ValueError(err)
+
+    assert h.labels().count == 1
+
+
+class Weather(Provider[str]):
+    name = "metrics_test"
+
+    @classmethod
+    def from_config(cls, _config):
+        return None
+
+    async def fetch(self, _http, _current_date):
+        return "sunny"
+
+def test_cached_provider_records_lookups_and_fetches():
+    provider = CachedProvider(Weather(), DataCacheConfig(fresh_ttl=60, stale_ttl=300))
+    fetches = FETCH_SECONDS.labels(source="metrics_test")
+    before = fetches.count
+
+    async def fetch_twice():
+        await provider.fetch(None, NOW)
+        await provider.fetch(None, NOW)
+    asyncio.run(fetch_twice())
+
+    assert CACHE_LOOKUPS.labels(cache="metrics_test", result="miss").value == 1
+    assert CACHE_LOOKUPS.labels(cache="metrics_test", result="fresh").value == 1
+    assert fetches.count == before + 1
+
+def test_metrics_endpoint(make_config):
+    config = make_config(server={"refresh_interval": 0})
+    server = AppServer(config)
+    server.providers = []
+    api = FastAPI()
+    api.include_router(server.router)
+    draws = STAGE_SECONDS.labels(stage="draw").count
+
+    with TestClient(api) as client:
+        assert client.get("/dashboard").status_code == 200
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert STAGE_SECONDS.labels(stage="draw").count == draws + 1
+    for stage in ("select", "layout", "draw", "rotate", "encode"):
+        assert f'dashboard_stage_seconds_count{{stage="{stage}"}}' in response.text
+    assert 'dashboard_cache_lookups_total{cache="render",result="miss"}' in response.text
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import traceback
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from pydantic import SecretStr
+
+from server.config import WeatherConfig
+from server.owm import (
+    DAY_ICONS,
+    EXCLUDE,
+    UNKNOWN_ICON,
+    WEATHER_ICONS,
+    OWMModule,
+    Weather,
+    WeatherFetchError,
+    weather_icon,
+)
+from server.providers import CachedProvider, OpenWeatherMapProvider
+
+LONDON = (51.5072, -0.1276)
+PARIS = (48.8566, 2.3522)
+
+
+def owm_response(condition_id: int = 803, icon: str = "04n", temp: float = 10.93) -> dict:
+    return {
+        "lat": 51.5072,
+        "current": {"temp": temp, "weather": [{"id": condition_id, "description": "broken clouds", "icon": icon}]},
+    }
+
+
+class FakeOWM:
+    def __init__(self):
+        self.requests: list[httpx.Request] = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return httpx.Response(200, json=owm_response())
+
+
+@pytest.fixture
+def api():
+    return FakeOWM()
+
+def get_weather(owm: OWMModule, api: FakeOWM, lat: float, lon: float) -> Weather:
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(api)) as http:
+            return await owm.get_weather(http, lat, lon)
+    return asyncio.run(get())
+
+def test_every_condition_has_a_glyph():
+    for condition_id in [*WEATHER_ICONS, *DAY_ICONS]:
+        assert weather_icon(condition_id) != UNKNOWN_ICON
+
+    assert weather_icon(800, is_day=True) == "\uf00d"
+    assert weather_icon(800, is_day=False) == "\uf02e"
+    assert weather_icon(999) == UNKNOWN_ICON
+
+def test_weather_from_owm():
+    weather = Weather.from_owm(owm_response())
+
+    assert weather == Weather(temperature=10.93, description="broken clouds", condition_id=803, is_day=False)
+    assert weather.text == "Broken clouds | 11º"
+
+def test_only_current_conditions_are_requested(api):
+    get_weather(OWMModule("key"), api, *LONDON)
+
+    params = api.requests[0].url.params
+    assert params["exclude"] == EXCLUDE
+    assert params["units"] == "metric"
+    assert (params["lat"], params["lon"]) == ("51.5072", "-0.1276")
+
+def test_api_called_once_per_ttl(api, tmp_path):
+    owm = OWMModule("key", cache_dir=tmp_path, ttl=3600)
+
+    first = get_weather(owm, api, *LONDON)
+    second = get_weather(OWMModule("key", cache_dir=tmp_path, ttl=3600), api, *LONDON)  # e.g. after a restart
+
+    assert first == second
+    assert len(api.requests) == 1
+
+def test_cache_is_per_location(api, tmp_path):
+    owm = OWMModule("key", cache_dir=tmp_path)
+
+    get_weather(owm, api, *LONDON)
+    get_weather(owm, api, *PARIS)
+
+    assert len(api.requests) == 2
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+def test_expired_cache_is_refreshed(api, tmp_path):
+    owm = OWMModule("key", cache_dir=tmp_path, ttl=3600)
+    get_weather(owm, api, *LONDON)
+
+    path = owm.cache_path(*LONDON)
+    cached = json.loads(path.read_text())
+    cached["fetched_at"] = (datetime.now(tz=timezone.utc) - timedelta(hours=2)).isoformat()
+    path.write_text(json.dumps(cached))
+
+    get_weather(owm, api, *LONDON)
+
+    assert len(api.requests) == 2
+
+@pytest.mark.parametrize("failure", [httpx.Response(503), httpx.ConnectError("down")])
+def test_api_key_is_kept_out_of_logs_and_errors(caplog, failure):
+    def handler(_request: httpx.Request) -> httpx.Response:
+        if isinstance(failure, Exception):
+            raise failure
+        return failure
+
+    config = WeatherConfig(latitude=1.0, longitude=2.0)
+    provider = CachedProvider(OpenWeatherMapProvider(config, SecretStr("secret-key")), config.cache)
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+            return await provider.fetch(http, None)
+
+    with caplog.at_level(logging.DEBUG), pytest.raises(WeatherFetchError) as e:
+        asyncio.run(fetch())
+
+    assert "secret-key" not in caplog.text
+    assert "secret-key" not in "".join(traceback.format_exception(e.type, e.value, e.tb))
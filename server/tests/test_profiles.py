@@ -0,0 +1,119 @@
+import io
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+from pydantic import ValidationError
+
+from server.activity import Activity
+from server.app import App, AppServer, DashboardData
+from server.providers import ActivityProvider
+from server.refresher import DashboardSnapshot
+from server.render import Renderer
+from server.snapshot import SnapshotStore
+
+
+class CountingTasks(ActivityProvider):
+    name = "tasks"
+
+    def __init__(self):
+        self.calls = 0
+
+    @classmethod
+    def from_config(cls, _config):
+        return None
+
+    async def fetch(self, _http, current_date):
+        self.calls += 1
+        return [Activity(activity_type="task", summary="Bins", date_start=current_date.date())]
+
+
+def test_profiles_inherit_the_main_image_settings(make_config):
+    config = make_config(image={"margin_x": 50}, profiles={"landscape": {"rotate_angle": 90, "columns": 2}})
+
+    landscape = config.profiles["landscape"]
+    assert (landscape.width, landscape.height, landscape.margin_x) == (600, 800, 50)
+    assert (landscape.rotate_angle, landscape.columns) == (90, 2)
+    assert config.image.rotate_angle == 0
+
+@pytest.mark.parametrize("name", ["changes", "two words", "../up"])
+def test_profile_names_must_be_url_and_file_safe(make_config, name):
+    with pytest.raises(ValidationError, match="Invalid profile name"):
+        make_config(profiles={name: {}})
+
+def test_profiles_are_rendered_from_one_fetch(make_config):
+    config = make_config(profiles={"k4": {"rotate_angle": 90}, "small": {"width": 300, "height": 400}})
+    server = AppServer(config)
+    tasks = CountingTasks()
+    server.providers = [tasks]
+    api = FastAPI()
+    api.include_router(server.router)
+
+    with TestClient(api) as client:
+        main = client.get("/dashboard")
+        k4 = client.get("/dashboard/k4")
+        small = client.get("/dashboard/small")
+        missing = client.get("/dashboard/missing")
+        changes = client.get("/dashboard/changes")
+
+    assert tasks.calls == 1
+    assert Image.open(io.BytesIO(main.content)).size == (600, 800)
+    assert Image.open(io.BytesIO(k4.content)).size == (800, 600)
+    assert Image.open(io.BytesIO(small.content)).size == (300, 400)
+    assert len({main.headers["etag"], k4.headers["etag"], small.headers["etag"]}) == 3
+    assert missing.status_code == 404
+    assert changes.status_code == 200
+
+def test_profiles_render_on_request_without_refresher(make_config):
+    server = AppServer(make_config(server={"refresh_interval": 0}, profiles={"small": {"width": 300, "height": 400}}))
+    server.providers = [CountingTasks()]
+    api = FastAPI()
+    api.include_router(server.router)
+
+    with TestClient(api) as client:
+        small = client.get("/dashboard/small")
+        missing = client.get("/dashboard/missing")
+
+    assert Image.open(io.BytesIO(small.content)).size == (300, 400)
+    assert missing.status_code == 404
+
+def test_layout_settings_reach_the_renderer(make_config, monkeypatch):
+    renderers = []
+
+    class Spy(Renderer):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            renderers.append(self)
+    monkeypatch.setattr("server.app.Renderer", Spy)
+
+    app = App(make_config(
+        image={"margin_x": 40, "margin_y": 60},
+        profiles={"k4": {"top_row_y": 180, "space_between_sections": 70}},
+    ))
+    data = DashboardData(events={}, current_date=datetime(2024, 1, 1, 9, tzinfo=timezone.utc))
+    app.generate_image(data)
+    app.generate_image(data, profile="k4")
+
+    main, k4 = ((r.margin_x, r.margin_y, r.top_row_y, r.space_between_sections) for r in renderers)
+    assert main == (40, 60, 250, 100)
+    assert k4 == (40, 60, 180, 70)
+
+def test_profile_framebuffer_must_fit_the_profile(make_config):
+    config = make_config(profiles={"k4": {"encoding": {"framebuffer": "PW3"}}})
+
+    with pytest.raises(ValueError, match="doesn't fit the PW3's"):
+        AppServer(config)
+
+def test_snapshots_are_kept_per_profile(tmp_path):
+    store = SnapshotStore(tmp_path)
+    main = DashboardSnapshot(image=b"main", digest="a", rendered_at="2024-01-01T09:00:00Z")
+    k4 = DashboardSnapshot(image=b"k4", digest="b", rendered_at="2024-01-01T09:00:00Z")
+
+    store.save_image(main)
+    store.save_image(k4, profile="k4")
+
+    assert store.load_image() == main
+    assert store.load_image("k4") == k4
+    assert store.load_image("other") is None
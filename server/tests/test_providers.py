@@ -0,0 +1,325 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import httpx
+import pytest
+from pydantic import SecretStr
+
+from server.activity import Activity
+from server.app import App, DashboardData
+from server.config import DataCacheConfig
+from server.providers import (
+    ActivityProvider,
+    CachedProvider,
+    GoogleCalendarProvider,
+    OpenWeatherMapProvider,
+    Provider,
+    TodoistProvider,
+    build_providers,
+    fetch_all,
+)
+from server.render import Renderer
+
+NOW = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+
+
+
+class FakeActivities(ActivityProvider):
+    def __init__(self, name: str, summaries: list[str]):
+        self.name = name
+        self.summaries = summaries
+
+    @classmethod
+    def from_config(cls, _config):
+        return None
+
+    async def fetch(self, _http, current_date):
+        return [
+            Activity(activity_type="task", summary=s, date_start=current_date.date()) for s in self.summaries
+        ]
+
+
+class Handshake(Provider[str]):
+    """Only finishes once its partner has started: fetched one after the other, they'd wait forever"""
+
+    def __init__(self, name: str, mine: asyncio.Event, partners: asyncio.Event):
+        self.name = name
+        self.mine = mine
+        self.partners = partners
+
+    @classmethod
+    def from_config(cls, _config):
+        return None
+
+    async def fetch(self, _http, _current_date):
+        self.mine.set()
+        await asyncio.wait_for(self.partners.wait(), timeout=2)
+        return self.name
+
+def test_only_configured_providers_are_built(make_config):
+    assert build_providers(make_config(calendar=None)) == []
+
+    providers = build_providers(make_config(
+        api_keys={"todoist": SecretStr("t")},
+        tasks={"project_id": 1},
+        weather={"latitude": 51.5, "longitude": 0},  # no OWM key
+    ))
+    assert all(isinstance(p, CachedProvider) for p in providers)
+    assert [type(p.provider) for p in providers] == [GoogleCalendarProvider, TodoistProvider]
+
+def test_fetch_all_fetches_concurrently():
+    async def fetch():
+        a, b = asyncio.Event(), asyncio.Event()
+        return await fetch_all([Handshake("a", a, b), Handshake("b", b, a)], None, NOW)
+
+    assert asyncio.run(fetch()) == {"a": "a", "b": "b"}
+
+def test_weather_uses_shared_client(make_config):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        current = {"temp": 5.2, "weather": [{"id": 800, "description": "clear sky", "icon": "01d"}]}
+        return httpx.Response(200, json={"current": current})
+
+    config = make_config(
+        api_keys={"owm_api_key": SecretStr("k")}, calendar=None, weather={"latitude": 51.5, "longitude": -0.1}
+    )
+    (provider,) = build_providers(config)
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+            return await provider.fetch(http, NOW)
+
+    assert isinstance(provider.provider, OpenWeatherMapProvider)
+    assert asyncio.run(fetch()).text == "Clear sky | 5º"
+    assert requests[0].url.params["lat"] == "51.5"
+    assert requests[0].url.params["appid"] == "k"
+
+def test_app_combines_activity_providers(make_config):
+    app = App(make_config())
+    app.providers = [FakeActivities("calendar", ["Dentist"]), FakeActivities("tasks", ["Bins", "Shopping"])]
+
+    async def get():
+        async with app:
+            return await app.get_dashboard_data()
+
+    data = asyncio.run(get())
+
+    assert data.current_date.date() == datetime.now(ZoneInfo("Europe/London")).date()
+    assert sorted(a.summary for a in data.events[0]) == ["Bins", "Dentist", "Shopping"]
+    assert data.stale_sources == {}
+
+def test_failing_required_provider_fails_the_fetch():
+    class Broken(FakeActivities):
+        async def fetch(self, _http, _current_date):
+            raise ConnectionError
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(fetch_all([FakeActivities("calendar", []), Broken("tasks", [])], None, NOW))
+
+def test_dashboard_is_rendered_without_failing_weather(make_config):
+    config = make_config(api_keys={"owm_api_key": SecretStr("k")}, weather={"latitude": 51.5, "longitude": -0.1})
+    app = App(config)
+    weather = next(p for p in build_providers(config) if p.kind == "weather")
+    app.providers = [FakeActivities("calendar", ["Dentist"]), weather]
+
+    async def render():
+        app._http = httpx.AsyncClient(transport=httpx.MockTransport(lambda _: httpx.Response(503)))  # noqa: SLF001
+        async with app:
+            return await app.get_dashboard_data(), await app.render_dashboard()
+
+    data, rendered = asyncio.run(render())
+
+    assert data.weather is None
+    assert [a.summary for a in data.events[0]] == ["Dentist"]
+    assert rendered.image
+
+
+class Upstream(Provider[int]):
+    """Counts its fetches, and can be made to fail or hang"""
+
+    name = "upstream"
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+        self.hang = False
+
+    @classmethod
+    def from_config(cls, _config):
+        return None
+
+    async def fetch(self, _http, _current_date):
+        self.calls += 1
+        if self.hang:
+            await asyncio.sleep(10)
+        if self.fail:
+            raise ConnectionError
+        return self.calls
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+@pytest.fixture
+def cached(upstream):
+    return CachedProvider(upstream, DataCacheConfig(fresh_ttl=60, stale_ttl=300, fetch_timeout=0.05))
+
+def age_by(cached: CachedProvider, seconds: float):
+    cached._fetched_at -= seconds  # noqa: SLF001
+
+def test_fresh_data_is_reused(cached, upstream):
+    async def fetch_twice():
+        return await cached.fetch(None, NOW), await cached.fetch(None, NOW)
+
+    assert asyncio.run(fetch_twice()) == (1, 1)
+    assert upstream.calls == 1
+
+def test_stale_data_is_served_while_updating(cached):
+    async def run():
+        await cached.fetch(None, NOW)
+        age_by(cached, 120)
+        stale = await cached.fetch(None, NOW)
+        await asyncio.sleep(0)  # let the background update finish
+        return stale, await cached.fetch(None, NOW)
+
+    assert asyncio.run(run()) == (1, 2)
+    assert cached.stale_since() is None
+
+def test_expired_data_waits_for_update(cached):
+    async def run():
+        await cached.fetch(None, NOW)
+        age_by(cached, 600)
+        return await cached.fetch(None, NOW)
+
+    assert asyncio.run(run()) == 2
+
+def test_failed_update_falls_back_to_last_good(cached, upstream):
+    async def run():
+        await cached.fetch(None, NOW)
+        age_by(cached, 600)
+        upstream.fail = True
+        fallback = await cached.fetch(None, NOW)
+        stale_since = cached.stale_since()
+
+        upstream.fail = False
+        return fallback, stale_since, await cached.fetch(None, NOW)
+
+    fallback, stale_since, recovered = asyncio.run(run())
+
+    assert fallback == 1
+    assert stale_since is not None
+    assert recovered == 3
+    assert cached.stale_since() is None
+
+def test_slow_update_falls_back_after_timeout(cached, upstream):
+    async def run():
+        await cached.fetch(None, NOW)
+        age_by(cached, 600)
+        upstream.hang = True
+        result = await asyncio.wait_for(cached.fetch(None, NOW), timeout=1)
+        await cached.aclose()
+        return result
+
+    assert asyncio.run(run()) == 1
+    assert cached.stale_since() is not None
+
+def test_failed_background_update_marks_data_stale(cached, upstream):
+    async def run():
+        await cached.fetch(None, NOW)
+        age_by(cached, 120)
+        upstream.fail = True
+        await cached.fetch(None, NOW)
+        await asyncio.sleep(0)  # let the background update fail
+        stale_since = cached.stale_since()
+
+        upstream.fail = False
+        await cached.fetch(None, NOW)
+        await asyncio.sleep(0)
+        return stale_since
+
+    assert asyncio.run(run()) is not None
+    assert cached.stale_since() is None
+
+class FakeGCal:
+    def __init__(self):
+        self.calls = 0
+        self.last_fetch_errors = {}
+
+    def get_events(self, **_kwargs):
+        self.calls += 1
+        return []
+
+def test_partial_calendar_failure_is_reported(make_config):
+    provider = GoogleCalendarProvider(make_config().calendar)
+    provider._gcal = gcal = FakeGCal()  # noqa: SLF001
+    cached = CachedProvider(provider, DataCacheConfig(fresh_ttl=60, stale_ttl=300))
+
+    async def run():
+        gcal.last_fetch_errors = {"work": ConnectionError()}
+        await cached.fetch(None, NOW)
+        stale_since = cached.stale_since()
+
+        gcal.last_fetch_errors = {}
+        await cached.fetch(None, NOW)  # incomplete data isn't fresh, so this updates it
+        await asyncio.sleep(0.1)
+        return stale_since
+
+    assert asyncio.run(run()) is not None
+    assert gcal.calls == 2
+    assert cached.stale_since() is None
+
+def test_nothing_cached_raises(cached, upstream):
+    upstream.fail = True
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(cached.fetch(None, NOW))
+
+def test_app_reports_stale_sources(cached, upstream, make_config):
+    app = App(make_config())
+    app.providers = [cached]
+
+    async def run():
+        await cached.fetch(None, NOW)
+        age_by(cached, 600)
+        upstream.fail = True
+        async with app:
+            return await app.get_dashboard_data()
+
+    assert list(asyncio.run(run()).stale_sources) == ["upstream"]
+
+def test_unchanged_layout_isnt_redrawn(monkeypatch, make_config):
+    app = App(make_config())
+    draws = []
+    draw = Renderer.draw
+    monkeypatch.setattr(
+        Renderer, "draw", lambda self, plan, content=None: draws.append(plan) or draw(self, plan, content)
+    )
+
+    when = datetime(2024, 1, 1, 10, tzinfo=ZoneInfo("Europe/London"))
+    today = [Activity(activity_type="task", summary="Bins", date_start=when.date())]
+    first = app.generate_image(DashboardData(events={0: today, 1: []}, current_date=when))
+    second = app.generate_image(DashboardData(events={0: list(today), 1: []}, current_date=when))
+
+    assert len(draws) == 1
+    assert second.etag == first.etag
+
+def test_only_the_footer_is_redrawn_when_just_the_time_changes(monkeypatch, make_config):
+    app = App(make_config())
+    contents = []
+    draw = Renderer.draw
+    monkeypatch.setattr(
+        Renderer, "draw", lambda self, plan, content=None: contents.append(content) or draw(self, plan, content)
+    )
+
+    when = datetime(2024, 1, 1, 10, tzinfo=ZoneInfo("Europe/London"))
+    today = [Activity(activity_type="task", summary="Bins", date_start=when.date())]
+    first = app.generate_image(DashboardData(events={0: today, 1: []}, current_date=when))
+    later = app.generate_image(DashboardData(events={0: today, 1: []}, current_date=when + timedelta(minutes=5)))
+
+    assert contents[0] is None
+    assert contents[1] is not None
+    assert later.etag == first.etag  # only the "Refreshed" time differs
+    assert later.image != first.image
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from server.refresher import DashboardRefresher, header_safe
+from server.render import RenderedImage
+
+
+class FlakyRender:
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    async def __call__(self) -> RenderedImage:
+        self.calls += 1
+        if self.fail:
+            err = "upstream is down"
+            raise ConnectionError(err)
+        return RenderedImage(image=f"image {self.calls}".encode(), digest=str(self.calls))
+
+def test_get_renders_once_then_serves_from_memory():
+    render = FlakyRender()
+    r = DashboardRefresher(render, interval=60)
+
+    assert asyncio.run(r.get()).image == b"image 1"
+    assert asyncio.run(r.get()).image == b"image 1"
+    assert render.calls == 1
+
+def test_concurrent_gets_share_first_render():
+    render = FlakyRender()
+    r = DashboardRefresher(render, interval=60)
+
+    async def get_twice():
+        return await asyncio.gather(r.get(), r.get())
+
+    first, second = asyncio.run(get_twice())
+
+    assert first.image == second.image == b"image 1"
+    assert render.calls == 1
+
+def test_failed_refresh_keeps_previous_image():
+    render = FlakyRender()
+    r = DashboardRefresher(render, interval=60)
+    asyncio.run(r.refresh())
+
+    render.fail = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(r.refresh())
+
+    assert asyncio.run(r.get()).image == b"image 1"
+
+    headers = r.headers()
+    assert headers["X-Dashboard-Refresh-Failures"] == "1"
+    assert headers["X-Dashboard-Refresh-Error"] == "ConnectionError: upstream is down"
+    assert "X-Dashboard-Age" in headers
+
+def test_successful_refresh_clears_failures():
+    render = FlakyRender()
+    r = DashboardRefresher(render, interval=60)
+
+    render.fail = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(r.refresh())
+
+    render.fail = False
+    asyncio.run(r.refresh())
+
+    assert "X-Dashboard-Refresh-Failures" not in r.headers()
+
+def test_background_task_refreshes():
+    render = FlakyRender()
+    r = DashboardRefresher(render, interval=0.01)
+
+    async def run_briefly():
+        r.start()
+        for _ in range(500):
+            if render.calls >= 2:
+                break
+            await asyncio.sleep(0.01)
+        await r.stop()
+
+    asyncio.run(run_briefly())
+
+    assert render.calls >= 2
+    assert r.snapshot is not None
+
+def test_header_safe():
+    assert header_safe("first line\nsecond line") == "first line"
+    assert header_safe("naïve \u2013 dash") == "naïve ? dash"
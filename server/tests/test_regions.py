@@ -0,0 +1,71 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from server.app import App
+from server.regions import RegionTracker, changed_regions, format_regions
+from server.render import RenderedImage
+
+
+def blank() -> np.ndarray:
+    return np.full((100, 80), 255, dtype=np.uint8)
+
+def as_rendered(pixels: np.ndarray) -> RenderedImage:
+    with io.BytesIO() as output:
+        Image.fromarray(pixels).save(output, format="PNG")
+        return RenderedImage(image=output.getvalue(), digest="x")
+
+def test_no_changes():
+    assert changed_regions(blank(), blank()) == []
+
+def test_single_region():
+    after = blank()
+    after[10:20, 5:15] = 0
+
+    assert changed_regions(blank(), after) == [(5, 10, 15, 20)]
+
+def test_separate_bands():
+    after = blank()
+    after[10:20, 5:15] = 0
+    after[60:70, 30:40] = 0
+
+    assert changed_regions(blank(), after) == [(5, 10, 15, 20), (30, 60, 40, 70)]
+
+def test_close_bands_are_merged():
+    after = blank()
+    after[10:20, 5:15] = 0
+    after[22:25, 30:40] = 0
+
+    assert changed_regions(blank(), after, max_gap=8) == [(5, 10, 40, 25)]
+
+def test_too_many_regions_become_one():
+    after = blank()
+    after[::20, 10] = 0
+
+    assert changed_regions(blank(), after, max_gap=0, max_regions=2) == [(10, 0, 11, 81)]
+
+def test_format_regions():
+    assert format_regions(None) == "full"
+    assert format_regions([]) == ""
+    assert format_regions([(1, 2, 3, 4), (5, 6, 7, 8)]) == "1,2,3,4;5,6,7,8"
+
+def test_tracker_per_device():
+    after = blank()
+    after[10:20, 5:15] = 0
+    tracker = RegionTracker()
+
+    assert tracker.update("kitchen", as_rendered(blank())) is None
+    assert tracker.update("kitchen", as_rendered(after)) == [(5, 10, 15, 20)]
+    assert tracker.update("kitchen", as_rendered(after)) == []
+    assert tracker.update("hallway", as_rendered(after)) is None
+
+def test_tracker_size_change_needs_full_refresh():
+    tracker = RegionTracker()
+    tracker.update("kitchen", as_rendered(blank()))
+
+    assert tracker.update("kitchen", as_rendered(np.zeros((10, 10), dtype=np.uint8))) is None
+
+def test_tracking_is_opt_in(make_config):
+    assert App(make_config()).regions is None
+    assert App(make_config(server={"changed_regions": True})).regions is not None
@@ -0,0 +1,198 @@
+from datetime import date, datetime, time, timezone
+
+import pytest
+
+from server.activity import Activity
+from server.layout import LayoutPlan, LineItem, TextItem, column_bounds
+from server.render import Font, FontFactory, Renderer, load_font, rotate
+
+TEN_AM = datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+
+def test_font_factory_shares_fonts_between_instances():
+    ff1 = FontFactory()
+    ff2 = FontFactory()
+
+    assert ff1.get("Lexend-Regular.ttf", 30) is ff2.get("Lexend-Regular.ttf", 30)
+    assert ff1.get("Lexend-Regular.ttf", 30) is not ff1.get("Lexend-Regular.ttf", 31)
+
+def test_renderers_share_fonts():
+    r1 = Renderer(image_width=100, image_height=100)
+    r2 = Renderer(image_width=200, image_height=200)
+
+    assert r1._ff.get("regular") is r2._ff.get("regular")  # noqa: SLF001
+
+def test_load_font_caches_by_file_and_size():
+    ff = FontFactory()
+    load_font.cache_clear()
+
+    ff.get("Lexend-Bold.ttf", 20)
+    ff.get("Lexend-Bold.ttf", 20)
+
+    info = load_font.cache_info()
+    assert info.misses == 1
+    assert info.hits == 1
+
+def truncate_by_binary_search(text: str, max_width: int, font: Font) -> str:
+    """The original implementation, which the measurement cache must match exactly."""
+    if font.image_font().getbbox(text)[2] <= max_width:
+        return text
+
+    left = 0
+    right = len(text) - 1
+    while left <= right:
+        mid = (left + right) // 2
+        if font.image_font().getbbox(text[:mid] + "...")[2] <= max_width:
+            left = mid + 1
+        else:
+            right = mid - 1
+
+    return text[: left - 1] + "..."
+
+@pytest.mark.parametrize("text", [
+    "",
+    "Short",
+    "A fairly long event summary which will need truncating somewhere",
+    "Wäschè & Tëst \u2013 ünïcödé 日本語 summary that keeps going and going",
+    "AVAVAVAVAVAVAVAVAVAVAVAVAVAVAVAVAVAV",
+    "iiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiii",
+])
+@pytest.mark.parametrize("max_width", [-5, 0, 20, 100, 333, 800])
+def test_truncate_matches_binary_search(text, max_width):
+    font = FontFactory().get("Lexend-Regular.ttf")
+
+    expected = truncate_by_binary_search(text, max_width, font)
+    assert Renderer.truncate_with_ellipsis(text, max_width, font) == expected
+
+def render_at(hour: int, minute: int) -> Renderer:
+    r = Renderer(image_width=300, image_height=400, margin_y=50)
+    r.render_all(todays_date=TEN_AM.replace(hour=hour, minute=minute), events_today=[], events_tomorrow=[])
+    return r
+
+def test_content_digest_ignores_last_updated_time():
+    r1 = render_at(10, 0)
+    r2 = render_at(10, 1)
+
+    assert r1.get_png() != r2.get_png()
+    assert r1.content_digest == r2.content_digest
+
+def test_stale_marker_is_part_of_content():
+    when = datetime(2024, 1, 1, 9, 15, tzinfo=timezone.utc)
+    fresh = Renderer(image_width=300, image_height=400, margin_y=50)
+    fresh.render_all(todays_date=when, events_today=[], events_tomorrow=[])
+    stale = Renderer(image_width=300, image_height=400, margin_y=50)
+    stale.render_all(todays_date=when, events_today=[], events_tomorrow=[], stale_sources={"tasks": when})
+
+    assert Renderer.stale_fields({"tasks": when}, when) == "Not updated: tasks (09:15)"
+    assert Renderer.stale_fields({}, when) is None
+    assert fresh.content_digest != stale.content_digest
+
+def activities(n: int) -> list[Activity]:
+    return [
+        Activity(activity_type="event", summary=f"Event {i}", date_start=date(2024, 1, 1), time_start=time(9, i))
+        for i in range(n)
+    ]
+
+def bullets(plan: LayoutPlan) -> list[TextItem]:
+    return [i for i in plan.content if isinstance(i, TextItem) and i.text == "• "]
+
+def test_layout_doesnt_draw():
+    r = Renderer(image_width=300, image_height=400, margin_y=50)
+    plan = r.layout(todays_date=TEN_AM, events_today=activities(2), events_tomorrow=[])
+
+    assert r._image is None  # noqa: SLF001
+    assert [i.text for i in plan.content if isinstance(i, TextItem) and i.colour == "gray" and i.anchor is None] == [
+        "9am ", "9.01am "
+    ]
+    assert [i.text for i in plan.footer] == ["Refreshed 10:00"]
+
+def test_equal_plans_have_equal_digests():
+    def plan(summary: str) -> LayoutPlan:
+        r = Renderer(image_width=300, image_height=400, margin_y=50)
+        today = [Activity(activity_type="task", summary=summary, date_start=date(2024, 1, 1))]
+        return r.layout(todays_date=TEN_AM, events_today=today, events_tomorrow=[])
+
+    assert plan("Bins").digest == plan("Bins").digest
+    assert plan("Bins").digest != plan("Recycling").digest
+    # Only what's drawn counts: these are both truncated to the same text
+    assert plan("A very long summary " * 10).digest == plan("A very long summary " * 11).digest
+
+def test_render_all_draws_the_layout():
+    when = TEN_AM
+    r1 = Renderer(image_width=300, image_height=400, margin_y=50)
+    r1.render_all(todays_date=when, events_today=activities(3), events_tomorrow=activities(1))
+    r2 = Renderer(image_width=300, image_height=400, margin_y=50)
+    r2.draw(r2.layout(todays_date=when, events_today=activities(3), events_tomorrow=activities(1)))
+
+    assert r1.get_png() == r2.get_png()
+    assert r1.content_digest == r2.content_digest
+
+def test_overflow_counts_every_activity_not_shown():
+    r = Renderer(image_width=600, image_height=800, margin_x=20, margin_y=100)
+    plan = r.layout(todays_date=TEN_AM, events_today=activities(30), events_tomorrow=activities(4))
+
+    assert plan.overflow == 34 - len(bullets(plan))
+    assert plan.overflow > 4
+    assert plan.content[-1].text == f"     + {plan.overflow} more..."
+
+def test_activities_flow_into_columns():
+    one = Renderer(image_width=600, image_height=800, margin_x=20, margin_y=100)
+    two = Renderer(image_width=600, image_height=800, margin_x=20, margin_y=100, columns=2, column_gap=20)
+    when = TEN_AM
+
+    plan_one = one.layout(todays_date=when, events_today=activities(30), events_tomorrow=activities(4))
+    plan_two = two.layout(todays_date=when, events_today=activities(30), events_tomorrow=activities(4))
+
+    assert plan_two.overflow < plan_one.overflow
+    assert len(bullets(plan_two)) + plan_two.overflow == 34
+    # The second column starts back at the top
+    first, second = ([b for b in bullets(plan_two) if b.x == x] for x in (20, 310))
+    assert len(first) > 0
+    assert len(second) > 0
+    assert min(b.y for b in second) < max(b.y for b in first)
+
+@pytest.mark.parametrize("columns", [2, 3])
+@pytest.mark.parametrize("today", range(0, 40, 3))
+def test_section_titles_fit_their_columns(columns, today):
+    r = Renderer(image_width=600, image_height=800, margin_x=20, margin_y=100, columns=columns, column_gap=20)
+    plan = r.layout(todays_date=TEN_AM, events_today=activities(today), events_tomorrow=activities(4))
+    bounds = column_bounds(20, 580, columns, 20)
+    title_height = r._ff.get("light").height()  # noqa: SLF001
+
+    titles = [i for i in plan.content if isinstance(i, TextItem) and i.font == "light"]
+    lines = [i for i in plan.content if isinstance(i, LineItem) and i.y0 == i.y1 and i.y0 in {t.y for t in titles}]
+    assert all(t.y + title_height <= 800 - 100 for t in titles)
+    assert all(any(left <= line.x0 < line.x1 <= right for left, right in bounds) for line in lines)
+
+@pytest.mark.parametrize("columns", [1, 2, 3])
+@pytest.mark.parametrize(("today", "tomorrow"), [(60, 0), (30, 30), (5, 60), (0, 0)])
+def test_activities_stay_above_the_bottom_margin(columns, today, tomorrow):
+    r = Renderer(image_width=1448, image_height=1072, margin_x=100, margin_y=100, top_row_y=250, columns=columns)
+    plan = r.plan_activities([("Today", activities(today)), ("Tomorrow", activities(tomorrow))], y=350)
+
+    def bottom(item) -> float:
+        if isinstance(item, LineItem):
+            return max(item.y0, item.y1)
+        height = r._ff.get(item.font, item.size).height()  # noqa: SLF001
+        return item.y + height / 2 if item.anchor == "mm" else item.y + height
+
+    assert max(bottom(i) for i in plan.content) <= 1072 - 100
+    assert len(bullets(plan)) + plan.overflow == today + tomorrow
+
+def test_column_bounds():
+    assert column_bounds(100, 972, 1, 50) == [(100, 972)]
+    assert column_bounds(0, 100, 2, 10) == [(0, 45), (55, 100)]
+
+@pytest.mark.parametrize("angle", [0, 90, 180, 270, -90, 450, 30])
+def test_rotate_matches_pil(angle):
+    image = render_at(10, 0).image
+
+    rotated = rotate(image, angle)
+
+    assert rotated.tobytes() == image.rotate(angle, expand=True).tobytes()
+    assert rotated.size == image.rotate(angle, expand=True).size
+
+def test_no_rotation_doesnt_copy():
+    image = render_at(10, 0).image
+
+    assert rotate(image, 0) is image
+    assert rotate(image, 360) is image
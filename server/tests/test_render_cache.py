@@ -0,0 +1,26 @@
+from datetime import date
+
+from server.render import RenderedImage
+from server.render_cache import RenderCache, render_key
+
+
+def rendered(n: int) -> RenderedImage:
+    return RenderedImage(image=f"image {n}".encode(), digest=str(n))
+
+def test_render_key_is_stable():
+    inputs = {"date": ["1", "Mon", "Jan", "10:00"], "today": [{"date_start": date(2024, 1, 1)}]}
+    reordered = {"today": [{"date_start": date(2024, 1, 1)}], "date": ["1", "Mon", "Jan", "10:00"]}
+
+    assert render_key(inputs) == render_key(reordered)
+    assert render_key(inputs) != render_key({**inputs, "date": ["1", "Mon", "Jan", "10:01"]})
+
+def test_lru_eviction():
+    cache = RenderCache(max_entries=2)
+    cache.put("a", rendered(1))
+    cache.put("b", rendered(2))
+    cache.get("a")  # now most recently used
+    cache.put("c", rendered(3))
+
+    assert cache.get("a") == rendered(1)
+    assert cache.get("b") is None
+    assert cache.get("c") == rendered(3)
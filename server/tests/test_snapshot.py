@@ -0,0 +1,130 @@
+import asyncio
+import gzip
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from server.activity import Activity
+from server.app import App, AppServer
+from server.config import DataCacheConfig
+from server.providers import ActivityProvider, CachedProvider
+from server.refresher import DashboardSnapshot
+from server.snapshot import SNAPSHOT_VERSION, SnapshotStore, SourceSnapshot
+
+FETCHED_AT = datetime(2024, 1, 1, 9, tzinfo=timezone.utc)
+ACTIVITIES = [Activity(activity_type="task", summary="Bins", date_start=date(2024, 1, 1))]
+
+
+class Tasks(ActivityProvider):
+    name = "tasks"
+
+    def __init__(self):
+        self.calls = 0
+
+    @classmethod
+    def from_config(cls, _config):
+        return None
+
+    async def fetch(self, _http, current_date):
+        self.calls += 1
+        return [Activity(activity_type="task", summary="Fetched", date_start=current_date.date())]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(tmp_path)
+
+def test_sources_round_trip(store):
+    store.save_sources({"tasks": SourceSnapshot(fetched_at=FETCHED_AT, value=[{"summary": "Bins"}])})
+
+    assert store.load_sources() == {"tasks": SourceSnapshot(fetched_at=FETCHED_AT, value=[{"summary": "Bins"}])}
+
+def test_unchanged_sources_are_not_rewritten(store):
+    sources = {"tasks": SourceSnapshot(fetched_at=FETCHED_AT, value=[])}
+
+    assert store.save_sources(sources)
+    assert not store.save_sources(sources)
+
+def test_refetched_sources_are_not_rewritten(store):
+    later = FETCHED_AT + timedelta(minutes=5)
+
+    assert store.save_sources({"tasks": SourceSnapshot(fetched_at=FETCHED_AT, value=[])})
+    assert not store.save_sources({"tasks": SourceSnapshot(fetched_at=later, value=[])})
+    assert store.save_sources({"tasks": SourceSnapshot(fetched_at=later, value=[{"summary": "Bins"}])})
+
+def test_unchanged_image_is_not_rewritten(store, tmp_path):
+    snapshot = DashboardSnapshot(image=b"png", digest="abc", encoding="png", rendered_at=FETCHED_AT)
+    store.save_image(snapshot)
+    later = snapshot.model_copy(update={"rendered_at": FETCHED_AT + timedelta(minutes=5)})
+
+    assert not store.save_image(later)
+    assert not SnapshotStore(tmp_path).save_image(later)  # after a restart too
+    assert store.save_image(later.model_copy(update={"digest": "def"}))
+    assert store.save_image(later, profile="k4")
+
+def test_other_versions_are_ignored(store, tmp_path):
+    sources = {"tasks": {"fetched_at": "2024-01-01T09:00:00Z", "value": []}}
+    payload = {"version": SNAPSHOT_VERSION + 1, "sources": sources}
+    (tmp_path / SnapshotStore.SOURCES_FILE).write_bytes(gzip.compress(json.dumps(payload).encode()))
+
+    assert store.load_sources() == {}
+
+def test_corrupt_files_are_ignored(store, tmp_path):
+    (tmp_path / SnapshotStore.SOURCES_FILE).write_bytes(b"not gzip")
+    (tmp_path / SnapshotStore.IMAGE_META_FILE).write_text("{")
+    (tmp_path / SnapshotStore.IMAGE_FILE).write_bytes(b"png")
+
+    assert store.load_sources() == {}
+    assert store.load_image() is None
+
+def test_image_round_trip(store, tmp_path):
+    snapshot = DashboardSnapshot(image=b"png", digest="abc", encoding="png", rendered_at=FETCHED_AT)
+    store.save_image(snapshot)
+
+    assert store.load_image() == snapshot
+    assert not list(tmp_path.glob(".*.tmp"))
+
+def test_restored_data_keeps_its_age():
+    cached = CachedProvider(Tasks(), DataCacheConfig(fresh_ttl=60, stale_ttl=300))
+    saved = [a.model_dump(mode="json") for a in ACTIVITIES]
+    cached.restore(datetime.now(tz=timezone.utc) - timedelta(seconds=120), saved)
+
+    assert 119 < cached.age() < 130
+    assert cached.export()[1] == saved
+
+def with_provider(app: App, provider: Tasks) -> App:
+    app.providers = [CachedProvider(provider, DataCacheConfig())]
+    app.restore_sources()
+    return app
+
+def test_app_restores_sources_after_restart(make_config):
+    first = Tasks()
+    app = with_provider(App(make_config(server={"snapshot": True})), first)
+
+    async def fetch(app):
+        async with app:
+            return await app.get_dashboard_data()
+
+    asyncio.run(fetch(app))
+
+    restarted = Tasks()
+    data = asyncio.run(fetch(with_provider(App(make_config(server={"snapshot": True})), restarted)))
+
+    assert first.calls == 1
+    assert restarted.calls == 0  # still fresh
+    assert [a.summary for a in data.events[0]] == ["Fetched"]
+
+def test_server_serves_saved_image_straight_away(tmp_path, make_config):
+    saved = DashboardSnapshot(image=b"png", digest="abc", encoding="png", rendered_at=FETCHED_AT)
+    SnapshotStore(tmp_path / "snapshot").save_image(saved)
+
+    server = AppServer(make_config(server={"snapshot": True, "refresh_interval": 300}))
+
+    assert asyncio.run(server.refresher.get()) == saved
+
+def test_snapshots_can_be_turned_off(tmp_path, make_config):
+    app = App(make_config(server={"snapshot": False}))
+
+    assert app.snapshots is None
+    assert not (tmp_path / "snapshot").exists()
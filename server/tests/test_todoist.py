@@ -0,0 +1,110 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+import httpx
+import pytest
+from pydantic import SecretStr
+
+from server.todoist import TodoistClient
+
+DATE_END = datetime(2024, 1, 3, tzinfo=timezone.utc)
+
+
+def make_task(task_id: str, content: str, due_date: str, assignee_id=None) -> dict:
+    return {
+        "assignee_id": assignee_id, "assigner_id": None, "comment_count": 0, "is_completed": False,
+        "content": content, "created_at": "2024-01-01T00:00:00Z", "creator_id": "1", "description": "",
+        "due": {"date": due_date, "is_recurring": False, "string": due_date}, "id": task_id, "labels": [],
+        "order": 1, "parent_id": None, "priority": 1, "project_id": "1", "section_id": None, "url": "",
+        "duration": None,
+    }
+
+
+class FakeApi:
+    """Todoist's REST API. With `concurrent`, each request waits until the other has started."""
+
+    def __init__(self):
+        self.collaborators = [{"id": "a", "email": "", "name": "Alice"}]
+        self.tasks = [make_task("1", "Bins", "2024-01-01", assignee_id="a"), make_task("2", "Later", "2024-02-01")]
+        self.calls = []
+        self.concurrent = True
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        assert request.headers["Authorization"] == "Bearer token"
+        if request.url.path == "/rest/v2/tasks":
+            assert request.url.params["project_id"] == "1"
+            call, body = "tasks", self.tasks
+        else:
+            assert request.url.path == "/rest/v2/projects/1/collaborators"
+            call, body = "collaborators", self.collaborators
+
+        self.calls.append(call)
+        if self.concurrent:
+            await asyncio.wait_for(self.both_started(), timeout=2)
+        return httpx.Response(200, json=body)
+
+    async def both_started(self):
+        while len(self.calls) % 2 == 1:
+            await asyncio.sleep(0)
+
+
+@pytest.fixture
+def api():
+    return FakeApi()
+
+@pytest.fixture
+def client():
+    return TodoistClient(SecretStr("token"), collaborator_ttl=3600)
+
+def get_tasks(client: TodoistClient, api: FakeApi):
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(api.handle)) as http:
+            return await client.get_tasks(http, project_id=1, date_end=DATE_END)
+
+    return asyncio.run(get())
+
+def test_first_fetch_queries_collaborators_and_tasks_concurrently(client, api):
+    # Each fake request waits for the other to start: this would time out if they ran one after the other
+    tasks = get_tasks(client, api)
+
+    assert [t.summary for t in tasks] == ["Bins [Alice]"]
+    assert sorted(api.calls) == ["collaborators", "tasks"]
+    assert type(tasks[0].date_start) is date
+
+def test_collaborators_are_cached(client, api):
+    get_tasks(client, api)
+    api.calls.clear()
+    api.concurrent = False
+
+    get_tasks(client, api)
+
+    assert api.calls == ["tasks"]
+
+def test_unknown_assignee_refreshes_collaborators(client, api):
+    get_tasks(client, api)
+    api.calls.clear()
+    api.concurrent = False
+    api.collaborators.append({"id": "b", "email": "", "name": "Bob"})
+    api.tasks.append(make_task("3", "Shopping", "2024-01-02", assignee_id="b"))
+
+    tasks = get_tasks(client, api)
+
+    assert [t.summary for t in tasks] == ["Bins [Alice]", "Shopping [Bob]"]
+    assert api.calls == ["tasks", "collaborators"]
+
+def test_collaborators_expire(client, api):
+    client.collaborator_ttl = 0
+    get_tasks(client, api)
+    api.calls.clear()
+
+    get_tasks(client, api)
+
+    assert sorted(api.calls) == ["collaborators", "tasks"]
+
+def test_failed_request_raises(client, api):
+    async def unavailable(_request):
+        return httpx.Response(503)
+    api.handle = unavailable
+
+    with pytest.raises(httpx.HTTPStatusError):
+        get_tasks(client, api)
@@ -0,0 +1,149 @@
+"""
+Incremental sync is tested against a local stand-in for Todoist's Sync API,
+which hands out sync tokens and only returns changes made since the token was issued.
+"""
+import asyncio
+import copy
+import json
+import threading
+from datetime import date, datetime, time, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from zoneinfo import ZoneInfo
+
+import httpx
+import pytest
+from pydantic import SecretStr
+
+from server.todoist import TodoistClient
+
+DATE_END = datetime(2024, 1, 3, tzinfo=timezone.utc)
+
+
+def item(item_id: str, content: str, due_date: str, project_id: str = "1", **fields) -> dict:
+    return {
+        "id": item_id, "project_id": project_id, "content": content, "description": "",
+        "due": {"date": due_date, "is_recurring": False, "string": due_date},
+        "responsible_uid": None, "checked": False, "is_deleted": False, **fields,
+    }
+
+
+class FakeSyncApi:
+    def __init__(self):
+        self.log: list[dict] = []  # items, in order of change
+        self.collaborators = [{"id": "a", "full_name": "Alice", "email": ""}]
+        self.requests: list[dict] = []
+        self.unavailable = False
+
+    def put(self, changed: dict) -> None:
+        self.log.append(copy.deepcopy(changed))
+
+    def respond(self, form: dict) -> dict:
+        self.requests.append(form)
+        token = form["sync_token"]
+        if token == "*":
+            latest = {i["id"]: i for i in self.log}
+            items = [i for i in latest.values() if not (i["checked"] or i["is_deleted"])]
+        else:
+            items = self.log[int(token):]
+        return {
+            "full_sync": token == "*",
+            "sync_token": str(len(self.log)),
+            "items": items,
+            "collaborators": self.collaborators if token == "*" else [],
+        }
+
+
+@pytest.fixture
+def api():
+    api = FakeSyncApi()
+    api.put(item("1", "Bins", "2024-01-01", responsible_uid="a"))
+    api.put(item("2", "Call", "2024-01-02T10:30:00"))
+    api.put(item("3", "Later", "2024-02-01"))
+    api.put(item("4", "Other project", "2024-01-01", project_id="2"))
+    return api
+
+@pytest.fixture
+def sync_url(api):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):  # noqa: N802
+            assert self.headers["Authorization"] == "Bearer token"
+            if api.unavailable:
+                self.send_error(503)
+                return
+            body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+            form = {k: v[0] for k, v in parse_qs(body).items()}
+            payload = json.dumps(api.respond(form)).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/sync"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def client(sync_url):
+    return TodoistClient(SecretStr("token"), incremental_sync=True, sync_url=sync_url)
+
+def get_tasks(client: TodoistClient, date_end: datetime = DATE_END):
+    async def get():
+        async with httpx.AsyncClient() as http:
+            return await client.get_tasks(http, project_id=1, date_end=date_end)
+
+    return asyncio.run(get())
+
+def test_first_sync_is_full(client, api):
+    tasks = get_tasks(client)
+
+    assert [(t.summary, t.time_start) for t in tasks] == [("Bins [Alice]", None), ("Call", time(10, 30))]
+    assert api.requests[0]["sync_token"] == "*"
+    assert json.loads(api.requests[0]["resource_types"]) == ["items", "collaborators"]
+
+def test_fixed_time_tasks_are_shown_in_the_display_timezone(client, api):
+    # A task due at a fixed time comes in UTC: 23:30 UTC is already the next day in Berlin
+    api.put(item("5", "Flight", "2024-01-02T23:30:00Z"))
+
+    tasks = get_tasks(client, datetime(2024, 1, 3, tzinfo=ZoneInfo("Europe/Berlin")))
+
+    flight = next(t for t in tasks if t.summary == "Flight")
+    assert (flight.date_start, flight.time_start) == (date(2024, 1, 3), time(0, 30))
+
+def test_later_syncs_apply_changes(client, api):
+    get_tasks(client)
+
+    api.put(item("1", "Bins", "2024-01-01", responsible_uid="a", checked=True))
+    api.put(item("2", "Call mum", "2024-01-02T11:00:00"))
+    api.put(item("3", "Later", "2024-02-01", is_deleted=True))
+    api.put(item("5", "New", "2024-01-02"))
+
+    tasks = get_tasks(client)
+
+    assert [t.summary for t in tasks] == ["Call mum", "New"]
+    assert api.requests[1]["sync_token"] == "4"
+    assert client._store.items.keys() == {"2", "4", "5"}  # noqa: SLF001
+
+def test_nothing_changed(client, api):
+    first = get_tasks(client)
+    second = get_tasks(client)
+
+    assert first == second
+    assert api.respond(api.requests[-1])["items"] == []
+
+def test_failed_sync_keeps_store(client, api):
+    get_tasks(client)
+    api.unavailable = True
+
+    with pytest.raises(httpx.HTTPStatusError):
+        get_tasks(client)
+
+    api.unavailable = False
+    assert [t.summary for t in get_tasks(client)] == ["Bins [Alice]", "Call"]